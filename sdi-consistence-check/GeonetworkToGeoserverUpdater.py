@@ -10,9 +10,10 @@ from geoserver.catalog import Catalog
 from owslib import iso
 from owslib import util
 
-from bypassSSLVerification import bypassSSLVerification
 from credentials import Credentials
 from inconsistency import Inconsistency
+from ratelimit import add_rate_limit_arguments, rate_limiter_from_args
+from transport import HttpTransport
 from utils import find_data_metadata, print_report
 
 
@@ -47,7 +48,7 @@ def update_resource(layer, resource, title, abstract, md_url_html, attribution,
     :param md_url_html: the metadata url for the HTML version
     :param attribution: the text describing the attribution for the resource
     :param dry_run: true does not modify anything, false for actually saving the resource
-    :return:
+    :return: the number of objects (resource, layer) saved, only the modified ones being saved.
     """
     # Updates the MD title
     upd_title = False
@@ -78,15 +79,22 @@ def update_resource(layer, resource, title, abstract, md_url_html, attribution,
             break
     if not has_md_html:
         mdlinks.append(("text/html", "ISO19115:2003", md_url_html))
+    resource_dirty = upd_title or upd_abstract or not has_md_html
+    layer_dirty = upd_attribution
     if not dry_run:
-        # to trigger an update of the MDs, I guess the array should be re-affected
-        # (so that the object is considered as dirty / update needed against the GS REST API)
-        resource.metadata_links = mdlinks
+        if not resource_dirty and not layer_dirty:
+            logger.debug("\"%s:%s\": layer / resource info up to date", resource.workspace.name, resource.name)
+            return 0
         catalog = resource.catalog
-        catalog.save(resource)
-        catalog.save(layer)
-        catalog.reload()
+        if resource_dirty:
+            # to trigger an update of the MDs, I guess the array should be re-affected
+            # (so that the object is considered as dirty / update needed against the GS REST API)
+            resource.metadata_links = mdlinks
+            catalog.save(resource)
+        if layer_dirty:
+            catalog.save(layer)
         logger.info("\"%s:%s\": layer / resource info updated\n", resource.workspace.name, resource.name)
+        return int(resource_dirty) + int(layer_dirty)
     else:
         logger.info("dry-run mode: not updating the resource for layer \"%s\"" % resource.title)
         if upd_title:
@@ -98,6 +106,7 @@ def update_resource(layer, resource, title, abstract, md_url_html, attribution,
         if not has_md_html:
             logger.info("\t- an HTML metadata URL should have been added")
         logger.info("\n")
+        return 0
 
 
 def guess_catalogue_endpoint(url, md_identifier):
@@ -131,8 +140,8 @@ def extract_attribution(md):
     return ""
 
 
-def gn_to_gs_fix(layer, resource, dry_run, credentials, no_ssl_check=False):
-    url, md = find_data_metadata(resource, credentials, no_ssl_check)
+def gn_to_gs_fix(layer, resource, dry_run, credentials, no_ssl_check=False, transport=None):
+    url, md = find_data_metadata(resource, credentials, no_ssl_check, transport=transport)
     md_title = md.identificationinfo[0].title if len(md.identificationinfo) > 0 else ""
     md_abstract = md.identificationinfo[0].abstract if len(md.identificationinfo) > 0 else ""
     md_url_html = guess_catalogue_endpoint(url, md.identifier)
@@ -141,7 +150,7 @@ def gn_to_gs_fix(layer, resource, dry_run, credentials, no_ssl_check=False):
         md_attribution = extract_attribution(md)
     except Exception as e:
         logger.debug("Unable to parse the metadata attribution: %s", str(e), exc_info=1)
-    update_resource(layer, resource, md_title, md_abstract, md_url_html, md_attribution, dry_run)
+    return update_resource(layer, resource, md_title, md_abstract, md_url_html, md_attribution, dry_run)
 
 
 def print_banner(args):
@@ -168,18 +177,23 @@ if __name__ == "__main__":
     parser.add_argument("--geoserver", help="the GeoServer to use.", required=True)
     parser.add_argument("--dry-run", help="Dry-run mode", action='store_true', default=False)
     parser.add_argument("--disable-ssl-verification", help="Disable certificate verification", action="store_true")
+    add_rate_limit_arguments(parser)
 
     args = parser.parse_args(sys.argv[1:])
     creds = Credentials(logger=logger)
 
-    if args.disable_ssl_verification:
-        bypassSSLVerification()
+    transport = HttpTransport(creds, disable_ssl=args.disable_ssl_verification,
+                              rate_limiter=rate_limiter_from_args(args, parser))
     # Disable FutureWarning from owslib
     warnings.simplefilter("ignore", category=FutureWarning)
 
     (user, password) = creds.getFromUrl(args.geoserver)
     gscatalog = Catalog(args.geoserver + "/rest/", username=user, password=password)
+    transport.configure(gscatalog.session)
     errors = []
+    # number of objects (resources and layers) checked and saved
+    checked = 0
+    saved = 0
     # Whole geoserver catalog
     if args.mode == "full":
         print_banner(args)
@@ -192,7 +206,9 @@ if __name__ == "__main__":
                 try:
                     layer = gscatalog.get_layer(res.workspace.name + ":" + res.name)
                     logger.debug("Inspecting layer : %s:%s" % (res.workspace.name, res.name))
-                    gn_to_gs_fix(layer, res, args.dry_run, creds, args.disable_ssl_verification)
+                    saved += gn_to_gs_fix(layer, res, args.dry_run, creds, args.disable_ssl_verification,
+                                          transport=transport)
+                    checked += 2
                 except Inconsistency as e:
                     logger.debug("Inconsistency found : %s" % e)
                     errors.append(e)
@@ -216,7 +232,9 @@ if __name__ == "__main__":
             for res in resources:
                 try:
                     layer = gscatalog.get_layer(res.workspace.name + ":" + res.name)
-                    gn_to_gs_fix(layer, res, args.dry_run, creds, args.disable_ssl_verification)
+                    saved += gn_to_gs_fix(layer, res, args.dry_run, creds, args.disable_ssl_verification,
+                                          transport=transport)
+                    checked += 2
                 except Inconsistency as e:
                     errors.append(e)
     # Single layer
@@ -257,8 +275,15 @@ if __name__ == "__main__":
             logger.debug("Resource \"%s\" found, processing ..." % resource_found.name)
             try:
                 layer = gscatalog.get_layer(resource_found.workspace.name + ":" + resource_found.name)
-                gn_to_gs_fix(layer, resource_found, args.dry_run, creds, args.disable_ssl_verification)
+                saved += gn_to_gs_fix(layer, resource_found, args.dry_run, creds, args.disable_ssl_verification,
+                                      transport=transport)
+                checked += 2
             except Inconsistency as e:
                 errors.append(e)
+    # the catalog is reloaded once, after all the updates
+    if saved > 0:
+        gscatalog.reload()
+    if not args.dry_run:
+        logger.info("\n%d GeoServer objects saved, %d saves of unchanged objects avoided", saved, checked - saved)
     print_report(logger, errors)
 
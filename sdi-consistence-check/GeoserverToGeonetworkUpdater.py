@@ -27,20 +27,23 @@ import sys
 import uuid
 import warnings
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from time import localtime
 from time import strftime
 
 from geoserver.catalog import Catalog
 from mako.template import Template
-from owslib.csw import CatalogueServiceWeb
+from owslib.fes import And
 from requests.exceptions import SSLError
 
 from GeonetworkToGeoserverUpdater import print_report
-from bypassSSLVerification import bypassSSLVerification
 from credentials import Credentials
+from cswpublisher import CSWPublisher
 from cswquerier import CSWQuerier
-from inconsistency import GsToGnUnableToCreateServiceMetadataInconsistency, Inconsistency, \
-    GsToGnUnableToUpdateServiceMetadataInconsistency
+from cswrecords import SlimRecord
+from inconsistency import Inconsistency
+from ratelimit import add_rate_limit_arguments, rate_limiter_from_args
+from transport import HttpTransport
 from utils import find_data_metadata, print_report, load_workspaces_mapping
 
 
@@ -82,32 +85,99 @@ def print_banner(args):
     logger.info("\n\n")
 
 
+def find_workspace_data_metadata(resources, credentials, no_ssl_check=False, transport=None, workers=1):
+    """
+    Retrieves and parses the data metadata of all the resources of a workspace, once.
+
+    :param resources: the gsconfig resources of the workspace
+    :param credentials: the Credentials object
+    :param no_ssl_check: boolean indicating if SSL certificate check should be deactivated
+    :param transport: the HttpTransport to issue the requests with
+    :param workers: the number of metadata fetched concurrently
+    :return: a list of tuples (resource, url, parsed metadata, inconsistency), in the order of
+    the resources, either the url and the metadata or the inconsistency being None.
+    """
+    def find(resource):
+        try:
+            md_url, md = find_data_metadata(resource, credentials, no_ssl_check, transport=transport)
+            return (resource, md_url, md, None)
+        except Inconsistency as e:
+            return (resource, None, None, e)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(find, resources))
+
+
 def workspace_service_url(gs_url, workspace, service):
     return "%s/%s/ows?service=%s" % (gs_url, workspace, service)
 
 
-def guess_related_service_metadata(gs_url, gn_url, workspace, service):
+class ServiceMetadataIndex:
     """
-    Retrieves the associated metadata from the same catalog (assuming it is a GeoNetwork)
-
-    :param md: the parsed metadata
-    :param gs_url: the GeoServer base URL
-    :param gn_url: the catalogue base URL
-    :param workspace: the workspace name
-    :param service: the targeted service (WMS or WFS)
-    :return the service metadata related to the service, if found
+    Class which fetches the (non-harvested) service metadata of a catalogue (assuming it is a
+    GeoNetwork) once per run, and indexes them by the URL of their first online resource. The
+    service metadata created or updated during the run are recorded in the index as well, so
+    that the next resources see them without querying the catalogue again.
     """
-    gn_cswurl = "%s/srv/eng/csw" % gn_url
-    csw_q = CSWQuerier(gn_cswurl)
-    mds = csw_q.get_all_records(constraints=[And([csw_q.is_service, csw_q.non_harvested])])
-    expected_service_url = workspace_service_url(gs_url, workspace, service)
-    for smd_uuid, smd in mds.items():
-        try:
-            if smd.distribution.online[0].url == expected_service_url:
-                return smd
-        except:
-            continue
-    return None
+    def __init__(self, gn_url, transport=None):
+        """
+        constructor, fetches the service metadata.
+
+        :param gn_url: the catalogue base URL
+        :param transport: the HttpTransport to issue the requests with
+        """
+        self._csw_q = CSWQuerier("%s/srv/eng/csw" % gn_url, transport=transport)
+        mds = self._csw_q.get_all_records(constraints=[And([self._csw_q.is_service, self._csw_q.non_harvested])])
+        self._by_url = {}
+        # the whole documents of the service metadata, only fetched when they have to be updated
+        self._documents = {}
+        for smd in mds.values():
+            if len(smd.uris) > 0 and smd.uris[0]["url"] is not None:
+                self._by_url.setdefault(smd.uris[0]["url"], smd)
+
+    def get(self, service_url):
+        """
+        :param service_url: the service URL (see workspace_service_url)
+        :return: the service metadata (SlimRecord) related to the service, None if not found.
+        """
+        return self._by_url.get(service_url)
+
+    def get_document(self, smd):
+        """
+        Gives the whole document of a service metadata, fetching it if needed.
+
+        :param smd: the service metadata
+        :return: the XML document.
+        """
+        if smd.identifier not in self._documents:
+            self._documents[smd.identifier] = self._csw_q.get_record_xml(smd.identifier)
+        return self._documents[smd.identifier]
+
+    def add(self, uuid, service_url, operateson, document):
+        """
+        Records a service metadata created during the run.
+
+        :param uuid: the identifier of the service metadata
+        :param service_url: the service URL
+        :param operateson: the identifiers of the data metadata it operates on
+        :param document: the XML document
+        """
+        smd = SlimRecord(uuid)
+        smd.uris.append({"protocol": None, "name": None, "description": None, "url": service_url})
+        smd.operateson = list(operateson)
+        self._by_url[service_url] = smd
+        self._documents[uuid] = document
+
+    def add_operates_on(self, smd, uuidref, document):
+        """
+        Records a data metadata linked to a service metadata during the run.
+
+        :param smd: the service metadata
+        :param uuidref: the identifier of the data metadata
+        :param document: the updated XML document of the service metadata
+        """
+        smd.operateson.append(uuidref)
+        self._documents[smd.identifier] = document
 
 
 def create_service_metadata_from_template(data, service_type):
@@ -136,44 +206,6 @@ def create_service_metadata_from_template(data, service_type):
     return Template(filename="template/service-metadata-%s.xml" % (service_type)).render(**data)
 
 
-def insert_metadata(gn_url, workspace, record, credentials=Credentials()):
-    """
-    Inserts a metadata in a catalogue, given its base URL.
-    :param gn_url: the base URL to the GeoNetwork.
-    :param workspace: the workspace name queried onto the GeoServer
-    :param record: the metadata as string to be inserted
-    :param credentials: the credentials object
-    :return: True if success, raises an exception otherwise.
-    """
-    try:
-        (username, password) = credentials.getFromUrl(gn_url)
-        csw = CatalogueServiceWeb(gn_url + "/srv/eng/csw-publication", username=username, password=password)
-        csw.transaction(ttype="insert", typename="gmd:MD_Metadata", record=record)
-        return True
-    except Exception as e:
-        logger.error(e)
-        raise GsToGnUnableToCreateServiceMetadataInconsistency(workspace, gn_url, e)
-
-
-def update_metadata(gn_url, uuid, record, credentials=Credentials()):
-    """
-    Updates a metadata in the catalogue, given its UUID
-    :param gn_url the GeoNetwork base url
-    :param uuid the unique identifier of the metadata to be updated
-    :param record the XML as string for the updated metadata
-    :param credentials the Credentials object
-    :return: True if success, raises an exception otherwise
-    """
-    try:
-        (username, password) = credentials.getFromUrl(gn_url)
-        csw = CatalogueServiceWeb(gn_url + "/srv/eng/csw-publication", username=username, password=password)
-        csw.transaction(ttype="update", typename="gmd:MD_Metadata", record=record, identifier=uuid)
-        return True
-    except Exception as e:
-        logger.error(e)
-        raise GsToGnUnableToUpdateServiceMetadataInconsistency(workspace, uuid, gn_url, e)
-
-
 def add_operates_on(xmlmd, md_url, uuidref):
     # /gmd:MD_Metadata/gmd:identificationInfo/srv:SV_ServiceIdentification/srv:operatesOn
     parsed_md = ET.fromstring(xmlmd)
@@ -195,6 +227,12 @@ if __name__ == "__main__":
     parser.add_argument("--workspaces-mapping", help="the INI file to be loaded to resolve title and abstract on "
                                                      "created service metadata",
                         default="template/workspaces-mapping.ini.example")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of data metadata fetched concurrently, defaults to 4")
+    parser.add_argument("--transaction-batch-size", type=int, default=20,
+                        help="Maximum number of service metadata inserted or updated per CSW-T Transaction "
+                             "request, defaults to 20")
+    add_rate_limit_arguments(parser)
 
     args = parser.parse_args(sys.argv[1:])
     if (args.workspace is None or args.geoserver is None or
@@ -204,14 +242,14 @@ if __name__ == "__main__":
 
     print_banner(args)
 
-    if args.disable_ssl_verification:
-        bypassSSLVerification()
     # Disable FutureWarning from owslib
     warnings.simplefilter("ignore", category=FutureWarning)
 
     # Load credentials
     creds = Credentials(logger=logger)
     (user, password) = creds.getFromUrl(args.geoserver)
+    transport = HttpTransport(creds, disable_ssl=args.disable_ssl_verification,
+                              rate_limiter=rate_limiter_from_args(args, parser))
 
     # Load the mapping file
     try:
@@ -221,6 +259,7 @@ if __name__ == "__main__":
         sys.exit(1)
 
     gscatalog = Catalog(args.geoserver + "/rest/", username=user, password=password)
+    transport.configure(gscatalog.session)
     errors = []
     try:
         workspace = gscatalog.get_workspace(name=args.workspace)
@@ -233,14 +272,27 @@ if __name__ == "__main__":
         sys.exit(1)
 
     else:
+        # the service metadata are fetched once, then looked up for each resource
+        try:
+            service_mds = ServiceMetadataIndex(args.geonetwork, transport=transport)
+        except Exception as e:
+            logger.error("Unable to get the service metadata from %s: %s", args.geonetwork, e)
+            sys.exit(1)
+        service_url = workspace_service_url(args.geoserver, args.workspace, args.service)
+        publisher = CSWPublisher(args.geonetwork, workspace=args.workspace, transport=transport,
+                                 batch_size=args.transaction_batch_size)
         resources = gscatalog.get_resources(workspace=workspace)
-        for res in resources:
+        # UUID from MDD is needed for operatesOn elements, the data metadata of the whole
+        # workspace are fetched once, both the created service metadata and the operatesOn
+        # reconciliation rely on them.
+        data_mds = find_workspace_data_metadata(resources, creds, args.disable_ssl_verification,
+                                                transport=transport, workers=args.workers)
+        for res, md_url, md, md_error in data_mds:
+            if md_error is not None:
+                errors.append(md_error)
+                continue
             try:
-                # UUID from MDD is needed for operatesOn elements
-                md_url, md = find_data_metadata(res, creds, args.disable_ssl_verification)
-                layer = gscatalog.get_layer(name="%s:%s" % (res.workspace.name, res.name))
-                linked_md = guess_related_service_metadata(args.geoserver, args.geonetwork,
-                                                           args.workspace, args.service)
+                linked_md = service_mds.get(service_url)
                 if linked_md is None:
                     # Creates a new service metadata for the workspace
                     logger.info("No service metadata found for %s, creating one", args.workspace)
@@ -256,57 +308,55 @@ if __name__ == "__main__":
                                 'file_identifier': uuid.uuid4(),
                                 'current_date': strftime("%Y-%m-%d", localtime()),
                                 'service_name': args.workspace,
-                                'service_url': workspace_service_url(args.geoserver, args.workspace, args.service),
+                                'service_url': service_url,
                                 'current_datetime': strftime("%Y-%m-%d %H:%M:%S", localtime()),
                                 'abstract': abstract,
                                 'title': title,
                                 'layers': []
                     }
-                    # reiterates on the resources object, to first create the complete service metadata
-                    # (with all the linked data MD).
-                    # this should not harm since we don't touch to the array, and access it only in a read-only mode
-                    for r2 in resources:
-                        try:
-                            r2mdurl, r2md = find_data_metadata(r2, creds, args.disable_ssl_verification)
+                    # the complete service metadata is created at once, with all the linked data MD.
+                    for r2, r2mdurl, r2md, r2error in data_mds:
+                        if r2error is None:
                             data['layers'].append({
                                 'mdd_uuid': r2md.identifier,
                                 'mdd_url': r2mdurl,
                                 'name': r2.name,
                                 'title': r2.title
                             })
-                        except:
+                        else:
                             logger.error("Unable to find all the data metadata for some layers on workspace '%s',"
                                          " generated service metadata might be incomplete.", args.workspace)
                             logger.error("Layer with missing data metadata URL: '%s:%s'", args.workspace,
                                          r2.name)
                     new_srv_md = create_service_metadata_from_template(data, args.service)
                     if not args.dry_run:
-                        insert_metadata(args.geonetwork, args.workspace, new_srv_md, creds)
+                        publisher.insert(str(data['file_identifier']), new_srv_md)
                     else:
                         logger.info("Dry-run: would have created a service metadata for workspace '%s'"
                                     " and metadata '%s'", args.workspace, md.identifier)
+                    service_mds.add(str(data['file_identifier']), service_url,
+                                    [layer['mdd_uuid'] for layer in data['layers']], new_srv_md)
                 else:
                     # service metadata found for the current workspace
                     # we still have to check if the mds references (operatesOn)
                     # all the MDD defined in the layers' workspace.
-                    operateson_found = False
-                    for oon in linked_md.serviceidentification.operateson:
-                        if oon['uuidref'] == md.identifier:
-                            operateson_found = True
-                            break
-                    if not operateson_found:
+                    if md.identifier not in linked_md.operateson:
                         logger.info("MDD '%s' is not referenced into the service MD '%s' (on server '%s'). "
                                     "Adding the operatesOn link", md_url, linked_md.identifier, args.geonetwork)
-                        xml_mds = add_operates_on(linked_md.xml, md_url, md.identifier)
+                        xml_mds = add_operates_on(service_mds.get_document(linked_md), md_url, md.identifier)
                         if not args.dry_run:
-                            update_metadata(args.geonetwork, linked_md.identifier, xml_mds, creds)
+                            publisher.update(linked_md.identifier, xml_mds)
                         else:
                             logger.info("Dry-run: would have updated md %s [adding operatesOn on data md %s]",
                                         linked_md.identifier, md.identifier)
+                        service_mds.add_operates_on(linked_md, md.identifier, xml_mds)
                     # TODO: also check / fix SV_CoupledResource ?
 
             except Inconsistency as e:
                 errors.append(e)
+        errors.extend(publisher.flush())
+        logger.info("%d service metadata saved in %d CSW-T transactions", publisher.published,
+                    publisher.transactions)
 
     # cswquerier object will depend on the MD URL obtained from the GeoServer.
     # We can imagine having more than one catalogue instance, then we need
@@ -0,0 +1,133 @@
+import io
+import xml.etree.ElementTree as ET
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+
+def _local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+class LayerRecord:
+    """
+    Class which holds the few fields of a GetCapabilities layer (or feature type) the
+    checks need, with the same attribute names as the owslib content metadata objects.
+    """
+    __slots__ = ["name", "metadataUrls", "boundingBoxWGS84", "crsOptions"]
+
+    def __init__(self, name, metadataUrls, boundingBoxWGS84, crsOptions):
+        self.name = name
+        self.metadataUrls = metadataUrls
+        self.boundingBoxWGS84 = boundingBoxWGS84
+        self.crsOptions = crsOptions
+
+
+class CapabilitiesReader:
+    """
+    Class which reads a WMS or WFS GetCapabilities document with an incremental parser,
+    keeping only the layer names, metadata URLs, WGS84 bounding boxes and CRS of each
+    layer. The elements are freed as soon as they have been read, so that the memory
+    used does not grow with the size of the document, unlike the full owslib object model.
+    """
+    def __init__(self, xml, wms=True):
+        """
+        constructor.
+
+        :param xml (bytes): the GetCapabilities document
+        :param wms (boolean): true if the document comes from a WMS service, false for WFS.
+        """
+        self.contents = {}
+        self.operations = {}
+        if wms:
+            self._read_wms(xml)
+        else:
+            self._read_wfs(xml)
+
+    def __getitem__(self, name):
+        return self.contents[name]
+
+    def _read_wms(self, xml):
+        # stack of the Layer elements being read, along with the fields read so far
+        layers = []
+        operation = None
+        for event, elem in ET.iterparse(io.BytesIO(xml), events=("start", "end")):
+            tag = _local_name(elem.tag)
+            if event == "start":
+                if tag == "Layer":
+                    layers.append((elem, {"name": None, "crs": [], "bbox": None, "metadataUrls": []}))
+                elif tag == "GetMap" and len(layers) == 0:
+                    operation = tag
+                continue
+            if tag == "Layer":
+                (_, fields) = layers.pop()
+                if fields["name"] is not None:
+                    # CRS and bounding box are inherited from the parent layers
+                    crs = list(fields["crs"])
+                    bbox = fields["bbox"]
+                    for (_, parent) in reversed(layers):
+                        crs.extend(c for c in parent["crs"] if c not in crs)
+                        bbox = bbox or parent["bbox"]
+                    self.contents[fields["name"]] = LayerRecord(fields["name"], fields["metadataUrls"], bbox, crs)
+                elem.clear()
+                if len(layers) > 0:
+                    layers[-1][0].remove(elem)
+            elif len(layers) > 0:
+                (parent, fields) = layers[-1]
+                if tag == "Name" and fields["name"] is None and elem in parent:
+                    fields["name"] = (elem.text or "").strip()
+                elif tag in ("CRS", "SRS") and elem in parent:
+                    fields["crs"].extend(c for c in (elem.text or "").split() if c not in fields["crs"])
+                elif tag == "EX_GeographicBoundingBox":
+                    values = {_local_name(child.tag): float(child.text) for child in elem}
+                    fields["bbox"] = (values["westBoundLongitude"], values["southBoundLatitude"],
+                                      values["eastBoundLongitude"], values["northBoundLatitude"])
+                elif tag == "LatLonBoundingBox":
+                    fields["bbox"] = tuple(float(elem.get(attr)) for attr in ("minx", "miny", "maxx", "maxy"))
+                elif tag == "MetadataURL":
+                    mdFormat = next((child.text for child in elem if _local_name(child.tag) == "Format"), None)
+                    url = next((child.get(XLINK_HREF) for child in elem
+                                if _local_name(child.tag) == "OnlineResource"), None)
+                    fields["metadataUrls"].append({"type": elem.get("type"), "format": mdFormat, "url": url})
+            elif tag == "OnlineResource" and operation is not None and operation not in self.operations:
+                self.operations[operation] = elem.get(XLINK_HREF)
+            elif tag == "GetMap":
+                operation = None
+
+    def _read_wfs(self, xml):
+        fields = None
+        operation = None
+        feature_types = None
+        for event, elem in ET.iterparse(io.BytesIO(xml), events=("start", "end")):
+            tag = _local_name(elem.tag)
+            if event == "start":
+                if tag == "FeatureTypeList":
+                    feature_types = elem
+                elif tag == "FeatureType":
+                    fields = {"name": None, "crs": [], "bbox": None, "metadataUrls": []}
+                elif tag == "Operation":
+                    operation = elem.get("name")
+                continue
+            if tag == "FeatureType":
+                if fields["name"] is not None:
+                    self.contents[fields["name"]] = LayerRecord(fields["name"], fields["metadataUrls"],
+                                                                fields["bbox"], fields["crs"])
+                fields = None
+                elem.clear()
+                if feature_types is not None:
+                    feature_types.remove(elem)
+            elif fields is not None:
+                if tag == "Name" and fields["name"] is None:
+                    fields["name"] = (elem.text or "").strip()
+                elif tag in ("DefaultSRS", "DefaultCRS", "OtherSRS", "OtherCRS", "SRS"):
+                    fields["crs"].append((elem.text or "").strip())
+                elif tag == "WGS84BoundingBox":
+                    corners = {_local_name(child.tag): [float(v) for v in child.text.split()] for child in elem}
+                    fields["bbox"] = tuple(corners["LowerCorner"] + corners["UpperCorner"])
+                elif tag == "MetadataURL":
+                    url = elem.get(XLINK_HREF) or (elem.text or "").strip()
+                    fields["metadataUrls"].append({"type": elem.get("type"), "format": elem.get("format"),
+                                                   "url": url})
+            elif tag == "Get" and operation is not None and operation not in self.operations:
+                self.operations[operation] = elem.get(XLINK_HREF)
+            elif tag == "Operation":
+                operation = None
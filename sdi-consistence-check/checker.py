@@ -1,23 +1,38 @@
 #!/usr/bin/env python3
 import argparse
+import configparser
 import os
 import logging
+import multiprocessing
 import warnings
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from math import floor
-from time import strftime, localtime
-import xml.etree.cElementTree as ET
+from time import strftime, localtime, perf_counter
+from urllib.parse import urlparse
 
 from owslib.fes import And
 from owslib.util import ServiceException
 
+from checkstate import CheckState
+from circuitbreaker import add_retry_arguments, circuit_breaker_from_args
 from credentials import Credentials
+from hostlimits import HostLimiter
+from httpcache import HttpCache
 from cswquerier import CachedOwsServices, CSWQuerier
+from geometadata import MetadataCache
 from inconsistency import Inconsistency, GnToGsLayerNotFoundInconsistency, GnToGsNoOGCWmsDefined, GnToGsNoOGCWfsDefined, \
-    GnToGsOtherError, GnToGsInvalidCapabilitiesUrl
+    GnToGsOtherError, GnToGsInvalidCapabilitiesUrl, HostUnavailableInconsistency
+from metrics import MetricsExporter
 from owscheck import OwsChecker
-from bypassSSLVerification import bypassSSLVerification
+from ratelimit import add_rate_limit_arguments, rate_limiter_from_args
+from reportwriters import JsonLinesReportWriter, XunitReportWriter
+from resultstore import ResultStore
+from transport import HttpTransport
+from utils import ordered_map
 
+logger = logging.getLogger("owschecker")
 
 
 def print_banner(args):
@@ -33,69 +48,18 @@ def print_banner(args):
     logger.info("\n\n")
 
 
-def print_layers_status(owschecker):
-    errors = owschecker.get_inconsistencies()
-    layers = owschecker.get_layer_names()
-    layers_in_error = [ error.layer_index for error in errors ]
-    curr_idx = 0
-    for idx, error in enumerate(errors):
-        while curr_idx < error.layer_index:
-            if curr_idx not in layers_in_error:
-                logger.info("#%d\n  Layer: %s OK\n", curr_idx, layers[curr_idx])
-            curr_idx += 1
-        logger.error("#%d\n  Layer: %s", error.layer_index, error.layer_name)
-        logger.error("  Error: %s\n" % str(error))
-
-def generate_ows_xunit_layers_status(owschecker, output_file):
-    errors = owschecker.get_inconsistencies()
-    layers = owschecker.get_layer_names()
-    layers_in_error = [ error.layer_index for error in errors ]
-    curr_idx = 0
-    results = []
-    for idx, error in enumerate(errors):
-        while curr_idx < error.layer_index:
-            if curr_idx not in layers_in_error:
-                # Layer OK
-                results.append({ "classname": "WMS" if owschecker.wms else "WFS", "name": layers[curr_idx], "time": "0", "error": None })
-            curr_idx += 1
-        results.append({ "classname": "WMS" if owschecker.wms else "WFS", "name": layers[curr_idx], "time": "0", "error": error})
-    nberrors = sum(1 for i in results if i['error'] is not None)
-    root = ET.Element("testsuite", {"name": "sdi-consistence-checker",
-        "tests": str(len(results)), "errors": str(nberrors), "failures": "0", "skip": "0" })
+def print_layers_status(results):
     for result in results:
-        error = result.pop('error')
-        tcase = ET.SubElement(root, "testcase", result)
-        if error is not None:
-            ET.SubElement(tcase, "error", { "type": type(error).__name__, "message": str(error) }).text = str(error)
-    tree = ET.ElementTree(root)
-    tree.write(output_file)
-
-def generate_csw_xunit_layers_status(results, output_file):
-    """
-      Generates a xunit report for CSW analysis.
-      @param results an array containing the xml attributes to add to the testcase elements,
-             plus uuid and error (which will have to be popped before adding)
-      @param output_file the XML output filename to be generated, defaults to xunit.xml
-    """
-    nberrors = sum(1 for i in results if i['error'] is not None)
-    root = ET.Element("testsuite", {"name": "sdi-consistence-checker",
-        "tests": str(len(results)), "errors": str(nberrors), "failures": "0", "skip": "0" })
-    for result in results:
-        error = result.pop('error')
-        current_uuid = result.pop("uuid")
-        tcase = ET.SubElement(root, "testcase", result)
-        if error is not None:
-            ET.SubElement(tcase, "error", { "type": type(error).__name__, "message": str(error) }).text = str(error)
-    tree = ET.ElementTree(root)
-    tree.write(output_file)
-
-def print_ows_report(owschecker):
-    total_layers = len(owschecker.get_layer_names())
-    inconsistencies = owschecker.get_inconsistencies()
-    layers_error = set()
-    for inconst in inconsistencies:
-        layers_error.add(inconst.layer_index)
-    inconsistencies_found = len(layers_error)
+        if result.error is None:
+            logger.info("#%d\n  Layer: %s OK\n", result.key, result.name)
+            continue
+        logger.error("#%d\n  Layer: %s", result.key, result.name)
+        for error in result.errors:
+            logger.error("  Error: %s\n" % str(error))
+
+def print_ows_report(results):
+    total_layers = len(results)
+    inconsistencies_found = results.count_in_error()
     layers_inconst_percent = floor((inconsistencies_found * 100 / total_layers)) if \
         total_layers > 0 else 0
     logger.info("\n\n%d layers parsed, %d inconsistencies found (%d %%)", total_layers,
@@ -103,18 +67,490 @@ def print_ows_report(owschecker):
     logger.info("end time: %s", strftime("%Y-%m-%d %H:%M:%S", localtime()))
 
 
-def print_csw_report(errors, total_mds):
-    unique_mds_in_error = { error.md_uuid for error in errors }
-    err_percent = floor(len(unique_mds_in_error) * 100 / total_mds) if total_mds > 0 else 0
+def print_csw_report(results):
+    total_mds = len(results)
+    mds_in_error = results.count_in_error()
+    err_percent = floor(mds_in_error * 100 / total_mds) if total_mds > 0 else 0
     logger.info("\n\n%d metadata parsed, %d inconsistencies found, %d unique metadatas in error (%d %%)",
-                total_mds, len(errors), len(unique_mds_in_error), err_percent)
+                total_mds, len(results.errors()), mds_in_error, err_percent)
     logger.info("end time: %s", strftime("%Y-%m-%d %H:%M:%S", localtime()))
 
 
-if __name__ == "__main__":
+def print_latency_report(latencies):
+    logger.info("\nRequests latency per host (p50 / p95 / p99):")
+    for host in latencies.hosts():
+        logger.info("  %s: %d requests, %.3fs / %.3fs / %.3fs", host, latencies.count(host),
+                    latencies.percentile(host, 50), latencies.percentile(host, 95), latencies.percentile(host, 99))
+
+
+def check_flexible_md(geoserver_services, uuid, md, messages):
+    """
+    Checks the OGC:WMS / OGC:WFS URLs referenced by a metadata (flexible mode).
+    :param geoserver_services: the CachedOwsServices object to check the layers with
+    :param uuid: the metadata identifier
+    :param md: the metadata, as a Dublin Core record
+    :param messages: a list the log messages describing the checks are appended to, so that
+           the caller can output them in order even if several metadata are checked concurrently
+    :return: the list of inconsistencies found.
+    """
+    md_errors = []
+    wms_found = False
+    wfs_found = False
+
+    for uri in md.uris:
+        from_wms = False
+        try:
+            if uri["protocol"] == "OGC:WMS":
+                wms_found = True
+                from_wms = True
+                # TODO: use the geoserver_to_check option ?
+                geoserver_services.checkWmsLayer(uri["url"], uri["name"])
+
+                logger.debug("\tURI OK : %s %s %s", uri["protocol"], uri['url'], uri['name'])
+                messages.append("    WMS url: OK")
+            elif uri["protocol"] == "OGC:WFS":
+                wfs_found = True
+                # TODO: same remark
+                geoserver_services.checkWfsLayer(uri["url"], uri["name"])
+                logger.debug("\tURI OK : %s %s %s", uri["protocol"], uri['url'], uri['name'])
+                messages.append("    WFS url: OK")
+            else:
+                logger.debug("\tSkipping URI : %s %s %s", uri["protocol"], uri['url'], uri['name'])
+        except Exception as ex:
+            if isinstance(ex, GnToGsLayerNotFoundInconsistency) or \
+                isinstance(ex, GnToGsInvalidCapabilitiesUrl) or    \
+                            isinstance(ex,GnToGsOtherError) or \
+                            isinstance(ex, HostUnavailableInconsistency):
+                ex.set_md_uuid(uuid)
+                md_errors.append(ex)
+            else:
+                # morph encountered error in to an "other error"
+                exc = GnToGsOtherError(uri['url'], uri['name'], ex)
+                exc.set_md_uuid(uuid)
+                md_errors.append(exc)
+            logger.debug("\t /!\\ ---> Cannot find Layer ON GS : %s %s %s %s %s",
+                        uuid, uri['protocol'], uri['url'], uri['name'], ex)
+            messages.append("    %s url: KO: %s: %s" % ("WMS" if from_wms else "WFS",
+                                                        uri['url'], str(md_errors[-1])))
+
+    if not wms_found:
+        messages.append("    WMS url: KO: No wms url found in the metadata")
+        md_errors.append(GnToGsNoOGCWmsDefined(uuid))
+
+    if not wfs_found:
+        messages.append("    WFS url: KO: No wfs url found in the metadata")
+        md_errors.append(GnToGsNoOGCWfsDefined(uuid))
+    return md_errors
+
+
+def check_strict_md(csw_q, mdd, services, geoserver_to_check):
+    """
+    Checks the layers a data metadata is published as, through the service metadata
+    referencing it (strict mode).
+    :param csw_q: the CSWQuerier object
+    :param mdd: the data metadata
+    :param services: the list of service metadata referencing the data metadata
+    :param geoserver_to_check: the list of hostnames of the services to be checked
+    :return: the list of inconsistencies found.
+    """
+    md_errors = []
+    for mds in services:
+        try:
+            csw_q.check_service_md(mds, mdd, geoserver_to_check=geoserver_to_check)
+        except Inconsistency as e:
+            logger.debug(e, exc_info=True)
+            logger.error(e)
+            md_errors.append(e)
+    return md_errors
+
+
+def flexible_md_dependencies(geoserver_services, md):
+    """
+    Describes what the outcome of the flexible checks onto a metadata depends on, apart
+    from the metadata itself: the services it references.
+    :return: a dictionary, the services URLs as keys, their fingerprint as values.
+    """
+    dependencies = {}
+    for uri in md.uris:
+        if uri["protocol"] in ["OGC:WMS", "OGC:WFS"]:
+            dependencies["%s %s" % (uri["protocol"], uri["url"])] = \
+                geoserver_services.getServiceFingerprint(uri["url"], uri["protocol"] == "OGC:WMS")
+    return dependencies
+
+
+def strict_md_dependencies(csw_q, geoserver_services, services, geoserver_to_check):
+    """
+    Describes what the outcome of the strict checks onto a data metadata depends on, apart
+    from the metadata itself: the service metadata referencing it, and the services they describe.
+    :return: a dictionary, the service metadata identifiers and services URLs as keys, their
+    change date / fingerprint as values.
+    """
+    dependencies = {}
+    for mds in services:
+        dependencies[mds.identifier] = csw_q.get_change_date(mds)
+        (url, protocol) = csw_q.get_capabilities_url(mds)
+        matches = csw_q.protocol_regexp.match(protocol or "")
+        if url is not None and matches is not None and urlparse(url).hostname in geoserver_to_check:
+            dependencies["%s %s" % (protocol, url)] = \
+                geoserver_services.getServiceFingerprint(url, matches.group("type").lower() == "wms")
+    return dependencies
+
+
+def check_ows_server(args, creds, transport, results, timeout, host_limiter=None, parse_pool=None,
+                     metadata_cache=None):
+    """
+    Checks the metadata of the layers of a WMS / WFS server (WMS / WFS modes).
+    :param args: the options of the target
+    :param creds: the Credentials object
+    :param transport: the HttpTransport to issue the requests with
+    :param results: the ResultStore the outcome of each layer is recorded in
+    :param timeout: the timeout of the requests, in seconds
+    :param host_limiter: the HostLimiter capping the probes per host, if shared with other targets
+    :param parse_pool: the ProcessPoolExecutor the metadata are parsed in, if any
+    :param metadata_cache: the MetadataCache the metadata are fetched through, if shared with other targets
+    """
+    logger.debug("Querying %s ..." % args.server)
+    ows_checker = OwsChecker(args.server, wms=(True if args.mode == "WMS" else False),
+                             creds=creds, checkLayers=args.check_layers,
+                             timeout=timeout, workers=args.workers,
+                             transport=transport, results=results,
+                             lightweight=args.light_capabilities,
+                             probes_per_host=args.probes_per_host, host_limiter=host_limiter,
+                             parse_pool=parse_pool, metadata_cache=metadata_cache)
+    logger.debug("Finished integrity check against %s GetCapabilities", args.mode)
+    print_layers_status(results)
+    if not args.only_err:
+        if ows_checker.probes_count > 0:
+            logger.info("\n%d layers probed in %.1fs (%.1f probes/s)", ows_checker.probes_count,
+                        ows_checker.probes_time, ows_checker.probes_count / ows_checker.probes_time
+                        if ows_checker.probes_time > 0 else 0)
+        print_ows_report(results)
+
+
+def check_catalogue(args, creds, transport, results, timeout, geoserver_services, state=None, parse_pool=None):
+    """
+    Checks the services referenced by the metadata of a catalogue (CSW mode).
+    :param args: the options of the target
+    :param creds: the Credentials object
+    :param transport: the HttpTransport to issue the requests with
+    :param results: the ResultStore the outcome of each metadata is recorded in
+    :param timeout: the timeout of the requests, in seconds
+    :param geoserver_services: the CachedOwsServices the services are loaded through
+    :param state: the CheckState of the incremental mode, if enabled
+    :param parse_pool: the ProcessPoolExecutor the result pages are parsed in, if any
+    :raise ServiceException: if the catalogue cannot be queried.
+    """
+    csw_q = CSWQuerier(args.server, credentials=creds, cached_ows_services=geoserver_services, logger=logger,
+                       timeout=timeout, transport=transport,
+                       pages_in_flight=args.csw_pages_in_flight, parse_pool=parse_pool)
+
+    def report_md(uuid, name, change_date, dependencies, md_errors, elapsed=0):
+        """
+        Records the outcome of the checks made onto a metadata, in the results store
+        and in the incremental state if any.
+        """
+        results.add(uuid, name, md_errors, elapsed)
+        if state is not None:
+            state.set_outcome(uuid, change_date, dependencies, md_errors)
+
+    if args.inspire == "strict":
+        geoserver_to_check = args.geoserver_to_check if args.geoserver_to_check is not None else []
+        # Step 1: get all data metadata
+        datamd = csw_q.get_all_records(constraints=[And([csw_q.is_dataset, csw_q.non_harvested])])
+        # Step 2: maps data metadatas to service MDs
+        servicesmd = csw_q.get_all_records(constraints=[And([csw_q.is_service, csw_q.non_harvested])])
+        data_to_service_map = {}
+        for uuid, md in servicesmd.items():
+            for oon in md.operateson:
+                if data_to_service_map.get(oon) is None:
+                    data_to_service_map[oon] = [uuid]
+                else:
+                    data_to_service_map[oon] = data_to_service_map[oon] + [uuid]
+
+        # Step 3: on each data md, get the service md, and the underlying service URL
+        for mdd_uuid, mdd in datamd.items():
+            # Note: this won't count the service metadata in the end, only the MDD that trigger a
+            # check onto a service MD.
+            # TODO file an issue if the dataMd has no ServiceMd linked to ?
+            # step 4: check the layer existence using the service URL
+            services = [servicesmd[sce_uuid] for sce_uuid in data_to_service_map.get(mdd_uuid, [])]
+            change_date = csw_q.get_change_date(mdd)
+            dependencies = {}
+            if state is not None:
+                dependencies = strict_md_dependencies(csw_q, geoserver_services, services, geoserver_to_check)
+                md_errors = state.get_outcome(mdd_uuid, change_date, dependencies)
+                if md_errors is not None:
+                    logger.debug("Metadata %s unchanged since last run, skipping", mdd_uuid)
+                    report_md(mdd_uuid, mdd.title, change_date, dependencies, md_errors)
+                    continue
+            start = perf_counter()
+            md_errors = check_strict_md(csw_q, mdd, services, geoserver_to_check)
+            # since a MDD can reference several service metadata, the MDD is
+            # reported only once: with the first error met if any in the xunit
+            # report, with all of them in the JSON Lines one.
+            report_md(mdd_uuid, mdd.title, change_date, dependencies, md_errors,
+                      perf_counter() - start)
+
+    elif args.inspire == "flexible":
+        def check_record(record):
+            """
+            Checks a metadata, or carries the previous outcome over if it did not change.
+            Run from the worker threads.
+            """
+            (uuid, md) = record
+            messages = []
+            change_date = csw_q.get_change_date(md)
+            dependencies = {}
+            md_errors = None
+            elapsed = 0
+            if state is not None:
+                dependencies = flexible_md_dependencies(geoserver_services, md)
+                md_errors = state.get_outcome(uuid, change_date, dependencies)
+                if md_errors is not None:
+                    messages.append("    unchanged since last run: %s" % ("KO" if len(md_errors) > 0 else "OK"))
+            if md_errors is None:
+                start = perf_counter()
+                md_errors = check_flexible_md(geoserver_services, uuid, md, messages)
+                elapsed = perf_counter() - start
+            return (uuid, md, change_date, dependencies, md_errors, elapsed, messages)
+
+        # the records are fetched in the background while the previous ones are checked,
+        # the outcomes being reported in the catalogue order.
+        records = csw_q.iter_dataset_records(constraints=[csw_q.non_harvested], buffer_size=csw_q.max_records)
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            outcomes = ordered_map(executor, check_record, records, 2 * args.workers)
+            for global_idx, (uuid, md, change_date, dependencies, md_errors, elapsed, messages) \
+                    in enumerate(outcomes):
+                logger.info("#%d\n  UUID : %s\n  %s", global_idx, uuid, md.title)
+                for message in messages:
+                    logger.info(message)
+                report_md(uuid, md.title, change_date, dependencies, md_errors, elapsed)
+                logger.info("")
+
+    print_csw_report(results)
+    if state is not None:
+        logger.info("%d metadata unchanged since last run, previous results carried over", state.carried_over)
+        state.save()
+
+
+def run_target(args, creds, transport, timeout, geoserver_services, host_limiter=None, metrics=None, name=None,
+               parse_pool=None, metadata_cache=None):
+    """
+    Runs the checks of a target (a WMS / WFS server, or a catalogue), writing its reports
+    as the checks go.
+    :param args: the options of the target
+    :param creds: the Credentials object
+    :param transport: the HttpTransport to issue the requests with
+    :param timeout: the timeout of the requests, in seconds
+    :param geoserver_services: the CachedOwsServices the services are loaded through in CSW mode
+    :param host_limiter: the HostLimiter capping the probes per host, if shared with other targets
+    :param metrics: the MetricsExporter the outcome of the checks is exported with, if any
+    :param name: the name of the target in batch mode
+    :param parse_pool: the ProcessPoolExecutor the XML documents are parsed in, if any
+    :param metadata_cache: the MetadataCache the metadata are fetched through in WMS / WFS modes
+    :return: the ResultStore gathering the outcome of the checks.
+    """
+    if not args.only_err:
+        print_banner(args)
+    # the reports are written as the checks go
+    report_writers = []
+    if args.xunit:
+        report_writers.append(XunitReportWriter(args.xunit_output, args.mode))
+    if args.jsonl_output is not None:
+        report_writers.append(JsonLinesReportWriter(args.jsonl_output, args.mode))
+    results = ResultStore(args.mode, writers=report_writers)
+    state = CheckState(args.state_file) if args.mode == "CSW" and args.state_file is not None else None
+    if metrics is not None:
+        metrics.add_target(args.mode, results, state=state, name=name)
+    try:
+        if args.mode == "WMS" or args.mode == "WFS":
+            check_ows_server(args, creds, transport, results, timeout, host_limiter=host_limiter,
+                             parse_pool=parse_pool, metadata_cache=metadata_cache)
+        else:
+            check_catalogue(args, creds, transport, results, timeout, geoserver_services, state=state,
+                            parse_pool=parse_pool)
+    finally:
+        for writer in report_writers:
+            writer.close()
+    return results
+
+
+# the options acting on the whole run, which cannot be set per target in a batch job file
+RUN_OPTIONS = ["batch-concurrency", "disable-ssl-verification", "light-capabilities", "probes-per-host",
+               "metrics-file", "metrics-interval", "log-to-file", "timeout", "failure-ttl", "cache-dir",
+               "parse-processes", "rate-limit", "host-rate-limit", "retries", "retry-backoff",
+               "breaker-threshold", "breaker-cooldown"]
+
+
+class TargetLogBuffer(logging.Filter):
+    """
+    Class which holds back the log records of the targets checked concurrently in batch mode,
+    so that the output of each target is written as one block once its checks are over,
+    instead of being interleaved line by line with the output of the other targets.
+    """
+    def __init__(self, target_logger):
+        """
+        constructor.
+
+        :param target_logger: the logger the targets log into
+        """
+        super().__init__()
+        self._logger = target_logger
+        # the records held back, by thread
+        self._buffers = {}
+        self._output_lock = threading.Lock()
+
+    def filter(self, record):
+        buffer = self._buffers.get(threading.get_ident())
+        if buffer is None:
+            return True
+        buffer.append(record)
+        return False
+
+    def start(self):
+        """
+        Starts holding back the records logged by the current thread.
+        """
+        self._buffers[threading.get_ident()] = []
+
+    def flush(self):
+        """
+        Writes the records held back for the current thread, as one block.
+        """
+        records = self._buffers.pop(threading.get_ident(), [])
+        with self._output_lock:
+            for record in records:
+                self._logger.handle(record)
+
+
+def load_batch_targets(parser, job_file, argv):
+    """
+    Reads the targets of a batch job file. The job file is an INI file with one section per
+    target, whose options are the command line ones without the leading dashes, e.g.:
+
+        [rennes-wms]
+        mode = WMS
+        server = https://public.sig.rennesmetropole.fr/geoserver/wms
+        check-layers = true
+
+    The options given on the command line, or in the DEFAULT section, apply to every target.
+    Report and state files shared by several targets are suffixed with the target name. The
+    options acting on the whole run (see RUN_OPTIONS) are only read from the command line.
+    :param parser: the command line parser
+    :param job_file: the path to the job file
+    :param argv: the command line arguments
+    :return: a list of (target name, target options) tuples.
+    """
+    config = configparser.ConfigParser()
+    if len(config.read(job_file)) == 0:
+        parser.error("unable to read the batch job file %s" % job_file)
+    targets = []
+    for section in config.sections():
+        target_argv = list(argv)
+        flags = {}
+        for (key, value) in config.items(section):
+            action = parser._option_string_actions.get("--" + key)
+            if action is None or action.dest == "batch":
+                parser.error("unknown option '%s' in the [%s] section of %s" % (key, section, job_file))
+            if key in RUN_OPTIONS:
+                parser.error("the '%s' option of the [%s] section of %s acts on the whole run, it can only be "
+                             "given on the command line" % (key, section, job_file))
+            if action.nargs == 0:
+                try:
+                    flags[action.dest] = config.getboolean(section, key)
+                except ValueError:
+                    parser.error("the '%s' option of the [%s] section of %s expects a boolean, got '%s'"
+                                 % (key, section, job_file, value))
+            elif action.nargs == "+":
+                target_argv += ["--" + key] + value.split()
+            else:
+                target_argv += ["--" + key, value]
+        target_args = parser.parse_args(target_argv)
+        for (dest, value) in flags.items():
+            setattr(target_args, dest, value)
+        if target_args.mode is None or target_args.server is None:
+            parser.error("the [%s] section of %s needs a mode and a server" % (section, job_file))
+        targets.append((section, target_args))
+    for dest in ["xunit_output", "jsonl_output", "state_file"]:
+        paths = [getattr(target_args, dest) for (_, target_args) in targets]
+        for (name, target_args) in targets:
+            path = getattr(target_args, dest)
+            if path is not None and paths.count(path) > 1:
+                (root, ext) = os.path.splitext(path)
+                setattr(target_args, dest, "%s-%s%s" % (root, name, ext))
+    return targets
+
+
+def run_batch(targets, creds, transport, timeout, geoserver_services, host_limiter, metrics=None, concurrency=1,
+              parse_pool=None, metadata_cache=None):
+    """
+    Runs the checks of several targets concurrently, sharing the transport (hence the
+    connection pools and the on-disk cache), the GetCapabilities and metadata caches, the
+    probes limits and the parsing processes. The output of each target is written as one
+    block once its checks are over.
+    :param targets: a list of (target name, target options) tuples
+    :param concurrency: the number of targets checked concurrently
+    :return: a list of (target name, target options, ResultStore, elapsed time, error) tuples,
+    the error being the exception which aborted the checks of the target if any.
+    """
+    log_buffer = TargetLogBuffer(logger)
+    logger.addFilter(log_buffer)
+
+    def run(target):
+        (name, target_args) = target
+        start = perf_counter()
+        log_buffer.start()
+        try:
+            results = run_target(target_args, creds, transport, timeout, geoserver_services,
+                                 host_limiter=host_limiter, metrics=metrics, name=name, parse_pool=parse_pool,
+                                 metadata_cache=metadata_cache)
+            return (name, target_args, results, perf_counter() - start, None)
+        except Exception as e:
+            logger.debug(e, exc_info=True)
+            logger.error("Unable to check the target %s (%s): %s", name, target_args.server, e)
+            return (name, target_args, None, perf_counter() - start, e)
+        finally:
+            log_buffer.flush()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            return list(executor.map(run, targets))
+    finally:
+        logger.removeFilter(log_buffer)
+
+
+def print_batch_summary(outcomes):
+    logger.info("\n\nBatch summary:")
+    total_items = 0
+    total_in_error = 0
+    for (name, target_args, results, elapsed, error) in outcomes:
+        if error is not None:
+            logger.info("  %s (%s %s): FAILED in %.1fs: %s", name, target_args.mode, target_args.server,
+                        elapsed, error)
+            continue
+        total_items += len(results)
+        total_in_error += results.count_in_error()
+        logger.info("  %s (%s %s): %d %s checked, %d in error, %d inconsistencies, in %.1fs", name,
+                    target_args.mode, target_args.server, len(results),
+                    "metadata" if target_args.mode == "CSW" else "layers", results.count_in_error(),
+                    len(results.errors()), elapsed)
+    logger.info("%d targets, %d failed, %d items checked, %d in error", len(outcomes),
+                len([o for o in outcomes if o[4] is not None]), total_items, total_in_error)
+    logger.info("end time: %s", strftime("%Y-%m-%d %H:%M:%S", localtime()))
+
+
+def build_parser():
+    """
+    Builds the command line parser, whose options are also the ones of the batch job files.
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument("--mode", help="the mode to consider (WMS, WFS, CSW)",
-                        choices=['WMS', 'WFS', 'CSW'], required=True)
+                        choices=['WMS', 'WFS', 'CSW'])
+    parser.add_argument("--batch", help="Batch mode: check all the targets listed in this job file (INI file, one "
+                                        "section per target with its options, e.g. 'mode = WMS'), sharing the "
+                                        "caches and connections")
+    parser.add_argument("--batch-concurrency", type=int, default=4,
+                        help="Number of targets checked concurrently in batch mode, defaults to 4")
     parser.add_argument("--inspire", help="indicates if the checks should be strict or flexible, default to flexible",
                         choices=['flexible', 'strict'], default="flexible")
     parser.add_argument("--server", help="the server to target (full URL, e.g. "
@@ -126,6 +562,15 @@ if __name__ == "__main__":
 
     parser.add_argument("--check-layers", help="check WMS/WFS layer validity", action="store_true")
 
+    parser.add_argument("--probes-per-host", type=int, default=2,
+                        help="Maximum number of --check-layers GetMap / GetFeature requests issued concurrently "
+                             "against a host, defaults to 2")
+
+    parser.add_argument("--light-capabilities", help="Only extract the layers fields needed by the checks from the "
+                                                     "GetCapabilities documents, instead of building the whole owslib "
+                                                     "object model (faster and lighter on large services)",
+                        action="store_true")
+
     parser.add_argument("--only-err", help="Only display errors, no summary informations will be displayed",
                         action="store_true")
 
@@ -134,13 +579,63 @@ if __name__ == "__main__":
 
     parser.add_argument("--xunit-output", help="Name of the xunit report file, defaults to ./xunit.xml", default="xunit.xml")
 
+    parser.add_argument("--jsonl-output", help="If a file path is specified, also write the outcome of the checks "
+                                               "there, as JSON Lines")
+
+    parser.add_argument("--metrics-file", help="If a file path is specified, write the metrics of the run there, "
+                                               "in the Prometheus text format (e.g. for the node exporter "
+                                               "textfile collector)")
+
+    parser.add_argument("--metrics-interval", type=int, default=0,
+                        help="Number of seconds between two writes of the metrics file during the run, "
+                             "defaults to 0 (only written at the end of the run)")
+
     parser.add_argument("--log-to-file", help="If a file path is specified, log output to this file, not stdout")
 
     parser.add_argument("--timeout", type=int, help="Specify a timeout for request to external service.")
 
+    parser.add_argument("--failure-ttl", type=int, default=600,
+                        help="Number of seconds during which a WMS/WFS service which failed to load is not "
+                             "queried again in CSW mode, its error being reported instead. 0 disables it, "
+                             "defaults to 600")
+
+    parser.add_argument("--cache-dir", help="If a directory is specified, keep the downloaded GetCapabilities "
+                                            "documents there, and only revalidate them on the next runs")
+
+    parser.add_argument("--state-file", help="Incremental CSW mode: if a file path is specified, the outcome of the "
+                                             "checks is kept there, and only the metadata which changed since the "
+                                             "previous run (or whose services changed) are checked again")
+
+    parser.add_argument("--csw-pages-in-flight", type=int, default=1,
+                        help="Maximum number of CSW result pages requested concurrently in CSW mode, defaults to 1")
+
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of checks run concurrently: metadata URLs fetched in WMS/WFS mode, "
+                             "metadata checked in CSW flexible mode. Defaults to 1")
+
+    parser.add_argument("--parse-processes", type=int, default=0,
+                        help="Number of processes the CSW result pages and the metadata documents are parsed in, "
+                             "to use several cores. 0 parses them in the checking threads, defaults to 0")
+
+    add_rate_limit_arguments(parser)
+    add_retry_arguments(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args(sys.argv[1:])
+    if args.mode is None and args.batch is None:
+        parser.error("the following arguments are required: --mode (or --batch)")
+    targets = load_batch_targets(parser, args.batch, sys.argv[1:]) if args.batch is not None else []
+
+    # the parsing processes are not forked from this process, which runs several threads
+    # (metrics, CSW pages, checks), but from a fork server started before any of them.
+    parse_pool = None
+    if args.parse_processes > 0:
+        parse_pool = ProcessPoolExecutor(args.parse_processes, mp_context=multiprocessing.get_context("forkserver"))
+        parse_pool.submit(int).result()
 
-    logger = logging.getLogger("owschecker")
     hdlr = logging.FileHandler(args.log_to_file, mode='w') if args.log_to_file is not None \
         else logging.StreamHandler(sys.stdout)
     hdlr.setLevel(os.getenv("LOG_LEVEL",logging.INFO))
@@ -151,170 +646,62 @@ if __name__ == "__main__":
 
     request_timeout = args.timeout or int(os.getenv('REQUEST_TIMEOUT', 30))
 
-    if args.disable_ssl_verification:
-        bypassSSLVerification()
+    http_cache = HttpCache(args.cache_dir) if args.cache_dir is not None else None
+    transport = HttpTransport(creds, disable_ssl=args.disable_ssl_verification, timeout=request_timeout,
+                              pool_maxsize=max([10, args.workers] + [t.workers for (_, t) in targets]),
+                              cache=http_cache,
+                              rate_limiter=rate_limiter_from_args(args, parser), retries=args.retries,
+                              retry_backoff=args.retry_backoff, circuit_breaker=circuit_breaker_from_args(args))
     # Disable FutureWarning from owslib
     warnings.simplefilter("ignore", category=FutureWarning)
 
-    if not args.only_err:
-        print_banner(args)
-
-    if (args.mode == "WMS" or args.mode == "WFS") and args.server is not None:
-        logger.debug("Querying %s ..." % args.server)
-        ows_checker = None
+    # the services and probes limits are shared by all the targets in batch mode
+    geoserver_services = CachedOwsServices(creds,
+                                           disable_ssl=args.disable_ssl_verification,
+                                           timeout=request_timeout,
+                                           transport=transport,
+                                           failure_ttl=args.failure_ttl,
+                                           lightweight=args.light_capabilities)
+    host_limiter = HostLimiter(args.probes_per_host)
+    metadata_cache = MetadataCache()
+    metrics = None
+    if args.metrics_file is not None:
+        metrics = MetricsExporter(args.metrics_file, transport, http_cache=http_cache,
+                                  ows_services=geoserver_services, metadata_cache=metadata_cache,
+                                  interval=args.metrics_interval)
+        metrics.start()
+
+    if args.batch is not None:
+        outcomes = run_batch(targets, creds, transport, request_timeout, geoserver_services, host_limiter,
+                             metrics=metrics, concurrency=args.batch_concurrency, parse_pool=parse_pool,
+                             metadata_cache=metadata_cache)
+        print_batch_summary(outcomes)
+    elif args.server is not None:
         try:
-            ows_checker = OwsChecker(args.server, wms=(True if args.mode == "WMS" else False),
-                                     creds=creds, checkLayers = (args.check_layers != None),
-                                     timeout=request_timeout)
-            logger.debug("Finished integrity check against %s GetCapabilities", args.mode)
-            print_layers_status(ows_checker)
-            if not args.only_err:
-                print_ows_report(ows_checker)
-            if args.xunit:
-                    generate_ows_xunit_layers_status(ows_checker, args.xunit_output)
+            run_target(args, creds, transport, request_timeout, geoserver_services, host_limiter=host_limiter,
+                       metrics=metrics, parse_pool=parse_pool, metadata_cache=metadata_cache)
         except Exception as e:
             logger.debug(e, exc_info=True)
-            logger.info("Unable to parse the remote OWS server: %s", str(e))
+            if args.mode != "CSW":
+                logger.info("Unable to parse the remote OWS server: %s", str(e))
+            elif isinstance(e, ServiceException):
+                logger.fatal("Unable to query the remote CSW:\nError: %s\nPlease check the CSW url", e)
+                sys.exit(1)
+            else:
+                raise
+    if args.mode == "CSW" or args.batch is not None:
+        logger.info("%d capabilities downloads saved by URL canonicalization", geoserver_services.fetches_saved)
+    if args.mode != "CSW" and not args.only_err:
+        logger.info("%d metadata downloads saved, metadata shared by several layers", metadata_cache.fetches_saved)
+
+    if parse_pool is not None:
+        parse_pool.shutdown()
+    if metrics is not None:
+        metrics.stop()
 
-    elif args.mode == "CSW" and args.server is not None:
-        total_mds = 0
-        geoserver_services = CachedOwsServices(creds,
-                                               disable_ssl=args.disable_ssl_verification,
-                                               timeout=request_timeout)
-        try:
-            csw_q = CSWQuerier(args.server, credentials=creds, cached_ows_services=geoserver_services, logger=logger, timeout=request_timeout)
-        except ServiceException as e:
-            logger.debug(e, exc_info=True)
-            logger.fatal("Unable to query the remote CSW:\nError: %s\nPlease check the CSW url", e)
-            sys.exit(1)
-        errors = []
-        reporting = []
-        if args.inspire == "strict":
-            # Step 1: get all data metadata
-            datamd = csw_q.get_all_records(constraints=[And([csw_q.is_dataset, csw_q.non_harvested])])
-            # Step 2: maps data metadatas to service MDs
-            servicesmd = csw_q.get_all_records(constraints=[And([csw_q.is_service, csw_q.non_harvested])])
-            data_to_service_map = {}
-            for uuid, md in servicesmd.items():
-                for oon in md.identificationinfo[0].operateson:
-                    if data_to_service_map.get(oon['uuidref']) is None:
-                        data_to_service_map[oon['uuidref']] = [uuid]
-                    else:
-                        data_to_service_map[oon['uuidref']] = data_to_service_map[oon['uuidref']] + [uuid]
-
-            # Step 3: on each data md, get the service md, and the underlying service URL
-            #for uuid, md in enumerate(datamd):
-            for mdd_uuid, mdd in datamd.items():
-                # Note: this won't count the service metadata in the end, only the MDD that trigger a
-                # check onto a service MD.
-                total_mds += 1
-
-                if data_to_service_map.get(mdd_uuid) is None:
-                    # TODO file an issue if the dataMd has no ServiceMd linked to ?
-                    if len([x for x in reporting if x['uuid'] == mdd_uuid]) == 0:
-                        reporting.append({ 'classname': 'CSW', 'name': mdd.identification.title, 'uuid': mdd_uuid,
-                              'time': '0', 'error': None })
-                    continue
-                # step 4: check the layer existence using the service URL
-                for sce_uuid in data_to_service_map[mdd_uuid]:
-                    try:
-                        mds = servicesmd[sce_uuid]
-                        mdd = datamd[mdd_uuid]
-                        csw_q.check_service_md(mds, mdd, geoserver_to_check=args.geoserver_to_check if
-                                               args.geoserver_to_check is not None else [])
-                        # No issue so far ?
-                        # since a MDD can reference several service metadata, consider
-                        # the MDD as passing tests only once (avoid adding several times the same MDD
-                        # to the array). It must be very unlikely to have several MDS anyway.
-                        if len([x for x in reporting if x['uuid'] == mdd_uuid]) == 0:
-                            reporting.append({ 'classname': 'CSW', 'name': mdd.title, 'uuid': mdd_uuid,
-                              'time': '0', 'error': None })
-                    except Inconsistency as e:
-                        logger.debug(e, exc_info=True)
-                        logger.error(e)
-                        errors.append(e)
-                        # Same as above: only adding the errored MDD once
-                        if len([x for x in reporting if x['uuid'] == mdd_uuid]) == 0:
-                            reporting.append({ 'classname': 'CSW', 'name': mdd.title, 'uuid': mdd_uuid,
-                              'time': '0', 'error': e })
-
-        elif args.inspire == "flexible":
-            global_idx = 0
-            csw_q.start = 0
-            while True:
-
-                res = csw_q.get_dataset_records(constraints=[csw_q.non_harvested])
-
-                total_mds += len(res)
-                for idx, uuid in enumerate(res):
-                    current_md = res[uuid]
-                    logger.info("#%d\n  UUID : %s\n  %s", global_idx, uuid, current_md.title)
-                    wms_found = False
-                    wfs_found = False
-
-                    for uri in csw_q.get_md(uuid).uris:
-                        from_wms = False
-                        try:
-                            if uri["protocol"] == "OGC:WMS":
-                                wms_found = True
-                                from_wms = True
-                                # TODO: use the geoserver_to_check option ?
-                                geoserver_services.checkWmsLayer(uri["url"], uri["name"])
-
-                                logger.debug("\tURI OK : %s %s %s", uri["protocol"], uri['url'], uri['name'])
-                                logger.info("    WMS url: OK")
-                            elif uri["protocol"] == "OGC:WFS":
-                                wfs_found = True
-                                # TODO: same remark
-                                geoserver_services.checkWfsLayer(uri["url"], uri["name"])
-                                logger.debug("\tURI OK : %s %s %s", uri["protocol"], uri['url'], uri['name'])
-                                logger.info("    WFS url: OK")
-                            else:
-                                logger.debug("\tSkipping URI : %s %s %s", uri["protocol"], uri['url'], uri['name'])
-                        except Exception as ex:
-                            if isinstance(ex, GnToGsLayerNotFoundInconsistency) or \
-                                isinstance(ex, GnToGsInvalidCapabilitiesUrl) or    \
-                                            isinstance(ex,GnToGsOtherError):
-                                ex.set_md_uuid(uuid)
-                                errors.append(ex)
-                            else:
-                                # morph encountered error in to an "other error"
-                                exc = GnToGsOtherError(uri['url'], uri['name'], ex)
-                                exc.set_md_uuid(uuid)
-                                errors.append(exc)
-                            logger.debug("\t /!\\ ---> Cannot find Layer ON GS : %s %s %s %s %s",
-                                        uuid, uri['protocol'], uri['url'], uri['name'], ex)
-                            logger.info("    %s url: KO: %s: %s" % ("WMS" if from_wms else "WFS",
-                                                                    uri['url'], str(errors[-1])))
-                            # in both cases, add the MDD in the reporting array
-                            if len([x for x in reporting if x['uuid'] == uuid]) == 0:
-                                reporting.append({ 'classname': 'CSW', 'name': current_md.title, 'uuid': uuid,
-                                    'time': '0', 'error': ex })
-
-                    if not wms_found:
-                        logger.info("    WMS url: KO: No wms url found in the metadata")
-                        err = GnToGsNoOGCWmsDefined(uuid)
-                        errors.append(err)
-                        reporting.append({ 'classname': 'CSW', 'name': current_md.title, 'uuid': uuid,
-                                    'time': '0', 'error': err })
-
-                    if not wfs_found:
-                        logger.info("    WFS url: KO: No wfs url found in the metadata")
-                        err = GnToGsNoOGCWfsDefined(uuid)
-                        errors.append(err)
-                        reporting.append({ 'classname': 'CSW', 'name': current_md.title, 'uuid': uuid,
-                                    'time': '0', 'error': err })
-                    if wms_found and wfs_found:
-                        reporting.append({ 'classname': 'CSW', 'name': current_md.title, 'uuid': uuid,
-                                    'time': '0', 'error': None })
-
-                    logger.info("")
-                    # end of current md
-                    global_idx += 1
-
-                if csw_q.start > csw_q.csw.results['matches']:
-                    break
-
-        print_csw_report(errors, total_mds)
-        if args.xunit:
-            generate_csw_xunit_layers_status(reporting, args.xunit_output)
+    if not args.only_err:
+        print_latency_report(transport.latencies)
+
+    if http_cache is not None:
+        logger.debug("On-disk cache: %d documents revalidated, %d downloaded", http_cache.hits, http_cache.misses)
+        http_cache.close()
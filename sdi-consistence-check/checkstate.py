@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+
+from inconsistency import CarriedOverInconsistency
+
+
+def inconsistency_type(error):
+    """
+    Gives the name of the kind of an inconsistency, as displayed in the reports.
+
+    :param error: the inconsistency
+    :return: the class name of the inconsistency, or the one of the original
+    inconsistency if it has been carried over from a previous run.
+    """
+    return getattr(error, "type_name", type(error).__name__)
+
+
+class CheckState:
+    """
+    Class which keeps track, from one run to another, of the outcome of the checks made
+    onto each metadata record, along with what this outcome depends on: the change date
+    of the record, and a fingerprint of the metadata / services it references.
+
+    It allows the CSW mode to only check again the records which changed, carrying the
+    previous outcome over for the others.
+    """
+    def __init__(self, path):
+        """
+        constructor, loads the state file if it exists.
+
+        :param path (string): path to the JSON state file
+        """
+        self._path = path
+        self._previous = {}
+        self._records = {}
+        self._lock = threading.Lock()
+        self.carried_over = 0
+        try:
+            with open(path) as f:
+                self._previous = json.load(f).get("records", {})
+        except FileNotFoundError:
+            pass
+
+    def get_outcome(self, uuid, change_date, dependencies):
+        """
+        Gets the outcome of the last run for a record, if neither the record nor its
+        dependencies changed since.
+
+        :param uuid: the record identifier
+        :param change_date: the change date of the record (dateStamp / modified)
+        :param dependencies: a dictionary describing the resources the check relies on
+        :return: the list of inconsistencies found by the previous run, None if the record
+        has to be checked again.
+        """
+        entry = self._previous.get(uuid)
+        if entry is None or change_date is None or entry["change_date"] != change_date \
+                or entry["dependencies"] != dependencies:
+            return None
+        with self._lock:
+            self._records[uuid] = entry
+            self.carried_over += 1
+        return [CarriedOverInconsistency(uuid, e["type"], e["message"]) for e in entry["errors"]]
+
+    def set_outcome(self, uuid, change_date, dependencies, errors):
+        """
+        Records the outcome of the checks made onto a record.
+
+        :param uuid: the record identifier
+        :param change_date: the change date of the record (dateStamp / modified)
+        :param dependencies: a dictionary describing the resources the check relies on
+        :param errors: the list of inconsistencies found
+        """
+        with self._lock:
+            self._records[uuid] = {
+                "change_date": change_date,
+                "dependencies": dependencies,
+                "errors": [{"type": inconsistency_type(e), "message": str(e)} for e in errors]
+            }
+
+    def save(self):
+        """
+        Writes the state file. Only the records met during the current run are kept.
+        """
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"records": self._records}, f)
+        os.replace(tmp_path, self._path)
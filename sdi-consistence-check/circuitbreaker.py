@@ -0,0 +1,154 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+
+class HostUnavailableError(requests.ConnectionError):
+    """
+    Raised instead of issuing a request against a host whose circuit is open.
+    """
+    def __init__(self, url, host, retry_in):
+        self.url = url
+        self.host = host
+        self.retry_in = retry_in
+        super().__init__("Host %s unavailable after repeated failures, not queried again for %ds"
+                         % (host, retry_in))
+
+
+class HostCircuit:
+    """
+    Class which holds the state of the circuit of a given host.
+    """
+    def __init__(self):
+        self.failures = 0
+        # the circuit is open until this time, None if closed
+        self.opened_until = None
+        # true while the single request probing the host after the cooldown is in flight
+        self.probing = False
+        self.trips = 0
+
+
+class CircuitBreaker:
+    """
+    Class which stops querying a host once it failed several times in a row: the
+    requests against it fail immediately with a HostUnavailableError, until a cooldown
+    is over. A single request is then let through to probe the host, which closes the
+    circuit if it succeeds, and opens it again for another cooldown otherwise.
+    """
+    def __init__(self, failure_threshold=3, cooldown=60):
+        """
+        constructor.
+
+        :param failure_threshold (int): number of consecutive failures opening the circuit of a host
+        :param cooldown (int): number of seconds during which a host is not queried once its circuit
+        is open
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def _circuit(self, host):
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = HostCircuit()
+            self._circuits[host] = circuit
+        return circuit
+
+    def before_request(self, url):
+        """
+        Checks whether a request can be issued against the host of an URL.
+
+        :param url: the URL about to be queried
+        :raise HostUnavailableError: if the circuit of the host is open.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            circuit = self._circuit(host)
+            if circuit.opened_until is None:
+                return
+            now = time.monotonic()
+            if now < circuit.opened_until or circuit.probing:
+                raise HostUnavailableError(url, host, max(0, circuit.opened_until - now))
+            circuit.probing = True
+
+    def record_success(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            circuit = self._circuit(host)
+            circuit.failures = 0
+            circuit.opened_until = None
+            circuit.probing = False
+
+    def record_failure(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            circuit = self._circuit(host)
+            circuit.failures += 1
+            if circuit.probing or circuit.failures >= self.failure_threshold:
+                if circuit.opened_until is None or circuit.probing:
+                    circuit.trips += 1
+                circuit.opened_until = time.monotonic() + self.cooldown
+                circuit.probing = False
+
+    def hosts(self):
+        with self._lock:
+            return sorted(self._circuits.keys())
+
+    def is_open(self, host):
+        with self._lock:
+            return self._circuit(host).opened_until is not None
+
+    def trips(self, host):
+        """
+        :return: the number of times the circuit of a host has been opened.
+        """
+        with self._lock:
+            return self._circuit(host).trips
+
+
+def backoff_delay(attempt, base=0.5, cap=10):
+    """
+    Gives the time to wait before retrying a request, growing exponentially with the
+    number of attempts, with full jitter so that the retries of concurrent requests
+    do not hit the host at the same time.
+
+    :param attempt: the number of attempts made so far (1 after the first failure)
+    :param base: the delay in seconds the exponential backoff starts from
+    :param cap: the maximum delay in seconds
+    :return: the delay, in seconds.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def add_retry_arguments(parser):
+    """
+    Adds the retry and circuit breaker options to a command line parser.
+    """
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Number of times a request failing with a connection error, a timeout or a "
+                             "429/502/503/504 status is retried, with a jittered exponential backoff. "
+                             "Defaults to 2")
+    parser.add_argument("--retry-backoff", type=float, default=0.5,
+                        help="Number of seconds the backoff between two retries starts from, defaults to 0.5")
+    parser.add_argument("--breaker-threshold", type=int, default=3,
+                        help="Number of consecutive failed requests after which a host is not queried anymore "
+                             "until --breaker-cooldown is over, the checks against it being reported as "
+                             "HostUnavailableInconsistency. 0 disables it, defaults to 3")
+    parser.add_argument("--breaker-cooldown", type=int, default=60,
+                        help="Number of seconds a failing host is not queried, before being probed again. "
+                             "Defaults to 60")
+
+
+def circuit_breaker_from_args(args):
+    """
+    Builds the CircuitBreaker configured by the command line options.
+
+    :return: the CircuitBreaker, None if disabled.
+    """
+    if args.breaker_threshold <= 0:
+        return None
+    return CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
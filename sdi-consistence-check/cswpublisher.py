@@ -0,0 +1,145 @@
+import logging
+from collections import OrderedDict
+
+from cswrecords import parse_transaction_response, transaction_request
+from inconsistency import GsToGnUnableToCreateServiceMetadataInconsistency, \
+    GsToGnUnableToUpdateServiceMetadataInconsistency
+from transport import HttpTransport
+
+logger = logging.getLogger("cswpublisher")
+
+
+class CSWPublisher:
+    """
+    Class which inserts and updates records into a GeoNetwork catalogue through CSW-T.
+
+    The inserts and updates are queued, and sent by batches, several records per Transaction
+    request. A record updated several times before being sent (e.g. a service metadata getting
+    an operatesOn link per layer) is only sent once, in its last state. If a batch is rejected,
+    its records are sent again one by one, so that each failure is reported for the record causing
+    it. If a batch is only partly applied, only the records which were not are sent again: the
+    inserted ones are known from the InsertResult of the response, and updating a record again
+    is harmless.
+    """
+    def __init__(self, gn_url, workspace=None, transport=None, batch_size=20):
+        """
+        constructor.
+
+        :param gn_url: the GeoNetwork base URL
+        :param workspace: the workspace name the published service metadata describe, reported
+        in the inconsistencies
+        :param transport: the HttpTransport to issue the requests with
+        :param batch_size: the maximum number of records sent per Transaction request
+        """
+        self.gn_url = gn_url
+        self.csw_url = gn_url + "/srv/eng/csw-publication"
+        self.workspace = workspace
+        self.transport = transport or HttpTransport()
+        self.batch_size = max(1, batch_size)
+        auth = self.transport.authentication(gn_url)
+        self._auth = (auth.username, auth.password) if auth.username is not None else None
+        # the pending records, by identifier: ("insert" | "update", record)
+        self._pending = OrderedDict()
+        # the inconsistencies collected so far
+        self.errors = []
+        self.published = 0
+        self.transactions = 0
+
+    def insert(self, uuid, record):
+        """
+        Queues a record to be inserted.
+
+        :param uuid: the identifier of the record
+        :param record: the XML record
+        """
+        self._pending[uuid] = ("insert", record)
+        self._flush_if_full()
+
+    def update(self, uuid, record):
+        """
+        Queues a record to be updated. If the record is still pending, it is replaced.
+
+        :param uuid: the identifier of the record
+        :param record: the XML record
+        """
+        if uuid in self._pending:
+            self._pending[uuid] = (self._pending[uuid][0], record)
+        else:
+            self._pending[uuid] = ("update", record)
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Sends the pending records.
+
+        :return: the inconsistencies collected so far.
+        """
+        pending = list(self._pending.items())
+        self._pending.clear()
+        for i in range(0, len(pending), self.batch_size):
+            self._send(pending[i:i + self.batch_size])
+        return self.errors
+
+    def _send(self, batch):
+        inserts = [item for item in batch if item[1][0] == "insert"]
+        updates = [item for item in batch if item[1][0] == "update"]
+        try:
+            request = transaction_request([record for _, (_, record) in inserts],
+                                          [record for _, (_, record) in updates])
+            self.transactions += 1
+            resp = self.transport.post(self.csw_url, data=request, auth=self._auth,
+                                       headers={"Content-Type": "application/xml"})
+            resp.raise_for_status()
+            summary = parse_transaction_response(resp.content)
+        except Exception as e:
+            # the whole transaction has been rejected
+            if len(batch) > 1:
+                logger.warning("Transaction of %d records failed (%s), sending them one by one", len(batch), e)
+                for item in batch:
+                    self._send([item])
+            else:
+                self._report(batch[0], e)
+            return
+        not_applied = []
+        if summary.inserted == len(inserts):
+            self.published += len(inserts)
+        elif len(summary.identifiers) == summary.inserted:
+            not_applied += [item for item in inserts if item[0] not in summary.identifiers]
+            self.published += summary.inserted
+        else:
+            # the inserted records are unknown, they are not sent again not to insert them twice
+            for item in inserts:
+                self._report(item, Exception("%d records inserted out of %d, without their identifiers"
+                                             % (summary.inserted, len(inserts))))
+        if summary.updated == len(updates):
+            self.published += len(updates)
+        else:
+            not_applied += updates
+        if len(not_applied) == 0:
+            return
+        if len(batch) > 1:
+            logger.warning("Transaction of %d records partly applied, sending the %d others one by one",
+                           len(batch), len(not_applied))
+            for item in not_applied:
+                self._send([item])
+        else:
+            self._report(batch[0], Exception("record not saved by the catalogue"))
+
+    def _report(self, item, error):
+        """
+        Reports the failure of a record as an inconsistency.
+
+        :param item: the record, as a (identifier, (action, record)) tuple
+        :param error: the error met
+        """
+        logger.error(error)
+        (uuid, (action, _)) = item
+        if action == "insert":
+            self.errors.append(GsToGnUnableToCreateServiceMetadataInconsistency(self.workspace, self.gn_url, error))
+        else:
+            self.errors.append(GsToGnUnableToUpdateServiceMetadataInconsistency(self.workspace, uuid, self.gn_url,
+                                                                                error))
@@ -1,7 +1,10 @@
 import logging
+import queue
 import re
+import threading
+import time
 import warnings
-import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from urllib.parse import urlparse
 
@@ -11,8 +14,12 @@ from owslib.fes import PropertyIsEqualTo, Not, Or, And
 from owslib.util import ServiceException
 
 from credentials import Credentials
+from cswrecords import DC_ELEMENT_NAMES, NAMESPACES, getrecords_request, parse_getrecords_document, \
+    parse_getrecords_response
 from inconsistency import Inconsistency, GnToGsNoGetCapabilitiesUrl
 from owscheck import CachedOwsServices
+from transport import HttpTransport
+from utils import ordered_map
 
 
 class CSWQuerier:
@@ -24,21 +31,56 @@ class CSWQuerier:
     protocol_regexp = re.compile(r"^OGC:(?P<type>WMS|WFS)(?:-(?P<version>\d+(?:\.\d+)*)(?:-[\w-]+)?)?$", re.IGNORECASE)
 
     def __init__(self, url, credentials=Credentials(),
-                 cached_ows_services=None, logger=None, timeout=30):
-        (username, password) = credentials.getFromUrl(url)
+                 cached_ows_services=None, logger=None, timeout=30, transport=None, pages_in_flight=1,
+                 parse_pool=None):
+        """
+        constructor.
+
+        :param url: the CSW endpoint URL
+        :param credentials: the Credentials provider
+        :param cached_ows_services: the CachedOwsServices object used to check the layers
+        :param logger: an optional logger
+        :param timeout: timeout in seconds for the requests against the remote services
+        :param transport: the HttpTransport to issue the requests with
+        :param pages_in_flight: maximum number of result pages requested concurrently
+        :param parse_pool: an optional ProcessPoolExecutor the result pages are parsed in, instead
+        of being parsed as they are received
+        """
+        self.transport = transport or HttpTransport(credentials, timeout=timeout)
+        self.pages_in_flight = pages_in_flight
+        self.parse_pool = parse_pool
         if logger is not None:
             self.logger = logger
         else:
             self.logger = logging.getLogger("cswquerier")
             self.logger.addHandler(logging.NullHandler())
-        self.owsServices = cached_ows_services or CachedOwsServices(credentials=credentials, timeout=timeout)
+        self.owsServices = cached_ows_services or CachedOwsServices(credentials=credentials, timeout=timeout,
+                                                                    transport=self.transport)
         try:
-            self.csw = CatalogueServiceWeb(url, username=username, password=password)
+            start = time.perf_counter()
+            with self.transport.throttled(url):
+                self.csw = CatalogueServiceWeb(url, timeout=timeout, auth=self.transport.authentication(url))
+            self.transport.latencies.record(url, time.perf_counter() - start)
         except Exception as ex:
             raise ServiceException(ex)
+        self.getrecords_url = self._get_post_url("GetRecords") or url
+        # whether the server returns the records restricted to the DC_ELEMENT_NAMES elements
+        # if asked to, None until known.
+        self.element_names_supported = None
         self.mds_not_parsable = []
         self.reset()
 
+    def _get_post_url(self, operation):
+        """
+        Gives the URL to POST a request to, as advertised in the capabilities.
+        :return: the URL, None if the capabilities do not define one.
+        """
+        with suppress(Exception):
+            for method in self.csw.get_operation_by_name(operation).methods:
+                if method.get("type").lower() == "post":
+                    return method.get("url")
+        return None
+
     def reset(self):
         self.start = 0
         self.md_count = -1
@@ -59,6 +101,114 @@ class CSWQuerier:
         self.start += self.csw.results['returned']
         return self.csw.records
 
+    def get_dataset_record_pages(self, constraints=[]):
+        """
+        Gets all the dataset records, page by page, as Dublin Core records. Only the elements
+        the flexible checks need are requested, unless the server does not support it.
+        :param constraints: the constraint array to be passed to OWSLib getrecords2.
+        :return: a generator of hashmaps with UUID as key, the SlimRecord as value, one per page.
+        """
+        constraints = [And(constraints + [self.is_dataset])] if constraints else [self.is_dataset]
+        first = None
+        if self.element_names_supported is None:
+            try:
+                first = self._get_page(1, constraints=constraints, element_names=DC_ELEMENT_NAMES)
+                # some servers silently ignore the element names, and return records without identifier
+                self.element_names_supported = None not in first.records
+            except ServiceException as e:
+                self.logger.debug("GetRecords with ElementName not supported, falling back to the full "
+                                  "element set: %s", e)
+                self.element_names_supported = False
+            if not self.element_names_supported:
+                first = None
+        if self.element_names_supported:
+            return self._get_record_pages(first=first, constraints=constraints, element_names=DC_ELEMENT_NAMES)
+        return self._get_record_pages(constraints=constraints, esn='full')
+
+    def iter_dataset_records(self, constraints=[], buffer_size=100):
+        """
+        Gets all the dataset records, one by one. The pages are fetched (and parsed) by a
+        background thread, while the caller processes the records already received. The
+        thread waits whenever buffer_size records are pending, so that the memory used stays
+        bounded whatever the size of the catalogue.
+        :param constraints: the constraint array to be passed to OWSLib getrecords2.
+        :param buffer_size: the maximum number of records fetched but not consumed yet
+        :return: a generator of (UUID, record) tuples.
+        """
+        records = queue.Queue(maxsize=buffer_size)
+        end = object()
+
+        def produce():
+            try:
+                for page in self.get_dataset_record_pages(constraints):
+                    for uuid, md in page.items():
+                        records.put((uuid, md))
+                records.put(end)
+            except Exception as e:
+                records.put(e)
+
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            item = records.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _get_page(self, startposition, **kwargs):
+        """
+        Issues a GetRecords request through the transport, the response being parsed as it
+        is received into slim records (see cswrecords), or once received in the parsing
+        processes if any. Several pages can be fetched concurrently.
+        :param kwargs: the arguments to be passed to cswrecords.getrecords_request.
+        :return: a RecordsPage, holding the results counts and the records by UUID.
+        """
+        request = getrecords_request(startposition=startposition, maxrecords=self.max_records, **kwargs)
+        start = time.perf_counter()
+        size = 0
+
+        def chunks(resp):
+            nonlocal size
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                yield chunk
+
+        with self.transport.post(self.getrecords_url, data=request, stream=True,
+                                 headers={"Content-Type": "application/xml"}) as resp:
+            resp.raise_for_status()
+            if self.parse_pool is not None:
+                # only the slim records come back from the parsing process
+                page = self.parse_pool.submit(parse_getrecords_document, b"".join(chunks(resp))).result()
+            else:
+                page = parse_getrecords_response(chunks(resp))
+        self.transport.latencies.record(self.getrecords_url, time.perf_counter() - start, size)
+        self.logger.debug("CSWQuerier.get_records() results : %s (start=%s, max=%s)",
+                          page.results, startposition, self.max_records)
+        return page
+
+    def _get_record_pages(self, first=None, **kwargs):
+        """
+        Gets all the pages of records matching a GetRecords request. The first page gives
+        the number of matching records, the next ones are then requested concurrently (at most
+        pages_in_flight at a time).
+        :param first: the first page, if already fetched
+        :param kwargs: the arguments to be passed to cswrecords.getrecords_request.
+        :return: a generator of hashmaps with UUID as key, the record as value, one per page,
+        ordered by start position.
+        """
+        first = first or self._get_page(1, **kwargs)
+        yield first.records
+        # the server may return less records than asked for
+        page_size = first.results['returned']
+        if page_size == 0:
+            return
+        startpositions = range(1 + page_size, first.results['matches'] + 1, page_size)
+        with ThreadPoolExecutor(max_workers=max(1, self.pages_in_flight)) as executor:
+            for page in ordered_map(executor, lambda startposition: self._get_page(startposition, **kwargs),
+                                    startpositions, self.pages_in_flight):
+                yield page.records
+
     def get_md(self, uuid):
         return self.csw.records[uuid]
 
@@ -89,42 +239,63 @@ class CSWQuerier:
         """
         Gets all records, also managing the pagination against the remote CSW server.
         :param constraint: the constraint array to be passed to OWSLib getrecords2.
-        :return: a hashmap with UUID as key, the parsed metadata as value.
+        :return: a hashmap with UUID as key, the SlimRecord (ISO19139) as value.
         """
-        startpos = 0
         mds = {}
-        while True:
-            self.csw.getrecords2(
-                constraints,
-                esn='full',
-                outputschema=namespaces['gmd'],
-                startposition=startpos,
-                maxrecords=self.max_records,
-            )
-            for uuid in self.csw.records:
-                mds[uuid] = self.csw.records[uuid]
-            startpos = len(mds) + 1
-            if startpos > self.csw.results['matches']:
-                break
+        for records in self._get_record_pages(constraints=constraints, esn='full',
+                                              outputschema=NAMESPACES['gmd']):
+            mds.update(records)
         return mds
 
+    def get_record_xml(self, uuid):
+        """
+        Gets the whole ISO19139 document of a record, e.g. to update it.
+        :param uuid: the record identifier
+        :return: the XML document as bytes, None if the record is not found.
+        """
+        with self.transport.throttled(self.csw.url):
+            self.csw.getrecordbyid(id=[uuid], outputschema=NAMESPACES['gmd'])
+        record = self.csw.records.get(uuid)
+        return record.xml if record is not None else None
+
+    @staticmethod
+    def get_change_date(md):
+        """
+        Gives the last change date of a record.
+
+        :param md: the SlimRecord, either a ISO19139 or a Dublin Core one
+        :return: the dateStamp / modified date, None if unknown.
+        """
+        return getattr(md, "datestamp", None) or getattr(md, "modified", None)
+
+    @staticmethod
+    def get_capabilities_url(mds):
+        """
+        Gives the GetCapabilities URL declared by a service metadata.
+
+        :param mds: the service metadata SlimRecord
+        :return: a tuple (url, protocol), (None, None) if no GetCapabilities operation is defined.
+        """
+        url = protocol = None
+        for op in mds.operations:
+            if op['name'] == "GetCapabilities":
+                url = op['url']
+                protocol = op['protocol']
+        return (url, protocol)
+
     def check_service_md(self, mds, mdd, geoserver_to_check=[]):
         warnings.simplefilter("ignore")
 
         # check if this is an interesting service md (contains "coupledResource" or "operatesOn" tag)
-        if len(mds.serviceidentification.operateson) == 0:
+        if len(mds.operateson) == 0:
             # raise error ?
             return
 
-        self.logger.info("\nData metadata: uuid %s \"%s\"", mdd.identifier, mdd.identification.title)
-        self.logger.info("Service metadata: uuid %s \"%s\"", mds.identifier, mds.identification.title)
+        self.logger.info("\nData metadata: uuid %s \"%s\"", mdd.identifier, mdd.title)
+        self.logger.info("Service metadata: uuid %s \"%s\"", mds.identifier, mds.title)
 
         # retrieve geoserver base URL (getCapabilities)
-        url = None
-        for op in mds.serviceidentification.operations:
-            if op['name'] == "GetCapabilities":
-                url = op['connectpoint'][0].url
-                protocol = op['connectpoint'][0].protocol
+        (url, protocol) = self.get_capabilities_url(mds)
 
         if url is None:
             raise GnToGsNoGetCapabilitiesUrl(mds.identifier, mdd.identifier)
@@ -147,18 +318,10 @@ class CSWQuerier:
         version = matches.group("version")
         self.logger.debug("Server Type: %s Version: %s URL: %s" % (type, version, url))
 
-        root = ET.fromstring(mds.xml.decode())
-        xpath = ".//{http://www.isotc211.org/2005/srv}coupledResource"
-        # xpath = ".//{http://www.isotc211.org/2005/srv}operatesOn"
-        res = root.findall(xpath)
-        for r in res:
-            operation_name = identifier = layer_name = None
-            with suppress(AttributeError):
-                operation_name = r.find(
-                    ".//{http://www.isotc211.org/2005/srv}operationName/{http://www.isotc211.org/2005/gco}CharacterString").text
-                identifier = r.find(
-                    ".//{http://www.isotc211.org/2005/srv}identifier/{http://www.isotc211.org/2005/gco}CharacterString").text
-                layer_name = r.find(".//{http://www.isotc211.org/2005/gco}ScopedName").text
+        for r in mds.coupledresources:
+            operation_name = r['operation']
+            identifier = r['identifier']
+            layer_name = r['layer']
             if identifier is not None and layer_name is not None:
                 self.logger.debug("\tcoupledRessources:")
                 self.logger.debug("\tOperation : %s" % operation_name)
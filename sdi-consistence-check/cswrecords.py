@@ -0,0 +1,246 @@
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, namedtuple
+
+from owslib import fes
+from owslib.etree import etree
+from owslib.util import ServiceException
+
+NAMESPACES = {
+    "csw": "http://www.opengis.net/cat/csw/2.0.2",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dct": "http://purl.org/dc/terms/",
+    "gco": "http://www.isotc211.org/2005/gco",
+    "gmd": "http://www.isotc211.org/2005/gmd",
+    "ows": "http://www.opengis.net/ows",
+    "srv": "http://www.isotc211.org/2005/srv",
+}
+
+# the Dublin Core elements the flexible checks need
+DC_ELEMENT_NAMES = ["dc:identifier", "dc:title", "dct:modified", "dc:URI"]
+
+RecordsPage = namedtuple("RecordsPage", ["results", "records"])
+
+TransactionSummary = namedtuple("TransactionSummary", ["inserted", "updated", "identifiers"])
+
+
+def _ns(path):
+    """
+    Expands the prefixes of a path, e.g. 'gmd:fileIdentifier' into '{http://...}fileIdentifier'.
+    """
+    return "/".join("{%s}%s" % (NAMESPACES[step.split(":")[0]], step.split(":")[1]) if ":" in step else step
+                    for step in path.split("/"))
+
+
+def _text(elem, path):
+    found = elem.find(_ns(path))
+    if found is None or found.text is None:
+        return None
+    return found.text.strip()
+
+
+class SlimRecord:
+    """
+    Class which holds the few fields of a catalogue record the checks need: identifier,
+    title and change date for every record, the online resources for Dublin Core records,
+    the operatesOn, operations and coupled resources for ISO19139 service records.
+    """
+    __slots__ = ["identifier", "title", "modified", "datestamp", "uris", "operateson", "operations",
+                 "coupledresources"]
+
+    def __init__(self, identifier=None, title=None, modified=None, datestamp=None):
+        self.identifier = identifier
+        self.title = title
+        self.modified = modified
+        self.datestamp = datestamp
+        # list of dictionaries with protocol, url, name and description keys: the online
+        # resources of the record (of its distribution, for ISO19139 records)
+        self.uris = []
+        # list of the uuidref of the data metadata a service metadata operates on
+        self.operateson = []
+        # list of dictionaries with name, url and protocol keys
+        self.operations = []
+        # list of dictionaries with operation, identifier and layer keys
+        self.coupledresources = []
+
+    @classmethod
+    def from_dc(cls, elem):
+        record = cls(_text(elem, "dc:identifier"), _text(elem, "dc:title"), modified=_text(elem, "dct:modified"))
+        for uri in elem.findall(_ns("dc:URI")):
+            record.uris.append({"protocol": uri.get("protocol"), "name": uri.get("name"),
+                                "description": uri.get("description"),
+                                "url": uri.text.strip() if uri.text is not None else None})
+        return record
+
+    @classmethod
+    def from_iso(cls, elem):
+        datestamp = _text(elem, "gmd:dateStamp/gco:DateTime") or _text(elem, "gmd:dateStamp/gco:Date")
+        title = _text(elem, "gmd:identificationInfo/*/gmd:citation/gmd:CI_Citation/gmd:title/gco:CharacterString")
+        record = cls(_text(elem, "gmd:fileIdentifier/gco:CharacterString"), title, datestamp=datestamp)
+        for online in elem.findall(_ns("gmd:distributionInfo/gmd:MD_Distribution/gmd:transferOptions/"
+                                       "gmd:MD_DigitalTransferOptions/gmd:onLine/gmd:CI_OnlineResource")):
+            record.uris.append({"protocol": _text(online, "gmd:protocol/gco:CharacterString"),
+                                "name": _text(online, "gmd:name/gco:CharacterString"),
+                                "description": _text(online, "gmd:description/gco:CharacterString"),
+                                "url": _text(online, "gmd:linkage/gmd:URL")})
+        service = elem.find(_ns("gmd:identificationInfo/srv:SV_ServiceIdentification"))
+        if service is None:
+            return record
+        for oon in service.findall(_ns("srv:operatesOn")):
+            if oon.get("uuidref") is not None:
+                record.operateson.append(oon.get("uuidref"))
+        for op in service.findall(_ns("srv:containsOperations/srv:SV_OperationMetadata")):
+            online = op.find(_ns("srv:connectPoint/gmd:CI_OnlineResource"))
+            record.operations.append({
+                "name": _text(op, "srv:operationName/gco:CharacterString"),
+                "url": _text(online, "gmd:linkage/gmd:URL") if online is not None else None,
+                "protocol": _text(online, "gmd:protocol/gco:CharacterString") if online is not None else None})
+        for res in service.findall(_ns("srv:coupledResource/srv:SV_CoupledResource")):
+            record.coupledresources.append({"operation": _text(res, "srv:operationName/gco:CharacterString"),
+                                            "identifier": _text(res, "srv:identifier/gco:CharacterString"),
+                                            "layer": _text(res, "gco:ScopedName")})
+        return record
+
+
+def getrecords_request(constraints, startposition, maxrecords, outputschema=NAMESPACES["csw"],
+                       esn="full", element_names=None):
+    """
+    Builds a GetRecords request, the way owslib does.
+
+    :param constraints: the list of constraints (owslib.fes expressions)
+    :param startposition: the position of the first record to return
+    :param maxrecords: the maximum number of records to return
+    :param outputschema: the output schema (Dublin Core or ISO19139 namespace)
+    :param esn: the element set name ('brief', 'summary' or 'full')
+    :param element_names: the names of the elements to return, which takes precedence over
+    the element set name if given
+    :return: the request, as bytes.
+    """
+    # the prefixes used in the typeNames and ElementName values have to be declared
+    if hasattr(etree, "LXML_VERSION"):
+        root = etree.Element(_ns("csw:GetRecords"), nsmap=NAMESPACES)
+    else:
+        # xml.etree, owslib falling back onto it when lxml is not available
+        root = etree.Element(_ns("csw:GetRecords"))
+        for prefix, uri in NAMESPACES.items():
+            root.set("xmlns:%s" % prefix, uri)
+    root.set("service", "CSW")
+    root.set("version", "2.0.2")
+    root.set("resultType", "results")
+    root.set("outputSchema", outputschema)
+    root.set("outputFormat", "application/xml")
+    if startposition > 0:
+        root.set("startPosition", str(startposition))
+    root.set("maxRecords", str(maxrecords))
+    query = etree.SubElement(root, _ns("csw:Query"))
+    query.set("typeNames", "gmd:MD_Metadata" if outputschema == NAMESPACES["gmd"] else "csw:Record")
+    if element_names is not None:
+        for name in element_names:
+            etree.SubElement(query, _ns("csw:ElementName")).text = name
+    else:
+        etree.SubElement(query, _ns("csw:ElementSetName")).text = esn
+    if len(constraints) > 0:
+        constraint = etree.SubElement(query, _ns("csw:Constraint"))
+        constraint.set("version", "1.1.0")
+        constraint.append(fes.FilterRequest().setConstraintList(constraints))
+    return etree.tostring(root)
+
+
+def transaction_request(inserts=[], updates=[]):
+    """
+    Builds a CSW-T Transaction request carrying several records, all the inserted ones
+    in a single Insert action, and each updated one in its own Update action.
+
+    :param inserts: the ISO19139 records to insert, as XML strings or bytes
+    :param updates: the ISO19139 records to update (replacing the records with the same
+    fileIdentifier), as XML strings or bytes
+    :return: the request, as bytes.
+    """
+    def parse(record):
+        return etree.fromstring(record.encode("utf-8") if isinstance(record, str) else record)
+
+    root = etree.Element(_ns("csw:Transaction"))
+    root.set("service", "CSW")
+    root.set("version", "2.0.2")
+    if len(inserts) > 0:
+        insert = etree.SubElement(root, _ns("csw:Insert"))
+        insert.set("typeName", "gmd:MD_Metadata")
+        for record in inserts:
+            insert.append(parse(record))
+    for record in updates:
+        etree.SubElement(root, _ns("csw:Update")).append(parse(record))
+    return etree.tostring(root)
+
+
+def parse_transaction_response(content):
+    """
+    Parses a CSW-T Transaction response.
+
+    :param content: the response body, as bytes
+    :return: a TransactionSummary, holding the inserted and updated counts, and the identifiers
+    of the inserted records.
+    :raise ServiceException: if the server answered with an exception report.
+    """
+    root = ET.fromstring(content)
+    if root.tag == _ns("ows:ExceptionReport"):
+        raise ServiceException(" ".join(t.strip() for t in root.itertext() if t.strip() != ""))
+    summary = root.find(_ns("csw:TransactionSummary"))
+    if summary is None:
+        raise ServiceException("Invalid Transaction response, no TransactionSummary found")
+    identifiers = [e.text.strip() for e in root.iterfind(_ns("csw:InsertResult/csw:BriefRecord/dc:identifier"))
+                   if e.text is not None]
+    return TransactionSummary(int(_text(summary, "csw:totalInserted") or 0),
+                              int(_text(summary, "csw:totalUpdated") or 0), identifiers)
+
+
+def parse_getrecords_response(chunks):
+    """
+    Parses a GetRecords response incrementally, as it is received, each record being
+    turned into a SlimRecord and freed as soon as it has been read.
+
+    :param chunks: the response body, as an iterable of bytes chunks
+    :return: a RecordsPage, whose results hold the matches, returned and nextrecord counts,
+    and records the SlimRecord objects by identifier.
+    :raise ServiceException: if the server answered with an exception report.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    results = {}
+    records = OrderedDict()
+    search_results = None
+    exception = None
+    record_tags = {_ns("csw:Record"): SlimRecord.from_dc, _ns("csw:SummaryRecord"): SlimRecord.from_dc,
+                   _ns("csw:BriefRecord"): SlimRecord.from_dc, _ns("gmd:MD_Metadata"): SlimRecord.from_iso}
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                if elem.tag == _ns("csw:SearchResults"):
+                    search_results = elem
+                    results["matches"] = int(elem.get("numberOfRecordsMatched", 0))
+                    results["returned"] = int(elem.get("numberOfRecordsReturned", 0))
+                    results["nextrecord"] = int(elem.get("nextRecord")) if elem.get("nextRecord") else None
+                elif elem.tag == _ns("ows:ExceptionReport"):
+                    exception = elem
+                continue
+            if search_results is not None and elem.tag in record_tags:
+                record = record_tags[elem.tag](elem)
+                records[record.identifier] = record
+                elem.clear()
+                if elem in search_results:
+                    search_results.remove(elem)
+    parser.close()
+    if exception is not None:
+        raise ServiceException(" ".join(t.strip() for t in exception.itertext() if t.strip() != ""))
+    if search_results is None:
+        raise ServiceException("Invalid GetRecords response, no SearchResults found")
+    return RecordsPage(results, records)
+
+
+def parse_getrecords_document(document):
+    """
+    Parses a GetRecords response already downloaded, e.g. in a parsing process (see
+    parse_getrecords_response).
+
+    :param document: the response body, as bytes
+    :return: a RecordsPage.
+    """
+    return parse_getrecords_response([document])
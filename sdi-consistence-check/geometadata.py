@@ -1,23 +1,61 @@
+import threading
+
 from owslib.etree import etree
 from owslib.iso import MD_Metadata
-from owslib.util import openURL
 from requests import HTTPError
 
+from circuitbreaker import HostUnavailableError
 from credentials import Credentials
-from inconsistency import GsToGnMetadataInvalidInconsistency
+from cswrecords import SlimRecord
+from inconsistency import GsToGnMetadataInvalidInconsistency, HostUnavailableInconsistency
+from transport import HttpTransport
+from utils import canonical_url
+
+
+def parse_iso_metadata(content):
+    """
+    Parses an ISO19139 metadata document with owslib, e.g. in a parsing process. Only the
+    slim record of the metadata is returned, the owslib object being neither compact nor
+    picklable.
+
+    :param content: the metadata document, as bytes
+    :return: a tuple (SlimRecord, None) if the metadata could be parsed, (None, error message)
+    otherwise.
+    """
+    try:
+        root = etree.fromstring(content)
+        MD_Metadata(root)
+        return (SlimRecord.from_iso(root), None)
+    except Exception as e:
+        return (None, str(e))
 
 
 class GeoMetadata:
 
-    def __init__(self, mdUrl, mdFormat, creds = Credentials()):
+    def __init__(self, mdUrl, mdFormat, creds = Credentials(), transport=None, parse_pool=None):
+        """
+        constructor, fetches and parses the metadata.
+
+        :param mdUrl: the metadata URL
+        :param mdFormat: the metadata format, only 'text/xml' metadata being parsed
+        :param creds: the Credentials provider
+        :param transport: the HttpTransport to issue the request with
+        :param parse_pool: an optional ProcessPoolExecutor the metadata is parsed in, in which
+        case the metadata is only kept as a SlimRecord
+        """
         self.md = None
         self.errorMsg = None
+        transport = transport or HttpTransport(creds)
         try:
-            (username, password) = creds.getFromUrl(mdUrl)
-            rawMd = openURL(mdUrl, username=username, password=password)
-            content = rawMd.read()
-            if mdFormat == "text/xml":
+            rawMd = transport.get(mdUrl)
+            rawMd.raise_for_status()
+            content = rawMd.content
+            if mdFormat == "text/xml" and parse_pool is not None:
+                (self.md, self.errorMsg) = parse_pool.submit(parse_iso_metadata, content).result()
+            elif mdFormat == "text/xml":
                 self.md = MD_Metadata(etree.fromstring(content))
+        except HostUnavailableError as e:
+            raise HostUnavailableInconsistency(mdUrl, e.host)
         except HTTPError as e:
             raise GsToGnMetadataInvalidInconsistency(mdUrl,
                                                "'%s' Metadata not found (HTTP %s): %s"
@@ -25,6 +63,65 @@ class GeoMetadata:
         except Exception as e:
             raise GsToGnMetadataInvalidInconsistency(mdUrl,
                                                "Unable to parse the %s metadata: %s" % (mdFormat, str(e)))
+        if self.errorMsg is not None:
+            raise GsToGnMetadataInvalidInconsistency(mdUrl,
+                                               "Unable to parse the %s metadata: %s" % (mdFormat, self.errorMsg))
 
     def getMetadata(self):
         return self.md
+
+
+class MetadataCache:
+    """
+    Class which keeps the outcome of the metadata fetched during a run, keyed by canonical
+    URL, so that a metadata referenced by several layers is only downloaded and parsed once.
+    Only the outcome of the checks is kept, not the metadata itself: None if the metadata is
+    valid, the message of the GsToGnMetadataInvalidInconsistency otherwise.
+    """
+    def __init__(self):
+        self._outcomes = {}
+        # guards the cache, and makes sure a metadata is fetched only once when checks run concurrently
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self.fetches_saved = 0
+
+    def get(self, mdUrl, mdFormat, creds=Credentials(), transport=None, parse_pool=None):
+        """
+        Checks the metadata at the given URL, fetching it if not done yet (see GeoMetadata
+        for the parameters).
+
+        :raise GsToGnMetadataInvalidInconsistency: if the metadata is invalid, a new error being
+        raised on each call, so that the caller can bind it to its layer.
+        """
+        key = (canonical_url(mdUrl), mdFormat)
+        with self._lock:
+            loaded = key in self._outcomes
+            if loaded:
+                self.fetches_saved += 1
+            else:
+                loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+        if not loaded:
+            with loading_lock:
+                with self._lock:
+                    loaded = key in self._outcomes
+                    if loaded:
+                        self.fetches_saved += 1
+                if not loaded:
+                    try:
+                        GeoMetadata(mdUrl, mdFormat, creds=creds, transport=transport, parse_pool=parse_pool)
+                        outcome = None
+                    except GsToGnMetadataInvalidInconsistency as e:
+                        outcome = e.message
+                    except Exception:
+                        # not recorded (e.g. host unavailable), the next callers try again
+                        with self._lock:
+                            self._loading_locks.pop(key, None)
+                        raise
+                    with self._lock:
+                        self._outcomes[key] = outcome
+                        # the next callers find the outcome, the lock is not needed anymore
+                        self._loading_locks.pop(key, None)
+        with self._lock:
+            message = self._outcomes[key]
+        if message is not None:
+            raise GsToGnMetadataInvalidInconsistency(mdUrl, message)
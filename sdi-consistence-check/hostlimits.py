@@ -0,0 +1,33 @@
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class HostLimiter:
+    """
+    Class which caps the number of requests issued concurrently against a given host,
+    whatever the number of threads issuing them.
+    """
+    def __init__(self, max_per_host=2):
+        """
+        constructor.
+
+        :param max_per_host (int): maximum number of requests in flight per host
+        """
+        self.max_per_host = max(1, max_per_host)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    @contextmanager
+    def slot(self, url):
+        """
+        Waits for a request slot against the host of an URL to be available, and holds
+        it until the end of the with block.
+
+        :param url: the URL about to be queried
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            yield
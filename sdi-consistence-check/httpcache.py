@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+CachedResponse = namedtuple("CachedResponse", ["etag", "last_modified", "body"])
+
+
+class HttpCache:
+    """
+    Class which stores downloaded documents on disk (in a SQLite database), along with
+    their ETag and Last-Modified validators, so that they can be revalidated with a
+    conditional request by subsequent runs instead of being downloaded again.
+    """
+    def __init__(self, cache_dir):
+        """
+        constructor.
+
+        :param cache_dir (string): the directory where the cache database is stored,
+        created if missing.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, "http-cache.sqlite"), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                             "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB, stored_at REAL)")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        """
+        Gets a cached document.
+
+        :param url: the URL the document has been downloaded from
+        :return: a CachedResponse, None if the URL is not in cache.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified, body FROM responses WHERE url = ?",
+                                   (url,)).fetchone()
+        return CachedResponse(*row) if row is not None else None
+
+    def put(self, url, etag, last_modified, body):
+        """
+        Stores a document. Documents without any validator are not stored, since they
+        could not be revalidated.
+
+        :param url: the URL the document has been downloaded from
+        :param etag: the ETag response header
+        :param last_modified: the Last-Modified response header
+        :param body: the document, as bytes
+        """
+        if etag is None and last_modified is None:
+            return
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses (url, etag, last_modified, body, stored_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (url, etag, last_modified, body, time.time()))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,7 +1,15 @@
+import copyreg
+
+
 class Inconsistency(Exception):
     def fix(self):
         raise NotImplementedError('Not implemented')
 
+    def __reduce__(self):
+        # the subclasses do not pass their fields to Exception, hence they are copied
+        # (and pickled) through their attributes, not rebuilt from the Exception args
+        return (copyreg.__newobj__, (type(self),), self.__dict__)
+
 
 # Scenario 0: unable to parse the GetCapabilities
 class UnparseableGetCapabilitiesInconsistency(Inconsistency):
@@ -161,4 +169,38 @@ class GsToGnUnableToUpdateServiceMetadataInconsistency(Inconsistency):
 
     def __str__(self):
         return "Unable to update the service metadata (uuid: %s) for workspace \"%s\" into %s: %s" % (self.mds_uuid,
-            self.workspace, self.catalogue_url, self.caused_by)
\ No newline at end of file
+            self.workspace, self.catalogue_url, self.caused_by)
+
+# Any scenario: check skipped because the host it targets keeps failing
+class HostUnavailableInconsistency(Inconsistency):
+    """
+    Class which traces the checks not run because the host they target failed several
+    times in a row, and is not queried anymore until a cooldown is over (circuit breaker).
+    """
+    def __init__(self, url, host, layer_name=None, md_uuid=None):
+        self.url = url
+        self.host = host
+        self.layer_name = layer_name
+        self.md_uuid = md_uuid
+
+    def set_md_uuid(self, uuid):
+        self.md_uuid = uuid
+
+    def __str__(self):
+        return "Host %s unavailable after repeated failures, %s not queried (layer '%s', metadata %s)" \
+               % (self.host, self.url, self.layer_name, self.md_uuid)
+
+
+# Incremental mode: inconsistency reported by a previous run
+class CarriedOverInconsistency(Inconsistency):
+    """
+    Class which replays an inconsistency found by a previous run onto a metadata
+    which did not change since then (incremental mode).
+    """
+    def __init__(self, md_uuid, type_name, message):
+        self.md_uuid = md_uuid
+        self.type_name = type_name
+        self.message = message
+
+    def __str__(self):
+        return self.message
@@ -0,0 +1,62 @@
+import math
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+
+class LatencyStats:
+    """
+    Class which gathers the duration (and size) of the requests issued against the remote
+    services, per host, in order to report latency percentiles at the end of a run.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+        self._bytes = defaultdict(int)
+
+    def record(self, url, seconds, size=0):
+        """
+        Records the duration of a request.
+
+        :param url: the URL queried
+        :param seconds: the time the request took
+        :param size: the number of bytes received, if known
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            self._samples[host].append(seconds)
+            self._bytes[host] += size
+
+    def hosts(self):
+        with self._lock:
+            return sorted(self._samples.keys())
+
+    def count(self, host):
+        with self._lock:
+            return len(self._samples.get(host, []))
+
+    def total(self, host):
+        """
+        :return: the cumulated duration of the requests made to the host, in seconds.
+        """
+        with self._lock:
+            return sum(self._samples.get(host, []))
+
+    def bytes_received(self, host):
+        with self._lock:
+            return self._bytes.get(host, 0)
+
+    def percentile(self, host, percent):
+        """
+        Computes a latency percentile (nearest-rank method).
+
+        :param host: the host, as host[:port]
+        :param percent: the percentile to compute, between 0 and 100
+        :return: the duration in seconds, None if no request has been made to the host.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(host, []))
+        if len(samples) == 0:
+            return None
+        rank = max(1, int(math.ceil(percent * len(samples) / 100.0)))
+        return samples[rank - 1]
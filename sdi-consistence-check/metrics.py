@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import Counter
+
+from checkstate import inconsistency_type
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricsExporter:
+    """
+    Class which writes the metrics of a checker run in the Prometheus text format, e.g.
+    for the textfile collector of the Prometheus node exporter. The file is written at the
+    end of the run, and optionally every few seconds during it; it is replaced atomically,
+    so that a scraper never reads a partial file.
+
+    The outcome of the checks is exported for each target added, labelled with its mode
+    (and its name in batch mode).
+    """
+    def __init__(self, output_file, transport, http_cache=None, ows_services=None, metadata_cache=None,
+                 interval=0):
+        """
+        constructor.
+
+        :param output_file (string): the metrics file to be written
+        :param transport (HttpTransport): the transport, for the requests statistics
+        :param http_cache (HttpCache): the on-disk cache, if any
+        :param ows_services (CachedOwsServices): the GetCapabilities cache used in CSW mode, if any
+        :param metadata_cache (MetadataCache): the metadata cache used in WMS / WFS modes, if any
+        :param interval (int): number of seconds between two writes during the run, 0 to only
+        write the metrics at the end of the run
+        """
+        self.output_file = output_file
+        self.transport = transport
+        self.http_cache = http_cache
+        self.ows_services = ows_services
+        self.metadata_cache = metadata_cache
+        self.interval = interval
+        self._targets = []
+        self._start = time.time()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add_target(self, mode, results, state=None, name=None):
+        """
+        Adds a target whose checks are to be exported.
+
+        :param mode (string): the checker mode ('WMS', 'WFS' or 'CSW'), exported as a label
+        :param results (ResultStore): the outcome of the checks
+        :param state (CheckState): the incremental CSW mode state, if any
+        :param name (string): the name of the target in batch mode, exported as a label
+        """
+        self._targets.append((mode, results, state, name))
+
+    def start(self):
+        """
+        Starts writing the metrics periodically, if an interval has been given.
+        """
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        """
+        Stops the periodic writes, and writes the final metrics.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
+
+    def write(self):
+        tmp_file = self.output_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_file, self.output_file)
+
+    def render(self):
+        """
+        :return: the metrics, in the Prometheus text exposition format.
+        """
+        lines = []
+        targets = list(self._targets)
+        if any(name is not None for (_, _, _, name) in targets):
+            run_mode = "batch"
+        else:
+            run_mode = targets[0][0] if len(targets) > 0 else ""
+
+        def labels(mode, name, **extra):
+            values = ([("target", name)] if name is not None else []) + [("mode", mode)] + sorted(extra.items())
+            return "{%s}" % ",".join('%s="%s"' % (key, _escape(value)) for (key, value) in values)
+
+        def metric(name, metric_type, help, samples):
+            # unlike OpenMetrics, the Prometheus text format names the counters after their samples
+            family = name + "_total" if metric_type == "counter" else name
+            lines.append("# HELP %s %s" % (family, help))
+            lines.append("# TYPE %s %s" % (family, metric_type))
+            for (suffix, labels, value) in samples:
+                lines.append("%s%s%s %s" % (name, suffix, labels, value))
+
+        metric("sdichecker_run_duration_seconds", "gauge", "Time elapsed since the beginning of the run.",
+               [("", '{mode="%s"}' % _escape(run_mode), "%.3f" % (time.time() - self._start))])
+        metric("sdichecker_items_checked", "counter", "Number of layers or metadata checked.",
+               [("_total", labels(mode, name), len(results)) for (mode, results, _, name) in targets])
+        metric("sdichecker_items_in_error", "counter", "Number of layers or metadata having inconsistencies.",
+               [("_total", labels(mode, name), results.count_in_error()) for (mode, results, _, name) in targets])
+        samples = []
+        for (mode, results, _, name) in targets:
+            by_type = Counter(inconsistency_type(error) for error in list(results.errors()))
+            samples.extend(("_total", labels(mode, name, type=type_name), count)
+                           for type_name, count in sorted(by_type.items()))
+        metric("sdichecker_inconsistencies", "counter", "Number of inconsistencies found, by class.", samples)
+
+        latencies = self.transport.latencies
+        hosts = latencies.hosts()
+        metric("sdichecker_http_requests", "counter", "Number of HTTP requests issued, by host.",
+               [("_total", '{host="%s"}' % _escape(host), latencies.count(host)) for host in hosts])
+        metric("sdichecker_http_received_bytes", "counter", "Number of bytes received, by host.",
+               [("_total", '{host="%s"}' % _escape(host), latencies.bytes_received(host)) for host in hosts])
+        samples = []
+        for host in hosts:
+            for quantile in (50, 95, 99):
+                samples.append(("", '{host="%s",quantile="%s"}' % (_escape(host), quantile / 100.0),
+                                "%.6f" % latencies.percentile(host, quantile)))
+            samples.append(("_sum", '{host="%s"}' % _escape(host), "%.6f" % latencies.total(host)))
+            samples.append(("_count", '{host="%s"}' % _escape(host), latencies.count(host)))
+        metric("sdichecker_http_request_duration_seconds", "summary", "Duration of the HTTP requests, by host.",
+               samples)
+
+        metric("sdichecker_http_retries", "counter", "Number of HTTP requests retried after a transient failure, "
+                                                     "by host.",
+               [("_total", '{host="%s"}' % _escape(host), count)
+                for host, count in sorted(self.transport.retries_by_host().items())])
+        circuit_breaker = self.transport.circuit_breaker
+        if circuit_breaker is not None:
+            breaker_hosts = circuit_breaker.hosts()
+            metric("sdichecker_circuit_breaker_trips", "counter", "Number of times a host has stopped being queried "
+                                                                  "after repeated failures.",
+                   [("_total", '{host="%s"}' % _escape(host), circuit_breaker.trips(host)) for host in breaker_hosts])
+            metric("sdichecker_circuit_breaker_open", "gauge", "Whether a host is currently not queried (1) or "
+                                                               "not (0).",
+                   [("", '{host="%s"}' % _escape(host), int(circuit_breaker.is_open(host))) for host in breaker_hosts])
+
+        rate_limiter = self.transport.rate_limiter
+        if rate_limiter is not None:
+            limited_hosts = rate_limiter.hosts()
+            metric("sdichecker_rate_limit_backoffs", "counter", "Number of times the request rate against a host "
+                                                                "has been lowered.",
+                   [("_total", '{host="%s"}' % _escape(host), rate_limiter.backoffs(host)) for host in limited_hosts])
+            metric("sdichecker_rate_limit_requests_per_second", "gauge", "Current request rate allowed against a "
+                                                                         "host.",
+                   [("", '{host="%s"}' % _escape(host), "%.3f" % rate_limiter.rate(host)) for host in limited_hosts])
+
+        if self.http_cache is not None:
+            lookups = self.http_cache.hits + self.http_cache.misses
+            metric("sdichecker_http_cache_hits", "counter", "Number of documents revalidated from the on-disk cache.",
+                   [("_total", "", self.http_cache.hits)])
+            metric("sdichecker_http_cache_misses", "counter", "Number of documents downloaded in full.",
+                   [("_total", "", self.http_cache.misses)])
+            metric("sdichecker_http_cache_hit_ratio", "gauge", "Ratio of the documents revalidated from the "
+                                                               "on-disk cache.",
+                   [("", "", "%.4f" % (self.http_cache.hits / lookups if lookups > 0 else 0))])
+        if self.ows_services is not None and any(mode == "CSW" for (mode, _, _, _) in targets):
+            metric("sdichecker_capabilities_fetches_saved", "counter", "Number of GetCapabilities downloads "
+                                                                       "saved by URL canonicalization.",
+                   [("_total", "", self.ows_services.fetches_saved)])
+            metric("sdichecker_capabilities_failures_replayed", "counter", "Number of service failures replayed "
+                                                                           "from the negative cache.",
+                   [("_total", "", self.ows_services.failures_replayed)])
+        if self.metadata_cache is not None and any(mode != "CSW" for (mode, _, _, _) in targets):
+            metric("sdichecker_metadata_fetches_saved", "counter", "Number of metadata downloads saved, the "
+                                                                   "metadata being shared by several layers.",
+                   [("_total", "", self.metadata_cache.fetches_saved)])
+        states = [(mode, state, name) for (mode, _, state, name) in targets if state is not None]
+        if len(states) > 0:
+            metric("sdichecker_records_carried_over", "counter", "Number of metadata unchanged since the previous "
+                                                                 "run, whose outcome has been carried over.",
+                   [("_total", labels(mode, name) if name is not None else "", state.carried_over)
+                    for (mode, state, name) in states])
+        return "\n".join(lines) + "\n"
@@ -1,42 +1,92 @@
+import copy
+import hashlib
 import logging
 import os
+import threading
+import time
 import xml.etree.ElementTree as ET
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
 from math import copysign
 
-import requests
 from owslib.wfs import WebFeatureService
 from owslib.wms import WebMapService
 from owslib.util import ServiceException
 
+from capabilities import CapabilitiesReader
+from circuitbreaker import HostUnavailableError
 from credentials import Credentials
-from geometadata import GeoMetadata
+from geometadata import MetadataCache
+from hostlimits import HostLimiter
 from inconsistency import *
+from resultstore import ResultStore
+from transport import HttpTransport
+from utils import canonical_ows_url
+
+
+def capabilities_url(url, service, version):
+    """
+    Builds the GetCapabilities request URL for a service endpoint, adding the
+    service, request and version parameters if missing (as owslib does).
+
+    :param url: the service endpoint URL
+    :param service: the service type ('WMS' or 'WFS')
+    :param version: the version to request
+    :return: the GetCapabilities URL.
+    """
+    (base, _, query) = url.partition("?")
+    params = parse_qsl(query, keep_blank_values=True)
+    names = [name.lower() for (name, _) in params]
+    for (name, value) in [("service", service), ("request", "GetCapabilities"), ("version", version)]:
+        if name not in names:
+            params.append((name, value))
+    return "%s?%s" % (base, urlencode(params))
 
 
 class OwsServer:
     """
     Class which manages the consumption of OWS servers (WMS,WFS).
     """
-    def __init__(self, gsurl, wms = True, creds = Credentials(), timeout=30):
+    wms_version = "1.3.0"
+    wfs_version = "1.1.0"
+
+    def __init__(self, gsurl, wms = True, creds = Credentials(), timeout=30, transport=None, xml=None,
+                 lightweight=False):
         """
         constructor.
 
         :param gsurl (string): url to the OWS service endpoint, no query_string parameters are needed,
         :param wms (boolean): true if the service is a WMS one, false for WFS.
         :param creds (Credentials): an optional Credentials provider
+        :param transport (HttpTransport): the transport providing the TLS settings, a new one is
+        created if not provided
+        :param xml (bytes): an already downloaded GetCapabilities document, in which case the
+        service is not queried again
+        :param lightweight (boolean): true to only extract the layers fields the checks need from
+        the GetCapabilities document (see CapabilitiesReader), instead of building the owslib
+        object model
 
         """
-        u = urlparse(gsurl)
-        (username, password) = creds.get(u.hostname)
-        if wms:
-            self._ows = WebMapService(gsurl, username=username,
-                                      password=password, version="1.3.0",
-                                      timeout=timeout)
+        self.url = gsurl
+        self.wms = wms
+        self._transport = transport or HttpTransport(creds, timeout=timeout)
+        if xml is None:
+            # fetched through the transport, to benefit from its on-disk cache if any
+            xml = self._transport.get_content(capabilities_url(gsurl, "WMS" if wms else "WFS",
+                                                               self.wms_version if wms else self.wfs_version),
+                                              raise_for_status=True)
+        self.fingerprint = hashlib.sha1(xml).hexdigest()
+        if lightweight:
+            self._ows = None
+            self._contents = CapabilitiesReader(xml, wms)
+        elif wms:
+            self._ows = WebMapService(gsurl, version=self.wms_version, xml=xml,
+                                      timeout=timeout, auth=self._transport.authentication(gsurl))
+            self._contents = self._ows
         else:
-            self._ows = WebFeatureService(gsurl, username=username,
-                                          password=password, version="1.1.0",
-                                          timeout=timeout)
+            self._ows = WebFeatureService(gsurl, version=self.wfs_version, xml=xml,
+                                          timeout=timeout, auth=self._transport.authentication(gsurl))
+            self._contents = self._ows
         self._populateLayers()
 
     def _populateLayers(self):
@@ -44,7 +94,7 @@ class OwsServer:
         populates the layersByWorkspace property, by consuming the GetCapabilities response.
         """
         self.layersByWorkspace = {}
-        for content in self._ows.contents:
+        for content in self._contents.contents:
             # if the workspace is not guessable from the layer name,
             # skip it.
             try:
@@ -67,25 +117,109 @@ class OwsServer:
         :param layerName (string): the layer name
         :return: a set of tuples containing metadata URLs and format.
         """
-        l = self._ows[layerName]
+        l = self._contents[layerName]
         return set([(i['format'], i['url']) for i in l.metadataUrls])
 
     def getLayer(self, name):
         try:
-            return self._ows[name]
+            return self._contents[name]
         # Not found ? try without workspace
         except KeyError:
             if ":" in name:
                 (_, layername) = name.split(":")
-                return self._ows[layername]
+                return self._contents[layername]
+
+    def probeLayer(self, name):
+        """
+        Checks that a layer can actually be rendered, by issuing a GetMap (WMS) or a
+        GetFeature (WFS) request onto a small area of the layer extent.
+
+        :param name: the layer name
+        :raise ServiceException: if the service answers with an exception.
+        """
+        l = self.getLayer(name)
+        bbox = self._reduced_bbox(l.boundingBoxWGS84)
+        if self._ows is not None:
+            # owslib issues its own request, which has to be timed and paced here
+            start = time.perf_counter()
+            try:
+                with self._transport.throttled(self.url):
+                    if self.wms:
+                        self._ows.getmap(layers=[name], srs='EPSG:4326', format='image/png', size=(10,10),
+                                         bbox=bbox)
+                    else:
+                        self._ows.getfeature(typename=name, srsname=l.crsOptions[0], bbox=bbox, maxfeatures=1)
+            finally:
+                self._transport.latencies.record(self.url, time.perf_counter() - start)
+            return
+        url = self._contents.operations.get("GetMap" if self.wms else "GetFeature") or self.url
+        resp = self._transport.get(url.rstrip("?&"), params=self._probe_params(name, l, bbox))
+        if resp.status_code >= 400:
+            raise ServiceException("HTTP %d: %s" % (resp.status_code, resp.text[:200]))
+        if "xml" in resp.headers.get("Content-Type", ""):
+            try:
+                root = ET.fromstring(resp.content)
+            except ET.ParseError:
+                return
+            if root.tag.rpartition("}")[2] in ("ServiceExceptionReport", "ExceptionReport"):
+                raise ServiceException(" ".join(t.strip() for t in root.itertext() if t.strip() != ""))
+
+    def _probe_params(self, name, layer, bbox):
+        """
+        Builds the query parameters of the request probing a layer.
+
+        :param name: the layer name
+        :param layer: the layer, as returned by getLayer
+        :param bbox: the area to probe, as (minx, miny, maxx, maxy) in WGS84 longitude / latitude
+        :return: a dictionary of the query parameters.
+        """
+        if self.wms:
+            # WMS 1.3.0 follows the axis order of EPSG:4326, latitude first
+            return {"service": "WMS", "version": self.wms_version, "request": "GetMap", "layers": name,
+                    "styles": "", "crs": "EPSG:4326",
+                    "bbox": ",".join(repr(x) for x in (bbox[1], bbox[0], bbox[3], bbox[2])),
+                    "width": 10, "height": 10, "format": "image/png"}
+        return {"service": "WFS", "version": self.wfs_version, "request": "GetFeature", "typename": name,
+                "srsname": layer.crsOptions[0], "maxFeatures": 1,
+                "bbox": ",".join(repr(x) for x in bbox) + ",EPSG:4326"}
+
+    def _reduced_bbox(self, bbox):
+        xmin, ymin, xmax, ymax = bbox
+        return [xmin+0.49*(xmax-xmin),
+             ymin+0.49*(ymax-ymin),
+             xmax-0.49*(xmax-xmin),
+             ymax-0.49*(ymax-ymin)]
 
 class CachedOwsServices:
 
-    def __init__(self, credentials = Credentials(), disable_ssl=False, timeout=30):
+    def __init__(self, credentials = Credentials(), disable_ssl=False, timeout=30, transport=None, failure_ttl=600,
+                 lightweight=False):
+        """
+        constructor.
+
+        :param credentials (Credentials): an optional Credentials provider
+        :param disable_ssl (boolean): true to disable the certificate verification
+        :param timeout (int): timeout in seconds for the requests against the services
+        :param transport (HttpTransport): the transport to issue the requests with
+        :param failure_ttl (int): number of seconds during which a service that could not be loaded
+        is not queried again, its error being replayed instead. 0 disables it.
+        :param lightweight (boolean): true to read the GetCapabilities documents with the lightweight
+        CapabilitiesReader instead of owslib
+        """
         self._servers = { "wms" : {} , "wfs" : {} }
+        self._failures = { "wms" : {} , "wfs" : {} }
         self._credentials = credentials
         self._disable_ssl = disable_ssl
         self._timeout = timeout
+        self._transport = transport or HttpTransport(credentials, disable_ssl=disable_ssl, timeout=timeout)
+        self._failure_ttl = failure_ttl
+        self._lightweight = lightweight
+        self._urls_seen = set()
+        # guards the caches, and makes sure a service is loaded only once when checks run concurrently
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self.failures_replayed = 0
+        self.fetches_saved = 0
 
     def checkWfsLayer(self, url, name):
         self._checkLayer(url, name, is_wms=False)
@@ -94,35 +228,124 @@ class CachedOwsServices:
         self._checkLayer(url, name, is_wms=True)
 
     def _check_legit_getcapabilities_url(self, url, name, is_wms):
-        auth = None
-        if self._credentials is not None:
-            (username, password) = self._credentials.getFromUrl(url)
-            if username is not None and password is not None:
-                auth = (username,password)
-        resp = requests.get(url, auth=auth, verify=not self._disable_ssl,
-                            timeout=self._timeout)
-        str_url = resp.text
-        first_tag = ET.fromstring(str_url).tag.lower()
-        if (first_tag.endswith("wms_capabilities" if is_wms else "wfs_capabilities")):
-            pass
-        else:
+        """
+        Downloads the document at the given URL, checking that it is a GetCapabilities one.
+        The root element is checked as soon as it has been received, so that the download
+        is aborted early if the URL does not point to a capabilities document.
+
+        :return: a tuple (document body as bytes, version advertised by the root element).
+        """
+        parser = ET.XMLPullParser(events=("start",))
+        root = None
+        chunks = []
+        for chunk in self._transport.iter_content(url):
+            chunks.append(chunk)
+            if root is None:
+                parser.feed(chunk)
+                for _, root in parser.read_events():
+                    break
+                if root is not None and \
+                        not root.tag.lower().endswith("wms_capabilities" if is_wms else "wfs_capabilities"):
+                    raise GnToGsInvalidCapabilitiesUrl(layer_name=name, layer_url=url, is_wms=is_wms)
+        if root is None:
+            # empty or truncated document, raises the corresponding ParseError
+            parser.close()
             raise GnToGsInvalidCapabilitiesUrl(layer_name=name, layer_url=url, is_wms=is_wms)
+        return b"".join(chunks), root.get("version")
+
+    def _replay_failure(self, key, name, is_wms):
+        """
+        Raises again the error met when loading the service, if it is still in the failures cache.
+        """
+        failures = self._failures["wms" if is_wms else "wfs"]
+        failure = failures.get(key)
+        if failure is None:
+            return
+        (expires, exc, once) = failure
+        if time.monotonic() >= expires:
+            del failures[key]
+            return
+        if once and name is not None:
+            del failures[key]
+        else:
+            self.failures_replayed += 1
+        if not isinstance(exc, Inconsistency):
+            raise exc
+        # the inconsistency is bound to the layer which triggered the loading of
+        # the service, a copy is raised for the current layer.
+        replayed = copy.copy(exc)
+        replayed.layer_name = name
+        if hasattr(replayed, "md_uuid"):
+            replayed.md_uuid = None
+        raise replayed
+
+    def _loadServer(self, url, name, is_wms):
+        (capabilities, version) = self._check_legit_getcapabilities_url(url, name, is_wms)
+        # the document can only be reused if it is in the version owslib would have requested
+        if version != (OwsServer.wms_version if is_wms else OwsServer.wfs_version):
+            capabilities = None
+        try:
+            return OwsServer(url, is_wms, creds=self._credentials,
+                             timeout=self._timeout, transport=self._transport,
+                             xml=capabilities, lightweight=self._lightweight)
+        except HostUnavailableError:
+            raise
+        except Exception as ex:
+            raise GnToGsOtherError(layer_name=name,
+                                   layer_url=url,
+                                   exc=ex)
+
+    def getServiceFingerprint(self, url, is_wms):
+        """
+        Gives a fingerprint of the GetCapabilities document of a service, which changes
+        whenever the service changes. The service is loaded if needed: if it fails to, the
+        error is kept (at least) for the next check of a layer of the service, which raises
+        it for its own layer instead of loading the service again.
+
+        :param url: the service URL
+        :param is_wms: true for a WMS service, false for a WFS one
+        :return: the fingerprint, None if the service cannot be loaded.
+        """
+        try:
+            return self._getServer(url, None, is_wms).fingerprint
+        except Exception:
+            return None
 
     def _checkLayer(self, url, name, is_wms):
-        servers_cache = self._servers["wms" if is_wms else "wfs"]
-        if url not in servers_cache.keys():
-           self._check_legit_getcapabilities_url(url, name, is_wms)
-           try:
-                servers_cache[url] = OwsServer(url, is_wms, creds=self._credentials)
-           except Exception as ex:
-                raise GnToGsOtherError(layer_name=name,
-                                       layer_url=url,
-                                       exc=ex)
         try:
-            servers_cache[url].getLayer(name)
+            self._getServer(url, name, is_wms).getLayer(name)
         except KeyError as ex:
             raise GnToGsLayerNotFoundInconsistency(layer_name=name, layer_url=url, msg="Layer not found on GS")
 
+    def _getServer(self, url, name, is_wms):
+        servers_cache = self._servers["wms" if is_wms else "wfs"]
+        key = canonical_ows_url(url, "wms" if is_wms else "wfs",
+                                OwsServer.wms_version if is_wms else OwsServer.wfs_version)
+        with self._lock:
+            if url not in self._urls_seen:
+                self._urls_seen.add(url)
+                # another spelling of the URL already led to the service being loaded (or failing to)
+                if key in servers_cache or key in self._failures["wms" if is_wms else "wfs"]:
+                    self.fetches_saved += 1
+            loading_lock = self._loading_locks.setdefault((is_wms, key), threading.Lock())
+        with loading_lock:
+            if key not in servers_cache.keys():
+                self._replay_failure(key, name, is_wms)
+                try:
+                    servers_cache[key] = self._loadServer(url, name, is_wms)
+                except HostUnavailableError as ex:
+                    # not kept in the failures cache, the host is queried again once its cooldown is over
+                    raise HostUnavailableInconsistency(url, ex.host, layer_name=name)
+                except Exception as ex:
+                    if self._failure_ttl > 0:
+                        self._failures["wms" if is_wms else "wfs"][key] = \
+                            (time.monotonic() + self._failure_ttl, ex, False)
+                    elif name is None:
+                        # loaded for its fingerprint only, kept for the check which follows
+                        self._failures["wms" if is_wms else "wfs"][key] = (float("inf"), ex, True)
+                    raise
+            return servers_cache[key]
+
 
 class OwsChecker:
     """
@@ -130,15 +353,58 @@ class OwsChecker:
     """
     logger = logging.getLogger("owschecker")
 
-    def __init__(self, serviceUrl, wms=True, creds=Credentials(), checkLayers = False, timeout=30):
+    def __init__(self, serviceUrl, wms=True, creds=Credentials(), checkLayers = False, timeout=30, workers=1,
+                 transport=None, results=None, lightweight=False, probes_per_host=2, host_limiter=None,
+                 parse_pool=None, metadata_cache=None):
+        """
+        constructor, runs the checks against the remote service.
+
+        :param serviceUrl (string): url to the OWS service endpoint
+        :param wms (boolean): true if the service is a WMS one, false for WFS.
+        :param creds (Credentials): an optional Credentials provider
+        :param checkLayers (boolean): true to also issue a GetMap / GetFeature request for each layer
+        :param timeout (int): timeout in seconds for the requests against the service
+        :param workers (int): number of metadata URLs fetched concurrently
+        :param transport (HttpTransport): the transport to issue the requests with
+        :param results (ResultStore): the store the outcome of each layer is recorded in, as soon
+        as its checks are done
+        :param lightweight (boolean): true to read the GetCapabilities document with the lightweight
+        CapabilitiesReader instead of owslib
+        :param probes_per_host (int): maximum number of GetMap / GetFeature probes issued concurrently
+        against the service host
+        :param host_limiter (HostLimiter): the limiter capping the probes per host, if shared with
+        other checkers; one allowing probes_per_host probes is created if not provided
+        :param parse_pool (ProcessPoolExecutor): an optional process pool the metadata documents are
+        parsed in
+        :param metadata_cache (MetadataCache): the cache of the metadata fetched during the run, if
+        shared with other checkers; a new one is created if not provided
+        """
         self._inconsistencies = []
         self._layer_names = []
         self.wms = wms
+        self._host_limiter = host_limiter or HostLimiter(probes_per_host)
+        self._parse_pool = parse_pool
+        self._metadata_cache = metadata_cache if metadata_cache is not None else MetadataCache()
+        self.probes_count = 0
+        self.probes_time = 0
+        self._results = results if results is not None else ResultStore("WMS" if wms else "WFS")
+        self._transport = transport or HttpTransport(creds, timeout=timeout, pool_maxsize=max(10, workers))
         try:
-            self._service = OwsServer(serviceUrl, wms, creds, timeout=timeout)
+            self._service = OwsServer(serviceUrl, wms, creds, timeout=timeout, transport=self._transport,
+                                      lightweight=lightweight)
         except Exception as e:
             raise UnparseableGetCapabilitiesInconsistency(serviceUrl, str(e))
 
+        # inconsistencies are gathered per layer, so that the final list stays
+        # ordered by layer index whatever the order the metadata checks complete in.
+        layers_inconsistencies = []
+        layers_time = []
+        md_checks = []
+        # the GetMap / GetFeature probes run in the background, the number of probes in flight
+        # against the host being capped by the host limiter.
+        probes = {}
+        probe_executor = ThreadPoolExecutor(max_workers=self._host_limiter.max_per_host)
+        probes_start = time.perf_counter()
         layer_idx = 0
         for workspace, layers in self._service.layersByWorkspace.items():
             for layer in layers:
@@ -147,60 +413,116 @@ class OwsChecker:
                 else:
                     fqLayerName = layer
                 self._layer_names.append(fqLayerName)
+                inconsistencies = []
+                layers_inconsistencies.append(inconsistencies)
+                layers_time.append(0)
 
                 if checkLayers:
-                    # depending on OWS type, we'll have to check a different URL
-                    # either a GetMap or a GetFeature
-                    l = self._service.getLayer(fqLayerName)
-                    if self._service._ows.identification.type == "WMS":
-                        try:
-                            a = self._service._ows.getmap(layers=[fqLayerName],
-                                srs='EPSG:4326',
-                                format='image/png',
-                                size=(10,10),
-                                bbox=self._reduced_bbox(l.boundingBoxWGS84))
-                        except ServiceException as e:
-                            e.layer_name = fqLayerName
-                            e.layer_index = layer_idx
-                            self._inconsistencies.append(e)
-                    else:
-                        try:
-                            a = self._service._ows.getfeature(typename=fqLayerName,
-                                srsname=l.crsOptions[0],
-                                bbox=self._reduced_bbox(l.boundingBoxWGS84),
-                                maxfeatures=1)
-                        except ServiceException as e:
-                            e.layer_name = fqLayerName
-                            e.layer_index = layer_idx
-                            self._inconsistencies.append(e)
+                    probes[layer_idx] = probe_executor.submit(self._probe_layer, fqLayerName, layer_idx)
 
                 mdUrls = self._service.getMetadatas(fqLayerName)
                 if len(mdUrls) == 0:
-                    self._inconsistencies.append(GsMetadataMissingInconsistency(fqLayerName, layer_idx))
+                    inconsistencies.append(GsMetadataMissingInconsistency(fqLayerName, layer_idx))
                     layer_idx += 1
                     continue
                 for (mdFormat, mdUrl) in mdUrls:
-                    try:
-                        GeoMetadata(mdUrl, mdFormat, creds=creds)
-                    except GsToGnMetadataInvalidInconsistency as e:
-                        e.layer_name = fqLayerName
-                        e.layer_index = layer_idx
-                        self._inconsistencies.append(e)
+                    md_checks.append((fqLayerName, layer_idx, mdFormat, mdUrl))
                 layer_idx += 1
 
+        # the outcomes come in the layers order: once a metadata check of a given layer
+        # completes, all the previous layers are done and can be recorded.
+        reported = 0
+        with probe_executor, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            outcomes = executor.map(lambda check: self._check_metadata(*check, creds=creds), md_checks)
+            for (_, idx, _, _), (error, elapsed) in zip(md_checks, outcomes):
+                reported = self._report_layers(layers_inconsistencies, layers_time, probes, reported, idx)
+                layers_time[idx] += elapsed
+                if error is not None:
+                    layers_inconsistencies[idx].append(error)
+            self._report_layers(layers_inconsistencies, layers_time, probes, reported, len(layers_inconsistencies))
+        self._inconsistencies = [e for inconsistencies in layers_inconsistencies for e in inconsistencies]
+        if len(probes) > 0:
+            self.probes_count = len(probes)
+            self.probes_time = max(probe.result()[2] for probe in probes.values()) - probes_start
+
+    def _report_layers(self, layers_inconsistencies, layers_time, probes, start, end):
+        """
+        Records the outcome of the layers whose checks are done into the results store,
+        waiting for their probe to complete if needed.
+
+        :param layers_inconsistencies: the inconsistencies found, per layer index
+        :param layers_time: the time spent checking each layer, per layer index
+        :param probes: the probes futures, per layer index
+        :param start: the index of the first layer not recorded yet
+        :param end: the index of the first layer whose metadata checks are still pending
+        :return: the index of the first layer not recorded yet.
+        """
+        for idx in range(start, end):
+            if idx in probes:
+                (error, elapsed, _) = probes[idx].result()
+                layers_time[idx] += elapsed
+                if error is not None:
+                    layers_inconsistencies[idx].insert(0, error)
+            self._results.add(idx, self._layer_names[idx], layers_inconsistencies[idx], layers_time[idx])
+        return max(start, end)
+
+    def _probe_layer(self, fqLayerName, layer_idx):
+        """
+        Issues the GetMap / GetFeature probe of a layer. Run from the probes threads.
+
+        :return: a tuple (error, elapsed, end): the ServiceException (or GnToGsOtherError) bound to
+        the layer if the probe failed, None otherwise, the time spent in seconds, and the completion time.
+        """
+        with self._host_limiter.slot(self._service.url):
+            start = time.perf_counter()
+            try:
+                self._service.probeLayer(fqLayerName)
+            except HostUnavailableError as e:
+                error = HostUnavailableInconsistency(e.url, e.host, layer_name=fqLayerName)
+                error.layer_index = layer_idx
+                return (error, time.perf_counter() - start, time.perf_counter())
+            except ServiceException as e:
+                e.layer_name = fqLayerName
+                e.layer_index = layer_idx
+                return (e, time.perf_counter() - start, time.perf_counter())
+            except Exception as e:
+                # any other failure (connection, unparseable response...) only affects this layer
+                error = GnToGsOtherError(self._service.url, fqLayerName, e)
+                error.layer_index = layer_idx
+                return (error, time.perf_counter() - start, time.perf_counter())
+            end = time.perf_counter()
+            return (None, end - start, end)
+
+    def _check_metadata(self, fqLayerName, layer_idx, mdFormat, mdUrl, creds=Credentials()):
+        """
+        Fetches and parses a metadata URL advertised by a layer, unless already done for
+        another layer.
+
+        :return: a tuple (error, elapsed): a GsToGnMetadataInvalidInconsistency bound to the
+        layer if the metadata is invalid (HostUnavailableInconsistency if its host is not queried
+        anymore), None otherwise, and the time spent in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            self._metadata_cache.get(mdUrl, mdFormat, creds=creds, transport=self._transport,
+                                     parse_pool=self._parse_pool)
+        except (GsToGnMetadataInvalidInconsistency, HostUnavailableInconsistency) as e:
+            e.layer_name = fqLayerName
+            e.layer_index = layer_idx
+            return (e, time.perf_counter() - start)
+        return (None, time.perf_counter() - start)
+
     def get_inconsistencies(self):
         return self._inconsistencies
 
+    def get_results(self):
+        """
+        :return: the ResultStore gathering the outcome of the checks, keyed by layer index.
+        """
+        return self._results
+
     def get_service(self):
         return self._service
 
     def get_layer_names(self):
         return self._layer_names
-
-    def _reduced_bbox(self, bbox):
-        xmin, ymin, xmax, ymax = bbox
-        return [xmin+0.49*(xmax-xmin),
-             ymin+0.49*(ymax-ymin),
-             xmax-0.49*(xmax-xmin),
-             ymax-0.49*(ymax-ymin)]
-
@@ -0,0 +1,211 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+
+class HostBucket:
+    """
+    Class which holds the token bucket and the congestion state of a given host.
+    """
+    def __init__(self, rate):
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0
+        self.last_decrease = 0
+        self.latency = None
+        self.latency_floor = None
+        self.samples = 0
+        self.backoffs = 0
+
+
+class RateLimiter:
+    """
+    Class which paces the requests issued against each host, with a token bucket per host.
+
+    The rate of a host adapts to the way it copes with the load (AIMD): it is halved whenever
+    the host answers 429 / 503, fails to answer, or its latency rises well above the lowest
+    latency observed so far, and slowly increased back towards the configured rate otherwise.
+    A Retry-After header suspends the requests to the host for the given duration.
+    """
+    # rate increase on each successful request, as a fraction of the configured rate
+    additive_increase = 0.05
+
+    def __init__(self, default_rate=20, host_rates={}, min_rate=0.2, latency_factor=3.0, min_latency=1.0):
+        """
+        constructor.
+
+        :param default_rate (float): maximum number of requests per second issued against a host
+        :param host_rates (dict): maximum rates for specific hosts (as host[:port]), overriding the default one
+        :param min_rate (float): the rate is never lowered below this one
+        :param latency_factor (float): a response slower than this factor times the lowest (smoothed)
+        latency observed for the host is considered as a sign of overload
+        :param min_latency (float): responses faster than this number of seconds are never considered
+        as a sign of overload, however slower than the lowest latency they are
+        """
+        self.default_rate = default_rate
+        self.host_rates = host_rates
+        self.min_rate = min_rate
+        self.latency_factor = latency_factor
+        self.min_latency = min_latency
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = HostBucket(self.host_rates.get(host, self.default_rate))
+            self._buckets[host] = bucket
+        return bucket
+
+    def acquire(self, url):
+        """
+        Waits until a request can be issued against the host of an URL.
+
+        :param url: the URL about to be queried
+        """
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                now = time.monotonic()
+                bucket.tokens = min(max(1.0, bucket.rate),
+                                    bucket.tokens + (now - bucket.last_refill) * bucket.rate)
+                bucket.last_refill = now
+                if now < bucket.paused_until:
+                    wait = bucket.paused_until - now
+                elif bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                else:
+                    wait = (1 - bucket.tokens) / bucket.rate
+            time.sleep(wait)
+
+    def feedback(self, url, status_code, latency, retry_after=None):
+        """
+        Adapts the rate of a host according to the outcome of a request.
+
+        :param url: the URL queried
+        :param status_code: the HTTP status of the response, None if the request failed
+        (connection error, timeout)
+        :param latency: the time the response took, in seconds
+        :param retry_after: the Retry-After response header, if any
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            overloaded = status_code is None or status_code in (429, 503)
+            if status_code is not None:
+                # exponentially weighted moving average of the latency
+                bucket.latency = latency if bucket.latency is None else 0.8 * bucket.latency + 0.2 * latency
+                bucket.samples += 1
+                if bucket.latency_floor is None or bucket.latency < bucket.latency_floor:
+                    bucket.latency_floor = bucket.latency
+                if bucket.samples >= 5 and bucket.latency > max(self.min_latency,
+                                                                self.latency_factor * bucket.latency_floor):
+                    overloaded = True
+            if retry_after is not None:
+                bucket.paused_until = max(bucket.paused_until, now + self._parse_retry_after(retry_after))
+            if overloaded:
+                # the requests in flight when the host started to struggle would decrease the
+                # rate several times in a row otherwise
+                if now - bucket.last_decrease > 1.0:
+                    bucket.rate = max(self.min_rate, bucket.rate / 2)
+                    bucket.last_decrease = now
+                    bucket.backoffs += 1
+            else:
+                bucket.rate = min(bucket.max_rate, bucket.rate + self.additive_increase * bucket.max_rate)
+
+    @staticmethod
+    def _parse_retry_after(value):
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return 0.0
+
+    def hosts(self):
+        with self._lock:
+            return sorted(self._buckets.keys())
+
+    def rate(self, host):
+        """
+        :return: the current rate of a host, in requests per second.
+        """
+        with self._lock:
+            return self._bucket(host).rate
+
+    def backoffs(self, host):
+        """
+        :return: the number of times the rate of a host has been lowered.
+        """
+        with self._lock:
+            return self._bucket(host).backoffs
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    requests transport adapter which goes through a RateLimiter before sending each request,
+    and reports the outcome back to it. Mounting it on a session (ours, or the one of a
+    third-party library) makes all the requests of the session paced.
+    """
+    def __init__(self, rate_limiter, **kwargs):
+        self.rate_limiter = rate_limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.rate_limiter.acquire(request.url)
+        start = time.perf_counter()
+        try:
+            resp = super().send(request, **kwargs)
+        except Exception:
+            self.rate_limiter.feedback(request.url, None, time.perf_counter() - start)
+            raise
+        self.rate_limiter.feedback(request.url, resp.status_code, resp.elapsed.total_seconds(),
+                                   resp.headers.get("Retry-After"))
+        return resp
+
+
+def add_rate_limit_arguments(parser):
+    """
+    Adds the rate limiting options to a command line parser.
+    """
+    parser.add_argument("--rate-limit", type=float, default=20,
+                        help="Maximum number of requests per second issued against a host, lowered automatically "
+                             "when the host answers 429/503 or slows down. 0 disables the rate limiting, "
+                             "defaults to 20")
+    parser.add_argument("--host-rate-limit", action="append", default=[], metavar="HOST=RATE",
+                        help="Maximum number of requests per second for a given host (host[:port]), "
+                             "can be repeated")
+
+
+def rate_limiter_from_args(args, parser):
+    """
+    Builds the RateLimiter configured by the command line options.
+
+    :param args: the parsed command line options
+    :param parser: the command line parser, to report the invalid options with
+    :return: the RateLimiter, None if the rate limiting is disabled.
+    """
+    if args.rate_limit <= 0:
+        return None
+    host_rates = {}
+    for host_rate in args.host_rate_limit:
+        (host, _, rate) = host_rate.rpartition("=")
+        try:
+            rate = float(rate)
+        except ValueError:
+            rate = None
+        if host == "" or rate is None:
+            parser.error("argument --host-rate-limit: expected HOST=RATE, got '%s'" % host_rate)
+        if not rate > 0:
+            parser.error("argument --host-rate-limit: the rate of %s must be greater than 0" % host)
+        host_rates[host] = rate
+    return RateLimiter(args.rate_limit, host_rates)
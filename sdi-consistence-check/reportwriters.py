@@ -0,0 +1,99 @@
+import json
+import threading
+import xml.etree.ElementTree as ET
+
+from checkstate import inconsistency_type
+
+
+class XunitReportWriter:
+    """
+    Class which streams a xunit report to a file, one testcase element being written
+    (and flushed) as soon as the outcome of an item is known, so that the report does
+    not need to be kept in memory and is available, partially, if the run is interrupted.
+    A testcase holds the first error met on its item only, as most xunit consumers only
+    consider a single error per testcase.
+    The totals of the testsuite element are patched in place when the writer is closed.
+    """
+    # room left in the testsuite start tag for the totals to be rewritten in place
+    HEADER_SIZE = 160
+
+    def __init__(self, output_file, classname):
+        """
+        constructor.
+
+        :param output_file (string): the XML output filename to be generated
+        :param classname (string): the classname of the testcases ('WMS', 'WFS' or 'CSW')
+        """
+        self.classname = classname
+        self._lock = threading.Lock()
+        self._tests = 0
+        self._errors = 0
+        self._file = open(output_file, "wb")
+        self._write_header()
+        self._file.flush()
+
+    def _write_header(self):
+        header = '<testsuite name="sdi-consistence-checker" tests="%d" errors="%d" failures="0" skip="0"' % \
+                 (self._tests, self._errors)
+        # XML allows blanks before the end of a start tag, hence the padding.
+        self._file.write((header.ljust(self.HEADER_SIZE - 1) + ">").encode("ascii"))
+
+    def write(self, result):
+        """
+        Appends a testcase to the report.
+
+        :param result (CheckResult): the outcome of the checks made onto an item
+        """
+        tcase = ET.Element("testcase", {"classname": self.classname, "name": result.name or "",
+                                        "time": "%.3f" % result.time})
+        if len(result.errors) > 0:
+            error = result.errors[0]
+            ET.SubElement(tcase, "error", {"type": inconsistency_type(error), "message": str(error)}).text = str(error)
+        with self._lock:
+            self._tests += 1
+            if len(result.errors) > 0:
+                self._errors += 1
+            self._file.write(ET.tostring(tcase))
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.write(b"</testsuite>")
+            self._file.seek(0)
+            self._write_header()
+            self._file.close()
+
+
+class JsonLinesReportWriter:
+    """
+    Class which streams the outcome of the checks to a JSON Lines file, one JSON object
+    per checked item.
+    """
+    def __init__(self, output_file, classname):
+        """
+        constructor.
+
+        :param output_file (string): the output filename to be generated
+        :param classname (string): the kind of items checked ('WMS', 'WFS' or 'CSW')
+        """
+        self.classname = classname
+        self._lock = threading.Lock()
+        self._file = open(output_file, "w", encoding="utf-8")
+
+    def write(self, result):
+        """
+        Appends a line to the report.
+
+        :param result (CheckResult): the outcome of the checks made onto an item
+        """
+        line = json.dumps({"classname": self.classname, "key": result.key, "name": result.name,
+                           "time": round(result.time, 3),
+                           "errors": [{"type": inconsistency_type(error), "message": str(error)}
+                                      for error in result.errors]})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
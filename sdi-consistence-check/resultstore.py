@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+
+class CheckResult:
+    """
+    Class which describes the outcome of the checks made onto an item (a layer or a metadata).
+    """
+    def __init__(self, key, name, errors, time=0):
+        self.key = key
+        self.name = name
+        self.errors = errors
+        self.time = time
+
+    @property
+    def error(self):
+        """
+        The first inconsistency found onto the item, None if it is consistent.
+        """
+        return self.errors[0] if len(self.errors) > 0 else None
+
+
+class ResultStore:
+    """
+    Class which gathers the outcome of the checks, one entry per checked item (identified
+    by its layer index in WMS/WFS mode, by its metadata UUID in CSW mode), in the order
+    they have been checked. The log, xunit and summary outputs are all generated from it.
+    """
+    def __init__(self, classname, writers=[]):
+        """
+        constructor.
+
+        :param classname (string): the kind of items checked ('WMS', 'WFS' or 'CSW')
+        :param writers (list): report writers every newly recorded item is streamed to
+        """
+        self.classname = classname
+        self._writers = writers
+        self._results = OrderedDict()
+        self._errors = []
+        self._in_error = 0
+
+    def add(self, key, name, errors=[], time=0):
+        """
+        Records the outcome of the checks made onto an item. An item is only reported
+        once: if it has already been recorded, its entry is kept as is, the errors only
+        being accounted for in the total of inconsistencies.
+
+        :param key: the item identifier (layer index or metadata UUID)
+        :param name: the item name, as displayed in the reports
+        :param errors: the list of inconsistencies found onto the item
+        :param time: the time spent checking the item, in seconds
+        :return: the CheckResult describing the item.
+        """
+        self._errors.extend(errors)
+        result = self._results.get(key)
+        if result is None:
+            result = CheckResult(key, name, list(errors), time)
+            self._results[key] = result
+            if len(errors) > 0:
+                self._in_error += 1
+            for writer in self._writers:
+                writer.write(result)
+        return result
+
+    def get(self, key):
+        return self._results.get(key)
+
+    def __contains__(self, key):
+        return key in self._results
+
+    def __len__(self):
+        return len(self._results)
+
+    def __iter__(self):
+        return iter(self._results.values())
+
+    def errors(self):
+        """
+        :return: all the inconsistencies found, in the order they have been recorded.
+        """
+        return self._errors
+
+    def count_in_error(self):
+        """
+        :return: the number of items having at least one inconsistency.
+        """
+        return self._in_error
@@ -0,0 +1,266 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from owslib.util import Authentication
+from requests.adapters import HTTPAdapter
+
+from circuitbreaker import backoff_delay
+from credentials import Credentials
+from latency import LatencyStats
+from ratelimit import RateLimitedAdapter
+
+
+# statuses denoting a transient failure, worth retrying
+RETRY_STATUSES = (429, 502, 503, 504)
+# statuses denoting the host itself is failing, counted by the circuit breaker
+HOST_FAILURE_STATUSES = (502, 503, 504)
+
+
+class HttpTransport:
+    """
+    Class which carries every HTTP request issued against the remote services (OWS servers,
+    catalogues, metadata URLs).
+
+    A single requests session is shared, hence connections (and TLS handshakes) to a given
+    host are pooled and kept alive between requests. Credentials, certificate verification
+    and timeout are applied the same way to every request going through it, and its duration
+    is recorded in the latency statistics. If a rate limiter is given, the requests are paced
+    per host. Transient failures are retried with a jittered exponential backoff, and a
+    circuit breaker, if given, stops querying the hosts which keep failing.
+    """
+    def __init__(self, credentials=Credentials(), disable_ssl=False, timeout=30, pool_maxsize=10, cache=None,
+                 rate_limiter=None, retries=0, retry_backoff=0.5, circuit_breaker=None):
+        """
+        constructor.
+
+        :param credentials (Credentials): the credentials provider used to authenticate requests
+        :param disable_ssl (boolean): true to disable the certificate verification
+        :param timeout (int): timeout in seconds applied to every request
+        :param pool_maxsize (int): maximum number of connections kept alive per host
+        :param cache (HttpCache): an optional on-disk cache for the documents fetched with iter_content
+        :param rate_limiter (RateLimiter): an optional per-host rate limiter
+        :param retries (int): number of times a request failing with a connection error, a timeout
+        or a 429/502/503/504 status is retried
+        :param retry_backoff (float): number of seconds the backoff between two retries starts from
+        :param circuit_breaker (CircuitBreaker): an optional per-host circuit breaker
+        """
+        self._credentials = credentials
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.circuit_breaker = circuit_breaker
+        # number of retries issued, by host
+        self.retried = Counter()
+        self._retried_lock = threading.Lock()
+        self.latencies = LatencyStats()
+        self.timeout = timeout
+        self.verify = not disable_ssl
+        self._session = requests.Session()
+        self._session.verify = self.verify
+        self._session.headers["Accept-Encoding"] = "gzip, deflate"
+        if rate_limiter is not None:
+            self._adapter = RateLimitedAdapter(rate_limiter, pool_connections=32, pool_maxsize=pool_maxsize)
+        else:
+            self._adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize)
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+        if disable_ssl:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def _credentials_for(self, url):
+        if self._credentials is None:
+            return (None, None)
+        return self._credentials.getFromUrl(url)
+
+    def request(self, method, url, **kwargs):
+        """
+        Issues a request through the pooled session.
+
+        :param method: the HTTP method
+        :param url: the URL to query
+        :param kwargs: any extra argument accepted by requests
+        :return: the requests response object.
+        """
+        (username, password) = self._credentials_for(url)
+        if username is not None and password is not None:
+            kwargs.setdefault("auth", (username, password))
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        start = time.perf_counter()
+        resp = self._send(method, url, **kwargs)
+        # streamed bodies are timed by the caller, once they have been read
+        if not kwargs.get("stream", False):
+            self.latencies.record(url, time.perf_counter() - start, len(resp.content))
+        return resp
+
+    def _send(self, method, url, **kwargs):
+        """
+        Issues a request, retrying it on transient failures, and reporting its outcome to the
+        circuit breaker if any.
+
+        :raise HostUnavailableError: if the circuit of the host is open.
+        """
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request(url)
+            try:
+                resp = self._session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._record_outcome(url, False)
+                attempt += 1
+                if not isinstance(e, (requests.ConnectionError, requests.Timeout)) or attempt > self.retries \
+                        or self._is_open(url):
+                    raise
+                self._wait_before_retry(url, attempt)
+                continue
+            self._record_outcome(url, resp.status_code not in HOST_FAILURE_STATUSES)
+            attempt += 1
+            if resp.status_code not in RETRY_STATUSES or attempt > self.retries or self._is_open(url):
+                return resp
+            resp.close()
+            self._wait_before_retry(url, attempt)
+
+    def _record_outcome(self, url, success):
+        if self.circuit_breaker is None:
+            return
+        if success:
+            self.circuit_breaker.record_success(url)
+        else:
+            self.circuit_breaker.record_failure(url)
+
+    def _is_open(self, url):
+        return self.circuit_breaker is not None and self.circuit_breaker.is_open(urlparse(url).netloc)
+
+    def _wait_before_retry(self, url, attempt):
+        with self._retried_lock:
+            self.retried[urlparse(url).netloc] += 1
+        time.sleep(backoff_delay(attempt, self.retry_backoff))
+
+    def retries_by_host(self):
+        """
+        :return: the number of retries issued so far, by host.
+        """
+        with self._retried_lock:
+            return dict(self.retried)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("POST", url, data=data, **kwargs)
+
+    def iter_content(self, url, chunk_size=64 * 1024, raise_for_status=False, **kwargs):
+        """
+        Streams the body of a GET request. If an on-disk cache is configured, the cached
+        document is revalidated using a conditional request (If-None-Match / If-Modified-Since)
+        and yielded as a single chunk if still valid; a document downloaded entirely is stored
+        for the next runs.
+
+        :param url: the URL to query
+        :param chunk_size: the size of the chunks read from the network
+        :param raise_for_status: true to raise an HTTPError on 4xx/5xx responses
+        :param kwargs: any extra argument accepted by requests
+        :return: a generator of bytes chunks.
+        """
+        cached = self.cache.get(url) if self.cache is not None else None
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached is not None:
+            if cached.etag is not None:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified is not None:
+                headers["If-Modified-Since"] = cached.last_modified
+        start = time.perf_counter()
+        with self.get(url, stream=True, headers=headers, **kwargs) as resp:
+            if cached is not None and resp.status_code == 304:
+                self.latencies.record(url, time.perf_counter() - start)
+                self.cache.hits += 1
+                yield cached.body
+                return
+            if raise_for_status:
+                resp.raise_for_status()
+            store = self.cache is not None and resp.status_code == 200 and \
+                ("ETag" in resp.headers or "Last-Modified" in resp.headers)
+            chunks = []
+            size = 0
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                size += len(chunk)
+                if store:
+                    chunks.append(chunk)
+                yield chunk
+            self.latencies.record(url, time.perf_counter() - start, size)
+            if self.cache is not None:
+                self.cache.misses += 1
+            if store:
+                self.cache.put(url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), b"".join(chunks))
+
+    def get_content(self, url, **kwargs):
+        """
+        Downloads the body of a GET request, going through the on-disk cache if any.
+        See iter_content for the parameters.
+
+        :return: the body, as bytes.
+        """
+        return b"".join(self.iter_content(url, **kwargs))
+
+    def authentication(self, url):
+        """
+        Builds the owslib authentication object to be used by the owslib clients,
+        which issue their own requests.
+
+        :param url: the URL of the remote service
+        :return: an owslib Authentication object.
+        """
+        (username, password) = self._credentials_for(url)
+        return Authentication(username, password, verify=self.verify)
+
+    @contextmanager
+    def throttled(self, url):
+        """
+        Paces a request issued by a third-party library (e.g. owslib) which does not go
+        through the transport session, and reports its outcome to the circuit breaker, the
+        same way the transport requests are. Such requests are not retried.
+
+        :param url: the URL about to be queried
+        :raise HostUnavailableError: if the circuit of the host is open.
+        """
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request(url)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        start = time.perf_counter()
+        status_code = None
+        try:
+            yield
+            status_code = 200
+        except requests.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            raise
+        except requests.RequestException:
+            raise
+        except Exception:
+            # the service answered, but with an error (e.g. a ServiceException)
+            status_code = 200
+            raise
+        finally:
+            if self.rate_limiter is not None:
+                self.rate_limiter.feedback(url, status_code, time.perf_counter() - start)
+            self._record_outcome(url, status_code is not None and status_code not in HOST_FAILURE_STATUSES)
+
+    def configure(self, session):
+        """
+        Applies the TLS settings onto a session managed by a third-party library
+        (e.g. the gsconfig catalog), and makes it share the connection pools and the
+        rate limiting of the transport.
+
+        :param session: a requests session
+        """
+        session.verify = self.verify
+        session.mount("http://", self._adapter)
+        session.mount("https://", self._adapter)
@@ -1,12 +1,12 @@
 import configparser
-import ssl
+from collections import deque
 from time import strftime, localtime
-from urllib.request import urlopen, Request
-import base64
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from owslib.iso import MD_Metadata
 from owslib.etree import etree
 
 from inconsistency import GsMetadataMissingInconsistency, GsToGnMetadataInvalidInconsistency
+from transport import HttpTransport
 
 def load_workspaces_mapping(file="./template/workspaces-mapping.ini.example"):
     """
@@ -26,33 +26,104 @@ def load_workspaces_mapping(file="./template/workspaces-mapping.ini.example"):
         }
     return ret
 
-def find_data_metadata(resource, credentials, no_ssl_check=False):
+def _canonical_netloc(u):
+    """
+    Lowercases the hostname of a split URL, and drops its port if it is the default one.
+    """
+    netloc = (u.hostname or "").lower()
+    if u.port is not None and (u.scheme.lower(), u.port) not in [("http", 80), ("https", 443)]:
+        netloc = "%s:%d" % (netloc, u.port)
+    if u.username is not None:
+        netloc = "%s@%s" % (u.username if u.password is None else "%s:%s" % (u.username, u.password), netloc)
+    return netloc
+
+
+def canonical_url(url):
+    """
+    Normalizes a URL, so that the spellings of a URL targeting the same document compare
+    equal: scheme and hostname are lowercased, the default port and the fragment dropped,
+    and the parameters sorted.
+
+    :param url: the URL
+    :return: the canonical URL, as a string.
+    """
+    u = urlsplit(url.strip())
+    params = parse_qsl(u.query, keep_blank_values=True)
+    return urlunsplit((u.scheme.lower(), _canonical_netloc(u), u.path or "/", urlencode(sorted(params)), ""))
+
+
+def canonical_ows_url(url, service, version=None):
+    """
+    Normalizes an OWS service URL, so that URLs targeting the same GetCapabilities document
+    compare equal. Scheme and hostname are lowercased and the default port dropped, the
+    GeoServer virtual endpoints (ows, wms, wfs) are considered the same, parameter names
+    are lowercased and sorted, and the OGC parameters which are redundant for the given
+    service (SERVICE, REQUEST=GetCapabilities, VERSION if equal to the requested one) removed.
+
+    :param url: the service URL, as found in the metadata
+    :param service: the service type ('wms' or 'wfs')
+    :param version: the version which will be requested onto the service
+    :return: the canonical URL, as a string.
+    """
+    u = urlsplit(url.strip())
+    scheme = u.scheme.lower()
+    netloc = _canonical_netloc(u)
+    path = u.path.rstrip("/")
+    (base, _, last) = path.rpartition("/")
+    if last.lower() in ["ows", "wms", "wfs"]:
+        path = "%s/%s" % (base, service.lower())
+    params = []
+    for key, value in parse_qsl(u.query, keep_blank_values=True):
+        key = key.lower()
+        if key == "service" and value.lower() in ["", service.lower()]:
+            continue
+        if key == "request" and value.lower() in ["", "getcapabilities"]:
+            continue
+        if key == "version" and value in ["", version]:
+            continue
+        params.append((key, value))
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(params)), ""))
+
+
+def ordered_map(executor, fn, iterable, in_flight):
+    """
+    Same as Executor.map, except that at most in_flight calls are submitted ahead of
+    the results consumption, so that the input iterable is consumed lazily and the number
+    of results kept in memory stays bounded.
+
+    :param executor: the concurrent.futures executor to submit the calls to
+    :param fn: the callable to apply
+    :param iterable: the arguments to call fn with
+    :param in_flight: the maximum number of calls submitted but not consumed yet
+    :return: a generator of the results, in the order of the iterable.
+    """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= max(1, in_flight):
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+def find_data_metadata(resource, credentials, no_ssl_check=False, transport=None):
     """
     Retrieves and parse a remote metadata, given a gsconfig object (resource or layergroup).
     :param resource: an object from the gsconfig python library (either a resource or a layergroup)
     :param credentials: an object that store credential for various OGC services
     :param no_ssl_check: boolean indicating if SSL certificate check should be deactivated (False by default)
+    :param transport: the HttpTransport to issue the request with, a new one is created if not provided
     :return: a tuple (url, parsed metadata).
     """
     if resource.metadata_links is None:
         raise GsMetadataMissingInconsistency("%s:%s" % (resource.workspace.name, resource.name))
     for mime_type, md_format, url in resource.metadata_links:
         if mime_type == "text/xml" and md_format == "ISO19115:2003":
-            # disable certificate verification
-            ctx = None
-            if no_ssl_check:
-                ctx = ssl.create_default_context()
-                ctx.check_hostname = False
-                ctx.verify_mode = ssl.CERT_NONE
-            req = Request(url)
-            username, password = credentials.getFromUrl(url)
-            if username is not None:
-                base64string = base64.b64encode(('%s:%s' % (username, password)).encode())
-                authheader =  "Basic %s" % base64string.decode()
-                req.add_header("Authorization", authheader)
+            transport = transport or HttpTransport(credentials, disable_ssl=no_ssl_check)
             try:
-                with urlopen(req, context=ctx) as fhandle:
-                    return (url, MD_Metadata(etree.parse(fhandle)))
+                resp = transport.get(url)
+                resp.raise_for_status()
+                return (url, MD_Metadata(etree.fromstring(resp.content)))
             except Exception as e:
                 raise GsToGnMetadataInvalidInconsistency(url, str(e),
                                                          layer_name="%s:%s" % (resource.workspace.name, resource.name))
@@ -0,0 +1,147 @@
+import logging
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from checker import TargetLogBuffer, build_parser, load_batch_targets
+
+"""
+Tests the reading of the batch job files, and the grouping of the output of the targets
+checked concurrently.
+"""
+
+JOB = """[DEFAULT]
+check-layers = true
+
+[rennes-wms]
+mode = WMS
+server = https://public.sig.rennesmetropole.fr/geoserver/wms
+
+[rennes-wfs]
+mode = WFS
+server = https://public.sig.rennesmetropole.fr/geoserver/wfs
+check-layers = false
+only-err = yes
+workers = 4
+
+[catalogue]
+mode = CSW
+server = https://sdi.georchestra.org/geonetwork/srv/fre/csw
+inspire = strict
+geoserver-to-check = sdi.georchestra.org public.sig.rennesmetropole.fr
+state-file = catalogue.json
+"""
+
+
+def _job_file(content):
+    path = os.path.join(tempfile.mkdtemp(), "job.ini")
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def _load(content, argv=[]):
+    path = _job_file(content)
+    parser = build_parser()
+    return load_batch_targets(parser, path, ["--batch", path] + argv)
+
+
+def _rejected(content, argv=[]):
+    try:
+        with mock.patch("sys.stderr"):
+            _load(content, argv)
+        return False
+    except SystemExit:
+        return True
+
+
+def testLoadBatchTargets():
+    targets = dict(_load(JOB, ["--jsonl-output", "out.jsonl", "--workers", "2"]))
+    assert(list(targets.keys()) == ["rennes-wms", "rennes-wfs", "catalogue"])
+    wms = targets["rennes-wms"]
+    assert(wms.mode == "WMS")
+    assert(wms.server == "https://public.sig.rennesmetropole.fr/geoserver/wms")
+    assert(wms.check_layers)
+    assert(not wms.only_err)
+    assert(wms.workers == 2)
+    wfs = targets["rennes-wfs"]
+    assert(not wfs.check_layers)
+    assert(wfs.only_err)
+    assert(wfs.workers == 4)
+    csw = targets["catalogue"]
+    assert(csw.inspire == "strict")
+    assert(csw.geoserver_to_check == ["sdi.georchestra.org", "public.sig.rennesmetropole.fr"])
+
+
+def testSharedReportsSuffixed():
+    targets = dict(_load(JOB, ["--jsonl-output", "out.jsonl"]))
+    # the default xunit report and the JSON Lines one are shared by all the targets
+    assert(targets["rennes-wms"].xunit_output == "xunit-rennes-wms.xml")
+    assert(targets["rennes-wfs"].xunit_output == "xunit-rennes-wfs.xml")
+    assert(targets["catalogue"].jsonl_output == "out-catalogue.jsonl")
+    # the state file is only used by one target
+    assert(targets["catalogue"].state_file == "catalogue.json")
+    assert(targets["rennes-wms"].state_file is None)
+
+
+def testFlagsOverrideCommandLine():
+    targets = dict(_load(JOB, ["--only-err"]))
+    assert(targets["rennes-wms"].only_err)
+    targets = dict(_load("[wms]\nmode = WMS\nserver = http://a/wms\nonly-err = off\n", ["--only-err"]))
+    assert(not targets["wms"].only_err)
+
+
+def testInvalidJobFiles():
+    assert(_rejected("[wms]\nmode = WMS\nserver = http://a/wms\nunknown = 1\n"))
+    assert(_rejected("[wms]\nmode = WMS\nserver = http://a/wms\nbatch = other.ini\n"))
+    assert(_rejected("[wms]\nmode = WMS\n"))
+    assert(_rejected("[wms]\nmode = WMS\nserver = http://a/wms\ncheck-layers = maybe\n"))
+    for option in ["timeout = 10", "cache-dir = /tmp", "rate-limit = 5", "batch-concurrency = 2"]:
+        assert(_rejected("[wms]\nmode = WMS\nserver = http://a/wms\n%s\n" % option))
+        assert(_rejected("[DEFAULT]\n%s\n\n[wms]\nmode = WMS\nserver = http://a/wms\n" % option))
+    assert(not _rejected("[wms]\nmode = WMS\nserver = http://a/wms\n", ["--timeout", "10"]))
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def testTargetLogBuffer():
+    test_logger = logging.getLogger("test_batch")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.INFO)
+    handler = RecordingHandler()
+    test_logger.addHandler(handler)
+    log_buffer = TargetLogBuffer(test_logger)
+    test_logger.addFilter(log_buffer)
+    barrier = threading.Barrier(2)
+
+    def run(name):
+        log_buffer.start()
+        for i in range(3):
+            test_logger.info("%s %d", name, i)
+            barrier.wait()
+        log_buffer.flush()
+
+    try:
+        threads = [threading.Thread(target=run, args=(name,)) for name in ["a", "b"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # not held back outside of the targets
+        test_logger.info("summary")
+    finally:
+        test_logger.removeFilter(log_buffer)
+        test_logger.removeHandler(handler)
+
+    assert(len(handler.messages) == 7)
+    assert(handler.messages[-1] == "summary")
+    blocks = [handler.messages[0:3], handler.messages[3:6]]
+    assert(sorted(blocks) == [["a 0", "a 1", "a 2"], ["b 0", "b 1", "b 2"]])
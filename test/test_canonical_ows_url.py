@@ -0,0 +1,24 @@
+from utils import canonical_ows_url, canonical_url
+
+"""
+Tests the normalization of the OWS URLs used as cache keys.
+"""
+
+def testEquivalentUrlsAreCanonicalizedTheSame():
+    urls = ["https://host/geoserver/wms?SERVICE=WMS&REQUEST=GetCapabilities",
+            "https://host/geoserver/wms?service=wms",
+            "https://host/geoserver/ows?service=WMS&version=1.3.0",
+            "HTTPS://Host:443/geoserver/wms/"]
+    canonical = set(canonical_ows_url(url, "wms", "1.3.0") for url in urls)
+    assert(canonical == {"https://host/geoserver/wms"})
+
+def testSignificantParametersAreKept():
+    assert(canonical_ows_url("http://host:8080/geoserver/ows?Namespace=ws&service=WFS&version=2.0.0", "wfs", "1.1.0")
+           == "http://host:8080/geoserver/wfs?namespace=ws&version=2.0.0")
+    assert(canonical_ows_url("http://host/geoserver/wms?service=WFS", "wms", "1.3.0")
+           == "http://host/geoserver/wms?service=WFS")
+
+def testMetadataUrlsAreCanonicalized():
+    assert(canonical_url("HTTPS://Host:443/geonetwork/srv/api/records/1234/formatters/xml?approved=true&a=b#top")
+           == canonical_url("https://host/geonetwork/srv/api/records/1234/formatters/xml?a=b&approved=true"))
+    assert(canonical_url("http://host/md?uuid=ABC") != canonical_url("http://host/md?uuid=abc"))
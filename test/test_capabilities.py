@@ -0,0 +1,110 @@
+import requests
+from owslib.crs import Crs
+from owslib.wfs import WebFeatureService
+from owslib.wms import WebMapService
+
+from capabilities import CapabilitiesReader
+from owscheck import OwsServer
+
+"""
+Tests the lightweight GetCapabilities reader against the owslib object model.
+"""
+
+WMS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <Service><Name>WMS</Name><Title>SDI</Title><OnlineResource xlink:href="https://sdi.georchestra.org/geoserver/wms"/></Service>
+  <Capability>
+    <Request>
+      <GetCapabilities><Format>text/xml</Format><DCPType><HTTP><Get><OnlineResource xlink:href="https://sdi.georchestra.org/geoserver/ows?SERVICE=WMS&amp;"/></Get></HTTP></DCPType></GetCapabilities>
+      <GetMap><Format>image/png</Format><DCPType><HTTP><Get><OnlineResource xlink:href="https://sdi.georchestra.org/geoserver/ows?SERVICE=WMS&amp;"/></Get></HTTP></DCPType></GetMap>
+    </Request>
+    <Exception><Format>XML</Format></Exception>
+    <Layer>
+      <Title>root</Title>
+      <CRS>EPSG:4326</CRS>
+      <CRS>EPSG:3857</CRS>
+      <EX_GeographicBoundingBox><westBoundLongitude>-5</westBoundLongitude><eastBoundLongitude>10</eastBoundLongitude><southBoundLatitude>41</southBoundLatitude><northBoundLatitude>51</northBoundLatitude></EX_GeographicBoundingBox>
+      <Layer queryable="1">
+        <Name>ws:roads</Name><Title>Roads</Title>
+        <CRS>EPSG:2154</CRS>
+        <EX_GeographicBoundingBox><westBoundLongitude>-1.8</westBoundLongitude><eastBoundLongitude>-1.5</eastBoundLongitude><southBoundLatitude>48</southBoundLatitude><northBoundLatitude>48.2</northBoundLatitude></EX_GeographicBoundingBox>
+        <MetadataURL type="ISO19115:2003"><Format>text/xml</Format><OnlineResource xlink:type="simple" xlink:href="https://sdi.georchestra.org/geonetwork/srv/api/records/roads/formatters/xml"/></MetadataURL>
+      </Layer>
+      <Layer queryable="1">
+        <Name>ws:rivers</Name><Title>Rivers</Title>
+      </Layer>
+    </Layer>
+  </Capability>
+</WMS_Capabilities>"""
+WFS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<wfs:WFS_Capabilities version="1.1.0" xmlns:wfs="http://www.opengis.net/wfs" xmlns:ows="http://www.opengis.net/ows" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <ows:ServiceIdentification><ows:Title>SDI</ows:Title><ows:ServiceType>WFS</ows:ServiceType><ows:ServiceTypeVersion>1.1.0</ows:ServiceTypeVersion></ows:ServiceIdentification>
+  <ows:OperationsMetadata>
+    <ows:Operation name="GetFeature"><ows:DCP><ows:HTTP><ows:Get xlink:href="https://sdi.georchestra.org/geoserver/wfs"/></ows:HTTP></ows:DCP></ows:Operation>
+  </ows:OperationsMetadata>
+  <wfs:FeatureTypeList>
+    <wfs:FeatureType>
+      <wfs:Name>ws:roads</wfs:Name><wfs:Title>Roads</wfs:Title>
+      <wfs:DefaultSRS>urn:x-ogc:def:crs:EPSG:2154</wfs:DefaultSRS>
+      <wfs:OtherSRS>urn:x-ogc:def:crs:EPSG:4326</wfs:OtherSRS>
+      <ows:WGS84BoundingBox><ows:LowerCorner>-1.8 48.0</ows:LowerCorner><ows:UpperCorner>-1.5 48.2</ows:UpperCorner></ows:WGS84BoundingBox>
+      <wfs:MetadataURL type="TC211" format="text/xml">https://sdi.georchestra.org/geonetwork/srv/api/records/roads/formatters/xml</wfs:MetadataURL>
+    </wfs:FeatureType>
+  </wfs:FeatureTypeList>
+</wfs:WFS_Capabilities>"""
+
+def testReadWmsCapabilities():
+    owslib_wms = WebMapService("https://sdi.georchestra.org/geoserver/wms", version="1.3.0", xml=WMS)
+    reader = CapabilitiesReader(WMS, wms=True)
+    assert(sorted(reader.contents.keys()) == sorted(owslib_wms.contents.keys()))
+    for name in owslib_wms.contents:
+        assert(reader[name].boundingBoxWGS84 == owslib_wms[name].boundingBoxWGS84)
+        # CRS inherited from the parent layers included
+        assert(sorted(reader[name].crsOptions) == sorted(owslib_wms[name].crsOptions))
+        assert([md["url"] for md in reader[name].metadataUrls] ==
+               [md["url"] for md in owslib_wms[name].metadataUrls])
+    assert(reader.operations["GetMap"] == "https://sdi.georchestra.org/geoserver/ows?SERVICE=WMS&")
+
+
+def testReadWfsCapabilities():
+    owslib_wfs = WebFeatureService("https://sdi.georchestra.org/geoserver/wfs", version="1.1.0", xml=WFS)
+    reader = CapabilitiesReader(WFS, wms=False)
+    assert(sorted(reader.contents.keys()) == sorted(owslib_wfs.contents.keys()))
+    for name in owslib_wfs.contents:
+        assert(reader[name].boundingBoxWGS84 == owslib_wfs[name].boundingBoxWGS84)
+        assert([Crs(crs).getcode() for crs in reader[name].crsOptions] ==
+               [crs.getcode() for crs in owslib_wfs[name].crsOptions])
+        assert(reader[name].metadataUrls == owslib_wfs[name].metadataUrls)
+    assert(reader.operations["GetFeature"] == "https://sdi.georchestra.org/geoserver/wfs")
+
+
+class CapturingTransport:
+    """
+    Transport recording the requests issued, answering each one with an empty PNG.
+    """
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params=None):
+        self.requests.append((url, params))
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers["Content-Type"] = "image/png"
+        return resp
+
+
+def testLightweightGetMapProbe():
+    transport = CapturingTransport()
+    server = OwsServer("https://sdi.georchestra.org/geoserver/wms", wms=True, xml=WMS, lightweight=True,
+                       transport=transport)
+    server.probeLayer("ws:roads")
+    (url, params) = transport.requests[0]
+    assert(url == "https://sdi.georchestra.org/geoserver/ows?SERVICE=WMS")
+    assert(params["request"] == "GetMap")
+    assert(params["version"] == "1.3.0")
+    assert(params["layers"] == "ws:roads")
+    assert(params["crs"] == "EPSG:4326")
+    # latitude first for EPSG:4326 in WMS 1.3.0
+    (miny, minx, maxy, maxx) = [float(x) for x in params["bbox"].split(",")]
+    assert(48 < miny < maxy < 48.2)
+    assert(-1.8 < minx < maxx < -1.5)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from checkstate import CheckState
+from inconsistency import GnToGsInvalidCapabilitiesUrl, GnToGsLayerNotFoundInconsistency
+from owscheck import CachedOwsServices
+
+"""
+Tests the carry-over of the outcome of the checks from one run to another, and the
+loading of the services whose fingerprint the state depends on.
+"""
+
+URL = "http://sdi.example.org/geoserver/wms"
+
+
+class CountingTransport:
+    """
+    Transport serving an HTML page instead of a GetCapabilities document.
+    """
+    def __init__(self):
+        self.downloads = 0
+
+    def iter_content(self, url):
+        self.downloads += 1
+        yield b"<html><body>Not a capabilities document</body></html>"
+
+
+def _check_after_fingerprint(failure_ttl):
+    transport = CountingTransport()
+    services = CachedOwsServices(transport=transport, failure_ttl=failure_ttl)
+    assert(services.getServiceFingerprint(URL, True) is None)
+    try:
+        services.checkWmsLayer(URL, "ws:layer")
+        assert(False)
+    except GnToGsInvalidCapabilitiesUrl as e:
+        assert(e.layer_name == "ws:layer")
+        assert("ws:layer" in str(e))
+    return transport
+
+
+def testFingerprintFailureRaisedForTheLayer():
+    transport = _check_after_fingerprint(failure_ttl=300)
+    assert(transport.downloads == 1)
+
+
+def testFingerprintFailureKeptWithoutFailureCache():
+    transport = _check_after_fingerprint(failure_ttl=0)
+    assert(transport.downloads == 1)
+
+
+def testCarriedOver():
+    path = os.path.join(tempfile.mkdtemp(), "state.json")
+    dependencies = {"services": {URL: "abc"}}
+    state = CheckState(path)
+    error = GnToGsLayerNotFoundInconsistency(layer_name="ws:layer", layer_url=URL, msg="Layer not found on GS")
+    state.set_outcome("uuid-1", "2026-01-01", dependencies, [error])
+    state.set_outcome("uuid-2", "2026-01-01", dependencies, [])
+    state.save()
+
+    state = CheckState(path)
+    errors = state.get_outcome("uuid-1", "2026-01-01", {"services": {URL: "abc"}})
+    assert(len(errors) == 1)
+    assert(errors[0].type_name == "GnToGsLayerNotFoundInconsistency")
+    assert(str(error) in str(errors[0]))
+    assert(state.get_outcome("uuid-2", "2026-01-01", dependencies) == [])
+    assert(state.carried_over == 2)
+
+
+def testCheckedAgainOnChange():
+    path = os.path.join(tempfile.mkdtemp(), "state.json")
+    dependencies = {"services": {URL: "abc"}}
+    state = CheckState(path)
+    state.set_outcome("uuid-1", "2026-01-01", dependencies, [])
+    state.save()
+
+    state = CheckState(path)
+    assert(state.get_outcome("uuid-1", "2026-02-01", dependencies) is None)
+    assert(state.get_outcome("uuid-1", "2026-01-01", {"services": {URL: "def"}}) is None)
+    assert(state.get_outcome("uuid-1", None, dependencies) is None)
+    assert(state.get_outcome("uuid-2", "2026-01-01", dependencies) is None)
+    assert(state.carried_over == 0)
@@ -0,0 +1,31 @@
+from circuitbreaker import CircuitBreaker, HostUnavailableError
+
+"""
+Tests the per-host circuit breaker.
+"""
+
+def _is_rejected(breaker, url):
+    try:
+        breaker.before_request(url)
+        return False
+    except HostUnavailableError:
+        return True
+
+def testCircuitOpensAndIsProbedAfterCooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+    url = "http://down.example.org/wms"
+    breaker.record_failure(url)
+    assert(not breaker.is_open("down.example.org"))
+    breaker.record_failure(url)
+    assert(breaker.is_open("down.example.org"))
+    assert(not _is_rejected(breaker, "http://up.example.org/wms"))
+    # cooldown over: a single probe is let through
+    assert(not _is_rejected(breaker, url))
+    assert(_is_rejected(breaker, url))
+    # the probe fails, the circuit opens again
+    breaker.record_failure(url)
+    assert(breaker.trips("down.example.org") == 2)
+    assert(not _is_rejected(breaker, url))
+    breaker.record_success(url)
+    assert(not breaker.is_open("down.example.org"))
+    assert(not _is_rejected(breaker, url))
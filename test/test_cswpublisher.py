@@ -0,0 +1,156 @@
+from collections import namedtuple
+
+import requests
+from owslib.etree import etree
+
+from cswpublisher import CSWPublisher
+from inconsistency import GsToGnUnableToCreateServiceMetadataInconsistency, \
+    GsToGnUnableToUpdateServiceMetadataInconsistency
+
+"""
+Tests the batching of the CSW-T Transaction requests, and the handling of the rejected
+or partly applied batches.
+"""
+
+GN_URL = "http://sdi.example.org/geonetwork"
+NS = {"csw": "http://www.opengis.net/cat/csw/2.0.2", "gmd": "http://www.isotc211.org/2005/gmd",
+      "gco": "http://www.isotc211.org/2005/gco"}
+
+Auth = namedtuple("Auth", ["username", "password"])
+
+
+def _record(uuid, title="service"):
+    return """<gmd:MD_Metadata xmlns:gmd="http://www.isotc211.org/2005/gmd" xmlns:gco="http://www.isotc211.org/2005/gco">
+      <gmd:fileIdentifier><gco:CharacterString>%s</gco:CharacterString></gmd:fileIdentifier>
+      <gmd:title><gco:CharacterString>%s</gco:CharacterString></gmd:title>
+    </gmd:MD_Metadata>""" % (uuid, title)
+
+
+def _summary(inserted, updated, identifiers=[]):
+    results = "".join("<csw:InsertResult><csw:BriefRecord><dc:identifier>%s</dc:identifier></csw:BriefRecord>"
+                      "</csw:InsertResult>" % i for i in identifiers)
+    return ("""<csw:TransactionResponse xmlns:csw="http://www.opengis.net/cat/csw/2.0.2"
+      xmlns:dc="http://purl.org/dc/elements/1.1/">
+      <csw:TransactionSummary><csw:totalInserted>%d</csw:totalInserted><csw:totalUpdated>%d</csw:totalUpdated>
+      </csw:TransactionSummary>%s</csw:TransactionResponse>""" % (inserted, updated, results)).encode("utf-8")
+
+
+class FakeCatalogue:
+    """
+    Transport standing for the CSW-T endpoint of GeoNetwork: each Transaction request is
+    recorded, and answered by the given function, called with the identifiers of the
+    inserted and of the updated records.
+    """
+    def __init__(self, answer):
+        self.answer = answer
+        self.transactions = []
+
+    def authentication(self, url):
+        return Auth(None, None)
+
+    def post(self, url, data=None, auth=None, headers=None):
+        root = etree.fromstring(data)
+        inserts = root.xpath("csw:Insert/gmd:MD_Metadata/gmd:fileIdentifier/gco:CharacterString/text()",
+                             namespaces=NS)
+        updates = root.xpath("csw:Update/gmd:MD_Metadata/gmd:fileIdentifier/gco:CharacterString/text()",
+                             namespaces=NS)
+        titles = root.xpath("//gmd:title/gco:CharacterString/text()", namespaces=NS)
+        self.transactions.append((inserts, updates, titles))
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = self.answer(inserts, updates)
+        return resp
+
+
+def testFullyApplied():
+    catalogue = FakeCatalogue(lambda inserts, updates: _summary(len(inserts), len(updates), inserts))
+    publisher = CSWPublisher(GN_URL, "ws", transport=catalogue, batch_size=10)
+    publisher.insert("a", _record("a"))
+    publisher.insert("b", _record("b"))
+    publisher.update("c", _record("c"))
+    assert(publisher.flush() == [])
+    assert(catalogue.transactions == [(["a", "b"], ["c"], ["service"] * 3)])
+    assert(publisher.published == 3)
+    assert(publisher.transactions == 1)
+
+
+def testBatchSize():
+    catalogue = FakeCatalogue(lambda inserts, updates: _summary(len(inserts), len(updates), inserts))
+    publisher = CSWPublisher(GN_URL, "ws", transport=catalogue, batch_size=2)
+    for uuid in ["a", "b", "c"]:
+        publisher.insert(uuid, _record(uuid))
+    assert(len(catalogue.transactions) == 1)
+    publisher.flush()
+    assert([t[0] for t in catalogue.transactions] == [["a", "b"], ["c"]])
+    assert(publisher.published == 3)
+
+
+def testRejectedBatchSentOneByOne():
+    def answer(inserts, updates):
+        if "bad" in inserts + updates:
+            return b"""<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows">
+              <ows:Exception><ows:ExceptionText>invalid record</ows:ExceptionText></ows:Exception>
+            </ows:ExceptionReport>"""
+        return _summary(len(inserts), len(updates), inserts)
+
+    catalogue = FakeCatalogue(answer)
+    publisher = CSWPublisher(GN_URL, "ws", transport=catalogue, batch_size=10)
+    publisher.insert("a", _record("a"))
+    publisher.update("bad", _record("bad"))
+    publisher.update("c", _record("c"))
+    errors = publisher.flush()
+    assert([(t[0], t[1]) for t in catalogue.transactions] ==
+           [(["a"], ["bad", "c"]), (["a"], []), ([], ["bad"]), ([], ["c"])])
+    assert(len(errors) == 1)
+    assert(isinstance(errors[0], GsToGnUnableToUpdateServiceMetadataInconsistency))
+    assert("bad" in str(errors[0]))
+    assert(publisher.published == 2)
+
+
+def testPartlyAppliedWithIdentifiers():
+    def answer(inserts, updates):
+        if len(inserts) + len(updates) > 1:
+            # "b" not inserted, and one of the updates not applied
+            return _summary(1, len(updates) - 1, ["a"])
+        return _summary(len(inserts), len(updates), inserts)
+
+    catalogue = FakeCatalogue(answer)
+    publisher = CSWPublisher(GN_URL, "ws", transport=catalogue, batch_size=10)
+    publisher.insert("a", _record("a"))
+    publisher.insert("b", _record("b"))
+    publisher.update("c", _record("c"))
+    publisher.update("d", _record("d"))
+    assert(publisher.flush() == [])
+    assert([(t[0], t[1]) for t in catalogue.transactions] ==
+           [(["a", "b"], ["c", "d"]), (["b"], []), ([], ["c"]), ([], ["d"])])
+    assert(publisher.published == 4)
+
+
+def testPartlyAppliedWithoutIdentifiers():
+    def answer(inserts, updates):
+        return _summary(max(0, len(inserts) - 1), len(updates))
+
+    catalogue = FakeCatalogue(answer)
+    publisher = CSWPublisher(GN_URL, "ws", transport=catalogue, batch_size=10)
+    publisher.insert("a", _record("a"))
+    publisher.insert("b", _record("b"))
+    publisher.update("c", _record("c"))
+    errors = publisher.flush()
+    # the inserted record is unknown, none of them is sent again
+    assert([(t[0], t[1]) for t in catalogue.transactions] == [(["a", "b"], ["c"])])
+    assert(len(errors) == 2)
+    assert(all(isinstance(e, GsToGnUnableToCreateServiceMetadataInconsistency) for e in errors))
+    assert(publisher.published == 1)
+
+
+def testRepeatedUpdatesCollapsed():
+    catalogue = FakeCatalogue(lambda inserts, updates: _summary(len(inserts), len(updates), inserts))
+    publisher = CSWPublisher(GN_URL, "ws", transport=catalogue, batch_size=10)
+    publisher.insert("a", _record("a", "first"))
+    publisher.update("a", _record("a", "second"))
+    publisher.update("b", _record("b", "first"))
+    publisher.update("b", _record("b", "second"))
+    publisher.update("b", _record("b", "third"))
+    assert(publisher.flush() == [])
+    assert(catalogue.transactions == [(["a"], ["b"], ["second", "third"])])
+    assert(publisher.published == 2)
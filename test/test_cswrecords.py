@@ -0,0 +1,91 @@
+from owslib.etree import etree
+
+from cswrecords import parse_getrecords_response, parse_transaction_response, transaction_request
+
+"""
+Tests the parsing of the GetRecords responses into slim records.
+"""
+
+ISO_RESPONSE = b"""<?xml version="1.0"?>
+<csw:GetRecordsResponse xmlns:csw="http://www.opengis.net/cat/csw/2.0.2">
+  <csw:SearchResults numberOfRecordsMatched="12" numberOfRecordsReturned="1" nextRecord="2">
+    <gmd:MD_Metadata xmlns:gmd="http://www.isotc211.org/2005/gmd" xmlns:gco="http://www.isotc211.org/2005/gco"
+                     xmlns:srv="http://www.isotc211.org/2005/srv">
+      <gmd:fileIdentifier><gco:CharacterString>service-uuid</gco:CharacterString></gmd:fileIdentifier>
+      <gmd:dateStamp><gco:DateTime>2024-01-02T03:04:05</gco:DateTime></gmd:dateStamp>
+      <gmd:identificationInfo>
+        <srv:SV_ServiceIdentification>
+          <gmd:citation><gmd:CI_Citation><gmd:title><gco:CharacterString>A WMS</gco:CharacterString></gmd:title></gmd:CI_Citation></gmd:citation>
+          <srv:coupledResource>
+            <srv:SV_CoupledResource>
+              <srv:operationName><gco:CharacterString>GetMap</gco:CharacterString></srv:operationName>
+              <srv:identifier><gco:CharacterString>data-uuid</gco:CharacterString></srv:identifier>
+              <gco:ScopedName>ws:roads</gco:ScopedName>
+            </srv:SV_CoupledResource>
+          </srv:coupledResource>
+          <srv:containsOperations>
+            <srv:SV_OperationMetadata>
+              <srv:operationName><gco:CharacterString>GetCapabilities</gco:CharacterString></srv:operationName>
+              <srv:connectPoint>
+                <gmd:CI_OnlineResource>
+                  <gmd:linkage><gmd:URL>https://sdi.georchestra.org/geoserver/wms</gmd:URL></gmd:linkage>
+                  <gmd:protocol><gco:CharacterString>OGC:WMS-1.3.0-http-get-capabilities</gco:CharacterString></gmd:protocol>
+                </gmd:CI_OnlineResource>
+              </srv:connectPoint>
+            </srv:SV_OperationMetadata>
+          </srv:containsOperations>
+          <srv:operatesOn uuidref="data-uuid"/>
+        </srv:SV_ServiceIdentification>
+      </gmd:identificationInfo>
+      <gmd:distributionInfo>
+        <gmd:MD_Distribution>
+          <gmd:transferOptions>
+            <gmd:MD_DigitalTransferOptions>
+              <gmd:onLine>
+                <gmd:CI_OnlineResource>
+                  <gmd:linkage><gmd:URL>https://sdi.georchestra.org/geoserver/ws/ows?service=wms</gmd:URL></gmd:linkage>
+                  <gmd:protocol><gco:CharacterString>OGC:WMS</gco:CharacterString></gmd:protocol>
+                </gmd:CI_OnlineResource>
+              </gmd:onLine>
+            </gmd:MD_DigitalTransferOptions>
+          </gmd:transferOptions>
+        </gmd:MD_Distribution>
+      </gmd:distributionInfo>
+    </gmd:MD_Metadata>
+  </csw:SearchResults>
+</csw:GetRecordsResponse>"""
+
+def testParseIsoServiceRecord():
+    # fed in small chunks, as received from the network
+    page = parse_getrecords_response(ISO_RESPONSE[i:i + 100] for i in range(0, len(ISO_RESPONSE), 100))
+    assert(page.results == {"matches": 12, "returned": 1, "nextrecord": 2})
+    md = page.records["service-uuid"]
+    assert(md.title == "A WMS")
+    assert(md.datestamp == "2024-01-02T03:04:05")
+    assert(md.operateson == ["data-uuid"])
+    assert(md.operations == [{"name": "GetCapabilities", "url": "https://sdi.georchestra.org/geoserver/wms",
+                              "protocol": "OGC:WMS-1.3.0-http-get-capabilities"}])
+    assert(md.uris == [{"protocol": "OGC:WMS", "name": None, "description": None,
+                        "url": "https://sdi.georchestra.org/geoserver/ws/ows?service=wms"}])
+    assert(md.coupledresources == [{"operation": "GetMap", "identifier": "data-uuid", "layer": "ws:roads"}])
+
+
+def testTransactionRequest():
+    record = '<gmd:MD_Metadata xmlns:gmd="http://www.isotc211.org/2005/gmd"/>'
+    request = etree.fromstring(transaction_request(inserts=[record, record], updates=[record]))
+    ns = {"csw": "http://www.opengis.net/cat/csw/2.0.2"}
+    assert(len(request.findall("csw:Insert", ns)) == 1)
+    assert(len(request.findall("csw:Insert/*", ns)) == 2)
+    assert(len(request.findall("csw:Update/*", ns)) == 1)
+
+
+def testParseTransactionResponse():
+    summary = parse_transaction_response(b"""<csw:TransactionResponse xmlns:csw="http://www.opengis.net/cat/csw/2.0.2"
+        xmlns:dc="http://purl.org/dc/elements/1.1/">
+      <csw:TransactionSummary><csw:totalInserted>1</csw:totalInserted><csw:totalUpdated>2</csw:totalUpdated>
+      </csw:TransactionSummary>
+      <csw:InsertResult><csw:BriefRecord><dc:identifier>new-uuid</dc:identifier></csw:BriefRecord></csw:InsertResult>
+    </csw:TransactionResponse>""")
+    assert(summary.inserted == 1)
+    assert(summary.updated == 2)
+    assert(summary.identifiers == ["new-uuid"])
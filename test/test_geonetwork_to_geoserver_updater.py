@@ -11,3 +11,29 @@ def testExtractAttribution():
         mdxml = etree.fromstring(f.read())
     md = MD_Metadata(md=mdxml)
     assert(GeonetworkToGeoserverUpdater.extract_attribution(md) == "source : Comités de secteur - Rennes Métropole")
+
+
+class FakeCatalog:
+    def __init__(self):
+        self.saved = []
+
+    def save(self, obj):
+        self.saved.append(obj)
+
+
+class FakeObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def testUpdateResourceSavesOnlyModifiedObjects():
+    catalog = FakeCatalog()
+    resource = FakeObject(catalog=catalog, title="t", abstract="a", workspace=FakeObject(name="ws"), name="roads",
+                          metadata_links=[("text/html", "ISO19115:2003", "http://md.html")])
+    layer = FakeObject(attribution={"title": "attr"})
+    assert(GeonetworkToGeoserverUpdater.update_resource(layer, resource, "t", "a", "http://md.html", "attr",
+                                                        False) == 0)
+    assert(catalog.saved == [])
+    assert(GeonetworkToGeoserverUpdater.update_resource(layer, resource, "t2", "a", "http://md.html", "attr",
+                                                        False) == 1)
+    assert(catalog.saved == [resource])
@@ -0,0 +1,88 @@
+import threading
+
+import requests
+
+from circuitbreaker import HostUnavailableError
+from geometadata import MetadataCache
+from inconsistency import GsToGnMetadataInvalidInconsistency, HostUnavailableInconsistency
+from owscheck import OwsChecker
+
+"""
+Tests that a metadata referenced by several layers is only fetched once, each layer still
+getting its own inconsistency.
+"""
+
+SHARED_MD = "http://sdi.example.org/geonetwork/srv/api/records/shared/formatters/xml"
+DOWN_MD = "http://down.example.org/geonetwork/srv/api/records/down/formatters/xml"
+
+
+def _layer(name, md_url):
+    return """<Layer queryable="1"><Name>%s</Name><Title>%s</Title>
+      <EX_GeographicBoundingBox><westBoundLongitude>-1.8</westBoundLongitude><eastBoundLongitude>-1.5</eastBoundLongitude><southBoundLatitude>48</southBoundLatitude><northBoundLatitude>48.2</northBoundLatitude></EX_GeographicBoundingBox>
+      <MetadataURL type="ISO19115:2003"><Format>text/xml</Format><OnlineResource xmlns:xlink="http://www.w3.org/1999/xlink" xlink:type="simple" xlink:href="%s"/></MetadataURL>
+    </Layer>""" % (name, name, md_url)
+
+
+LAYERS = ["ws:a", "ws:b", "ws:c", "ws:d", "ws:e"]
+WMS = ("""<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <Service><Name>WMS</Name><Title>SDI</Title><OnlineResource xlink:href="http://sdi.example.org/geoserver/wms"/></Service>
+  <Capability>
+    <Request>
+      <GetMap><Format>image/png</Format><DCPType><HTTP><Get><OnlineResource xlink:href="http://sdi.example.org/geoserver/wms?"/></Get></HTTP></DCPType></GetMap>
+    </Request>
+    <Layer><Title>root</Title>%s</Layer>
+  </Capability>
+</WMS_Capabilities>""" % "".join(_layer(name, DOWN_MD if name == "ws:e" else SHARED_MD) for name in LAYERS)) \
+    .encode("utf-8")
+
+
+class CountingTransport:
+    """
+    Transport serving the GetCapabilities document, answering 404 for the shared metadata,
+    and whose circuit is open for the host of the other one.
+    """
+    def __init__(self):
+        self.fetches = {}
+        self._lock = threading.Lock()
+
+    def get_content(self, url, raise_for_status=False):
+        return WMS
+
+    def get(self, url):
+        with self._lock:
+            self.fetches[url] = self.fetches.get(url, 0) + 1
+        if url == DOWN_MD:
+            raise HostUnavailableError(url, "down.example.org", 60)
+        resp = requests.Response()
+        resp.status_code = 404
+        resp.url = url
+        return resp
+
+
+def testSharedMetadataFetchedOnce():
+    transport = CountingTransport()
+    cache = MetadataCache()
+    checker = OwsChecker("http://sdi.example.org/geoserver/wms", transport=transport, workers=4, lightweight=True,
+                         metadata_cache=cache)
+    errors = checker.get_inconsistencies()
+    assert(transport.fetches[SHARED_MD] == 1)
+    assert(cache.fetches_saved == 3)
+    assert(len(errors) == 5)
+    assert(len(set(id(e) for e in errors)) == 5)
+    for (idx, (name, error)) in enumerate(zip(LAYERS[:4], errors[:4])):
+        assert(isinstance(error, GsToGnMetadataInvalidInconsistency))
+        assert(error.layer_name == name)
+        assert(error.layer_index == idx)
+        assert("'%s'" % name in str(error))
+        assert("404" in str(error))
+    assert(isinstance(errors[4], HostUnavailableInconsistency))
+    assert(errors[4].layer_name == "ws:e")
+    assert(errors[4].layer_index == 4)
+
+    # the outcome of the unavailable metadata is not kept, it is fetched again by the next checker
+    errors = OwsChecker("http://sdi.example.org/geoserver/wms", transport=transport, lightweight=True,
+                        metadata_cache=cache).get_inconsistencies()
+    assert(transport.fetches[SHARED_MD] == 1)
+    assert(transport.fetches[DOWN_MD] == 2)
+    assert([e.layer_name for e in errors] == LAYERS)
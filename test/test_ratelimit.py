@@ -0,0 +1,84 @@
+import argparse
+import datetime
+from unittest import mock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ratelimit import RateLimitedAdapter, RateLimiter, add_rate_limit_arguments, rate_limiter_from_args
+
+"""
+Tests the adaptive per-host rate limiter.
+"""
+
+URL = "http://busy.example.org/wms"
+HOST = "busy.example.org"
+
+
+def _response(status_code, latency, retry_after=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.elapsed = datetime.timedelta(seconds=latency)
+    if retry_after is not None:
+        resp.headers["Retry-After"] = retry_after
+    return resp
+
+
+def _send(adapter, resp):
+    with mock.patch.object(HTTPAdapter, "send", return_value=resp):
+        return adapter.send(requests.Request("GET", URL).prepare())
+
+
+def testBacksOffOnTooManyRequestsAndRecovers():
+    limiter = RateLimiter(default_rate=100)
+    adapter = RateLimitedAdapter(limiter)
+    _send(adapter, _response(429, 0.1))
+    assert(limiter.rate(HOST) == 50)
+    assert(limiter.backoffs(HOST) == 1)
+    # the responses to the requests already in flight do not lower the rate again
+    _send(adapter, _response(429, 0.1))
+    assert(limiter.rate(HOST) == 50)
+    for _ in range(10):
+        _send(adapter, _response(200, 0.1))
+    assert(limiter.rate(HOST) == 100)
+
+
+def testBacksOffOnSlowResponses():
+    limiter = RateLimiter(default_rate=100, latency_factor=3.0, min_latency=1.0)
+    adapter = RateLimitedAdapter(limiter)
+    for _ in range(5):
+        _send(adapter, _response(200, 0.5))
+    assert(limiter.backoffs(HOST) == 0)
+    for _ in range(10):
+        _send(adapter, _response(200, 5))
+    assert(limiter.backoffs(HOST) == 1)
+    assert(limiter.rate(HOST) < 100)
+
+
+def testPausesOnRetryAfter():
+    limiter = RateLimiter(default_rate=100)
+    adapter = RateLimitedAdapter(limiter)
+    _send(adapter, _response(503, 0.1, retry_after="0.2"))
+    assert(limiter.rate(HOST) == 50)
+    with mock.patch("time.sleep") as sleep:
+        limiter.acquire(URL)
+    assert(sleep.called)
+
+
+def _limiter(argv):
+    parser = argparse.ArgumentParser()
+    add_rate_limit_arguments(parser)
+    return rate_limiter_from_args(parser.parse_args(argv), parser)
+
+
+def testHostRateLimitArguments():
+    assert(_limiter(["--rate-limit", "0"]) is None)
+    assert(_limiter(["--host-rate-limit", "busy.example.org:8080=2.5"]) is not None)
+    for invalid in ["busy.example.org=0", "busy.example.org=-1", "busy.example.org=nan", "busy.example.org",
+                    "busy.example.org=fast", "=2"]:
+        try:
+            with mock.patch("sys.stderr"):
+                _limiter(["--host-rate-limit", invalid])
+            assert(False)
+        except SystemExit:
+            pass
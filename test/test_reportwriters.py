@@ -0,0 +1,33 @@
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+
+from inconsistency import GnToGsNoOGCWmsDefined, GnToGsNoOGCWfsDefined
+from reportwriters import XunitReportWriter
+from resultstore import ResultStore
+
+"""
+Tests the report writers.
+"""
+
+def testXunitHeaderIsPatchedOnClose():
+    (fd, path) = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    try:
+        writer = XunitReportWriter(path, "CSW")
+        results = ResultStore("CSW", writers=[writer])
+        for i in range(250):
+            errors = [GnToGsNoOGCWmsDefined("uuid-%d" % i), GnToGsNoOGCWfsDefined("uuid-%d" % i)] \
+                if i % 10 == 0 else []
+            results.add("uuid-%d" % i, "Record %d" % i, errors, 0.5)
+        writer.close()
+        suite = ET.parse(path).getroot()
+        assert(suite.get("tests") == "250")
+        assert(suite.get("errors") == "25")
+        testcases = suite.findall("testcase")
+        assert(len(testcases) == 250)
+        # a single error per testcase, the first one met
+        assert(len(suite.findall("testcase/error")) == 25)
+        assert(testcases[0].find("error").get("type") == "GnToGsNoOGCWmsDefined")
+    finally:
+        os.remove(path)
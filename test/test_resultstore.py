@@ -0,0 +1,17 @@
+from resultstore import ResultStore
+
+"""
+Tests the result store the reports are generated from.
+"""
+
+def testItemsAreReportedOnce():
+    results = ResultStore("CSW")
+    results.add("uuid-1", "first", ["error 1"])
+    results.add("uuid-2", "second")
+    results.add("uuid-1", "first again", ["error 2"])
+    assert(len(results) == 2)
+    assert(results.count_in_error() == 1)
+    assert(results.errors() == ["error 1", "error 2"])
+    assert(results.get("uuid-1").name == "first")
+    assert([r.key for r in results] == ["uuid-1", "uuid-2"])
+    assert(results.get("uuid-2").error is None)